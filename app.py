@@ -14,6 +14,7 @@ import ttkbootstrap as bs
 from ttkbootstrap.constants import *
 from ttkbootstrap.widgets import ScrolledFrame
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import json # Módulo para lidar com o arquivo de salvamento offline (JSON)
 import os 
@@ -23,9 +24,310 @@ from packaging.version import parse as parse_version
 import subprocess
 import sys
 import re
+import threading
+import queue
+import time
 
 # Importa todas as funções de lógica do nosso outro arquivo
 import backend as be
+import duplicatas
+import envio_email
+import exportacao
+import perfil
+
+# --- CONFIGURAÇÃO DA VERIFICAÇÃO DE ATUALIZAÇÕES ---
+VERSION_URL = "https://raw.githubusercontent.com/Inteligencia-Matriz/BolsaoDesktop/main/version.json"
+UPDATE_STATE_FILE = "update_check.json"
+UPDATE_CHECK_INTERVAL_HOURS = 6   # Intervalo mínimo entre consultas ao servidor
+UPDATE_CHECK_DELAY_MS = 3000      # Espera após abrir a janela antes de verificar
+
+def load_update_state():
+    """Carrega do disco o estado da última verificação (horário, ETag e resposta)."""
+    try:
+        with open(UPDATE_STATE_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_update_state(state):
+    """Grava o estado da verificação de atualização no disco."""
+    try:
+        with open(UPDATE_STATE_FILE, "w") as f:
+            json.dump(state, f, indent=4)
+    except OSError as e:
+        print(f"Aviso: não foi possível salvar o estado da atualização: {e}")
+
+def fetch_version_info(force=False):
+    """
+    Consulta o version.json respeitando o intervalo configurado e usando
+    ETag/If-None-Match, para que respostas sem alteração voltem como 304.
+    Retorna o último conteúdo conhecido do version.json (ou None).
+    Não usa nada do Tk: pode ser chamada fora da thread principal.
+    """
+    state = load_update_state()
+    cached_data = state.get("data")
+    elapsed = time.time() - state.get("last_check", 0)
+    if not force and cached_data and elapsed < UPDATE_CHECK_INTERVAL_HOURS * 3600:
+        return cached_data
+
+    headers = {}
+    if state.get("etag") and cached_data:
+        headers["If-None-Match"] = state["etag"]
+
+    response = requests.get(VERSION_URL, headers=headers, timeout=10)
+    if response.status_code == 304:
+        data = cached_data
+    else:
+        response.raise_for_status()
+        data = response.json()
+        state["etag"] = response.headers.get("ETag")
+        state["data"] = data
+
+    state["last_check"] = time.time()
+    save_update_state(state)
+    return data
+
+CATALOGO_CHECK_MS = 30000         # Intervalo entre verificações do catalogo.json
+
+# --- MODELO REATIVO DOS FORMULÁRIOS ---
+FORM_DEBOUNCE_MS = 150
+
+class ReactiveForm:
+    """
+    Modelo reativo de um formulário. As entradas são variáveis Tk; os valores
+    derivados são declarados uma vez (nome, dependências, função), ficam
+    memorizados pelos valores das dependências e são recalculados num único
+    passe FORM_DEBOUNCE_MS depois da última alteração. Assim, uma rajada de
+    teclas ou cliques no spinbox gera um recálculo, não uma cascata de traces.
+    Erros de cálculo viram o próprio valor derivado (uma Exception), para a
+    função de exibição decidir como mostrá-los.
+    """
+
+    def __init__(self, widget, delay_ms=FORM_DEBOUNCE_MS):
+        self.widget = widget
+        self.delay_ms = delay_ms
+        self.inputs = {}
+        self.derived = []   # em ordem de declaração: cada um só depende dos anteriores
+        self.effects = []
+        self.values = {}
+        self._memo = {}
+        self._after_id = None
+        self._flushed_once = False
+
+    def input(self, name, var):
+        """Registra uma variável Tk como entrada do modelo."""
+        self.inputs[name] = var
+        var.trace_add("write", self.schedule)
+        return var
+
+    def derive(self, name, deps, func):
+        """Declara um valor derivado: func(*valores das dependências)."""
+        self.derived.append((name, tuple(deps), func))
+
+    def effect(self, deps, func):
+        """Declara uma atualização da interface, chamada quando alguma dependência muda."""
+        self.effects.append((tuple(deps), func))
+
+    def schedule(self, *args):
+        """Agenda o recálculo, reiniciando a espera a cada nova alteração."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._after_id = self.widget.after(self.delay_ms, self.flush)
+
+    def flush(self):
+        """Recalcula agora o que mudou (também usado antes de ações como gerar a carta)."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        values = {}
+        for name, var in self.inputs.items():
+            try:
+                values[name] = var.get()
+            except tk.TclError:
+                values[name] = None  # campo numérico vazio ou em digitação
+        changed = {n for n, v in values.items() if n not in self.values or self.values[n] != v}
+        for name, deps, func in self.derived:
+            args = tuple(values[d] for d in deps)
+            memo = self._memo.get(name)
+            if memo is not None and memo[0] == args:
+                values[name] = memo[1]
+                continue
+            try:
+                result = func(*args)
+            except Exception as e:
+                result = e
+            values[name] = result
+            self._memo[name] = (args, result)
+            changed.add(name)
+        self.values = values
+        for deps, func in self.effects:
+            if not self._flushed_once or changed.intersection(deps):
+                func(*(values[d] for d in deps))
+        self._flushed_once = True
+        return values
+
+    def invalidate(self):
+        """Descarta os valores memorizados (ex: o catálogo de preços mudou) e recalcula tudo."""
+        self._memo.clear()
+        self._flushed_once = False
+        return self.flush()
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+# --- GRADE VIRTUALIZADA (FORMULÁRIO) ---
+PERIODO_INTERVALO = "Intervalo (De/Até)"
+CAMPANHA_ATUAL = "Atual"
+TODAS_UNIDADES = "Atual (todas as unidades)"
+UNIDADE_CURTA = {completa: curta for curta, completa in be.UNIDADES_MAP.items()}
+
+def _fmt_texto(v):
+    return "" if v is None else str(v)
+
+def _fmt_moeda(v):
+    return "" if v is None or v != v else be.format_currency(v)
+
+def _fmt_data_hora(v):
+    return v.strftime("%d/%m/%Y %H:%M") if v else ""
+
+class VirtualGrid(ttk.Frame):
+    """
+    Grade baseada em Treeview que só cria itens para as linhas visíveis: a
+    rolagem troca os valores desses poucos itens em vez de inserir milhares
+    de linhas. As linhas são índices do snapshot, e a ordenação usa os ranks
+    pré-calculados do snapshot (ResultadosSnapshot.sort_indices).
+    """
+
+    def __init__(self, master, columns, on_select, height=12):
+        super().__init__(master)
+        self.columns = columns  # [(coluna do snapshot, título, largura, formatador)]
+        self.on_select = on_select
+        self.height = height
+        self.snapshot = None
+        self.indices = np.empty(0, dtype=np.int64)
+        self.offset = 0
+        self.sort_col = None
+        self.sort_desc = False
+        self.selected_index = None
+        self.count_var = tk.StringVar(value="0 registro(s)")
+
+        ids = [f"c{i}" for i in range(len(columns))]
+        self.tree = ttk.Treeview(self, columns=ids, show="headings", height=height, selectmode="browse")
+        for cid, (col, titulo, largura, _) in zip(ids, columns):
+            self.tree.heading(cid, text=titulo, command=lambda c=col: self.sort_by(c))
+            self.tree.column(cid, width=largura, minwidth=40, stretch=True)
+        self.slots = [self.tree.insert("", "end", iid=f"slot{j}") for j in range(height)]
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        ttk.Label(self, textvariable=self.count_var).grid(row=1, column=0, sticky="w", pady=(3, 0))
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(seq, self._on_wheel)
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self.height))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self.height))
+
+    def set_rows(self, snapshot, indices, keep_offset=False):
+        """Troca as linhas exibidas (índices do snapshot), mantendo a ordenação escolhida."""
+        self.snapshot = snapshot
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.sort_col is not None:
+            indices = snapshot.sort_indices(indices, self.sort_col, self.sort_desc)
+        self.indices = indices
+        if not keep_offset:
+            self.offset = 0
+        self.count_var.set(f"{len(indices)} registro(s)")
+        self.scroll_to(self.offset, force=True)
+
+    def sort_by(self, col):
+        """Ordena pela coluna clicada; um segundo clique inverte a ordem."""
+        if self.snapshot is None:
+            return
+        self.sort_desc = not self.sort_desc if self.sort_col == col else False
+        self.sort_col = col
+        for cid, (c, titulo, _, _) in zip(self.tree["columns"], self.columns):
+            seta = (" ▼" if self.sort_desc else " ▲") if c == col else ""
+            self.tree.heading(cid, text=titulo + seta)
+        self.set_rows(self.snapshot, self.indices)
+
+    def clear_selection(self):
+        self.selected_index = None
+        self.tree.selection_remove(self.tree.selection())
+
+    def scroll_to(self, offset, force=False):
+        offset = max(0, min(int(offset), len(self.indices) - self.height))
+        if offset != self.offset or force:
+            self.offset = offset
+            self.render()
+
+    def render(self):
+        """Preenche os itens visíveis com as linhas a partir de `offset`."""
+        n = len(self.indices)
+        selected_slot = None
+        for j, slot in enumerate(self.slots):
+            pos = self.offset + j
+            if pos >= n:
+                self.tree.detach(slot)
+                continue
+            index = int(self.indices[pos])
+            row = self.snapshot.row(index)
+            self.tree.item(slot, values=[fmt(row.get(col)) for col, _, _, fmt in self.columns])
+            self.tree.move(slot, "", j)
+            if index == self.selected_index:
+                selected_slot = slot
+        if n:
+            self.scrollbar.set(self.offset / n, min(1.0, (self.offset + self.height) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if selected_slot is not None:
+            self.tree.selection_set(selected_slot)
+        else:
+            self.tree.selection_remove(self.tree.selection())
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * len(self.indices))
+        elif action == "scroll":
+            self.scroll_to(self.offset + int(value) * (self.height if unit == "pages" else 1))
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.offset + (-3 if up else 3))
+        return "break"
+
+    def _on_tree_select(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        pos = self.offset + self.slots.index(selection[0])
+        if pos >= len(self.indices):
+            return
+        index = int(self.indices[pos])
+        if index != self.selected_index:
+            self.selected_index = index
+            self.on_select(index)
+
+    def _move_selection(self, delta):
+        if not len(self.indices):
+            return "break"
+        if self.selected_index is None:
+            pos = self.offset
+        else:
+            found = np.flatnonzero(self.indices == self.selected_index)
+            pos = int(found[0]) + delta if len(found) else self.offset
+        pos = max(0, min(pos, len(self.indices) - 1))
+        if pos < self.offset:
+            self.scroll_to(pos)
+        elif pos >= self.offset + self.height:
+            self.scroll_to(pos - self.height + 1)
+        self.selected_index = int(self.indices[pos])
+        self.render()
+        self.on_select(self.selected_index)
+        return "break"
 
 class App(bs.Window):
     def __init__(self, title, size):
@@ -43,10 +345,6 @@ class App(bs.Window):
         except tk.TclError:
             print("Aviso: Ícone 'images/matriz.ico' não encontrado ou inválido.")
 
-        # Verifica atualização usando a versão definida acima
-        if self.check_for_updates():
-            return 
-            
         self.title(f"Gestor do Bolsão {self.APP_VERSION}")
         
         # Estado dos Filtros
@@ -54,7 +352,13 @@ class App(bs.Window):
         self.minsize(size[0], size[1])
         
         self.snapshot_data = None
+        self.aggregates = None
         self.hubspot_df = None
+        self.change_feed = None
+        self.outbox = None
+        self.entregador = None
+        self.email_index = {}
+        self.carga_parcial = False
 
         self.setup_main_ui()
 
@@ -67,59 +371,138 @@ class App(bs.Window):
         self.progress_bar.pack(pady=10, fill='x', padx=20)
         self.progress_bar.start()
         
+        # Modo de perfil: argumento --profile ou o atalho oculto Ctrl+Shift+P
+        if "--profile" in sys.argv:
+            perfil.iniciar_perfil(app_version=self.APP_VERSION)
+        self.bind_all("<Control-Shift-KeyPress-P>", self.toggle_profiling)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         self.after(200, self.load_initial_data)
+        self.after(CATALOGO_CHECK_MS, self._poll_catalogo)
+
+        # A verificação de atualização roda em segundo plano, depois que a UI já está visível
+        self.update_info = None
+        self.update_button = None
+        self.after(UPDATE_CHECK_DELAY_MS, self.start_update_check)
+
+    # --- MODO DE PERFIL ---
+    def toggle_profiling(self, event=None):
+        """Liga/desliga a captura de perfil; ao desligar, mostra onde está o pacote .zip."""
+        if not perfil.perfil_ativo():
+            pasta = perfil.iniciar_perfil(app_version=self.APP_VERSION)
+            self.status_var.set(f"Modo de perfil ligado. Capturas em {pasta}.")
+            return
+        zip_path = self.encerrar_perfil()
+        self.update_status_bar()
+        messagebox.showinfo("Modo de Perfil", f"Perfil salvo em:\n{Path(zip_path).resolve()}\n\nEnvie este arquivo para o suporte.")
+
+    def encerrar_perfil(self):
+        """Desliga o perfil anotando no resumo o uso da API do Google Sheets. Retorna o .zip."""
+        return perfil.encerrar_perfil([f"Chamadas à API no último minuto: {be.get_api_usage()['calls']}"])
+
+    def on_close(self):
+        """Fecha o app, salvando o pacote de perfil (se ligado) e parando os envios de e-mail."""
+        if perfil.perfil_ativo():
+            try:
+                print(f"Perfil salvo em {self.encerrar_perfil()}")
+            except Exception as e:
+                print(f"Aviso: não foi possível salvar o perfil: {e}")
+        if self.entregador is not None:
+            self.entregador.stop(timeout=2)  # o que faltar continua na caixa de saída
+        self.destroy()
 
-    def check_for_updates(self):
-        """Verifica, extrai o updater para um local seguro, e inicia a atualização."""
-        # CORREÇÃO: Usa a versão definida no __init__ em vez de valor fixo
-        VERSION_URL = "https://raw.githubusercontent.com/Inteligencia-Matriz/BolsaoDesktop/main/version.json"
+    # --- VERIFICAÇÃO DE ATUALIZAÇÃO (SEGUNDO PLANO) ---
+    def start_update_check(self):
+        """Dispara a verificação de versão em uma thread, sem bloquear a interface."""
+        result = {}
 
+        def worker():
+            try:
+                result["data"] = fetch_version_info()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_update_check(thread, result)
+
+    def _poll_update_check(self, thread, result):
+        """Aguarda o fim da thread de verificação sem usar o Tk fora da thread principal."""
+        if thread.is_alive():
+            self.after(250, self._poll_update_check, thread, result)
+            return
+        if "error" in result:
+            print(f"Não foi possível verificar por atualizações: {result['error']}")
+            return
+        data = result.get("data")
+        if not data or "version" not in data:
+            return
         try:
-            response = requests.get(VERSION_URL, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            server_version_str = data["version"]
-            
-            # Compara a versão do servidor com a versão atual da classe (self.APP_VERSION)
-            if parse_version(server_version_str) > parse_version(self.APP_VERSION):
-                if messagebox.askyesno("Atualização Disponível", 
-                                       f"Uma nova versão ({server_version_str}) está disponível.\nDeseja atualizar agora?",
-                                       parent=self):
-                    
-                    embedded_updater_path = be.resource_path("updater.exe")
-                    temp_dir = os.getenv('TEMP')
-                    stable_updater_path = os.path.join(temp_dir, "updater.exe")
-
-                    with open(embedded_updater_path, 'rb') as f_in:
-                        with open(stable_updater_path, 'wb') as f_out:
-                            f_out.write(f_in.read())
-                    
-                    zip_url = data["url"]
-                    current_exe_path = sys.executable
-
-                    subprocess.Popen([stable_updater_path, zip_url, current_exe_path])
-                    self.destroy()
-                    return True
-        
-        except requests.RequestException:
-            print("Não foi possível verificar por atualizações (sem conexão ou timeout).")
+            if parse_version(data["version"]) > parse_version(self.APP_VERSION):
+                self.show_update_available(data)
         except Exception as e:
-            messagebox.showerror("Erro na Verificação", f"Ocorreu um erro ao verificar por atualizações:\n{e}", parent=self)
-        
-        return False
+            print(f"Aviso: resposta de versão inválida: {e}")
+
+    def show_update_available(self, data):
+        """Mostra um aviso discreto na barra inferior, sem interromper o trabalho do usuário."""
+        self.update_info = data
+        if self.update_button is None:
+            self.update_button = ttk.Button(self, command=self.install_update, style='warning.TButton')
+            self.update_button.pack(side='bottom', fill='x', padx=10, pady=(0, 5))
+        self.update_button.config(text=f"Nova versão {data['version']} disponível — clique para atualizar")
+
+    def install_update(self):
+        """Extrai o updater para um local seguro e inicia a atualização."""
+        data = self.update_info
+        if not data:
+            return
+        if not messagebox.askyesno("Atualização Disponível",
+                                   f"Uma nova versão ({data['version']}) está disponível.\n"
+                                   "O programa será fechado para atualizar. Deseja atualizar agora?",
+                                   parent=self):
+            return
+        try:
+            embedded_updater_path = be.resource_path("updater.exe")
+            temp_dir = os.getenv('TEMP')
+            stable_updater_path = os.path.join(temp_dir, "updater.exe")
+
+            with open(embedded_updater_path, 'rb') as f_in:
+                with open(stable_updater_path, 'wb') as f_out:
+                    f_out.write(f_in.read())
+
+            zip_url = data["url"]
+            current_exe_path = sys.executable
+
+            subprocess.Popen([stable_updater_path, zip_url, current_exe_path])
+            self.destroy()
+        except Exception as e:
+            messagebox.showerror("Erro na Atualização", f"Ocorreu um erro ao iniciar a atualização:\n{e}", parent=self)
 
+    @perfil.perfilado("load_initial_data")
     def load_initial_data(self):
         """Carrega os dados em segundo plano. Se falhar, exibe um erro claro na UI."""
         try:
-            self.hubspot_df = be.get_hubspot_data_for_activation()
-            self.snapshot_data = be.load_resultados_snapshot()
+            dados = be.bootstrap_initial_data(stream_resultados=True)
+            self.hubspot_df = dados["hubspot_df"]
+            self.snapshot_data = dados["snapshot"]
+            self.aggregates = be.ResultadosAggregates(self.snapshot_data)
+            tempos = dados["timings"]
+            print(f"Carga inicial concluída ({dados['source']}) com {dados['api_calls']} chamada(s) à API do Google Sheets "
+                  f"em {tempos['total_seconds']:.2f}s (primeira chamada: {tempos['first_call_seconds']:.2f}s, "
+                  f"token: {tempos['token_source']}).")
+            perfil.registrar_tempo_perfil("primeira_chamada_api", tempos["first_call_seconds"],
+                                      f"token: {tempos['token_source'] or dados['source']}")
             
             self.progress_bar.stop()
             self.loading_frame.destroy()
             self.enable_ui_components(True)
             self.populate_form_filters_initial()
-            self.sync_offline_data(silent=True)
-            self.update_status_bar()
+            self.refresh_relatorios()
+            self.start_email_delivery()
+            if dados["resultados_pendentes"]:
+                self.start_resultados_stream()
+            else:
+                self.finish_resultados_load()
 
         except Exception as e:
             self.progress_bar.stop()
@@ -129,6 +512,71 @@ class App(bs.Window):
             retry_button = ttk.Button(self.loading_frame, text="Tentar Novamente", command=self.retry_load, style="success.TButton")
             retry_button.pack(pady=10)
 
+    # --- CARGA PROGRESSIVA DE RESULTADOS ---
+    def start_resultados_stream(self):
+        """Lê os Resultados em janelas numa thread; a interface já fica usável e vai sendo preenchida."""
+        self.stream_cancel = threading.Event()
+        self.stream_queue = queue.Queue()
+        self.stream_frame = ttk.Frame(self)
+        self.stream_frame.pack(side='bottom', fill='x', padx=10, pady=(0, 5))
+        self.stream_label_var = tk.StringVar(value="Carregando resultados...")
+        ttk.Label(self.stream_frame, textvariable=self.stream_label_var).pack(side='left', padx=(0, 10))
+        self.stream_bar = ttk.Progressbar(self.stream_frame, mode='determinate', maximum=1)
+        self.stream_bar.pack(side='left', fill='x', expand=True)
+        ttk.Button(self.stream_frame, text="Cancelar", command=self.stream_cancel.set,
+                   style='secondary.Outline.TButton').pack(side='left', padx=(10, 0))
+
+        def worker():
+            try:
+                for janela in be.iter_resultados_windows(cancel=self.stream_cancel):
+                    self.stream_queue.put(("janela", janela))
+                self.stream_queue.put(("fim", None))
+            except Exception as e:
+                self.stream_queue.put(("erro", e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(100, self._poll_resultados_stream)
+
+    def _poll_resultados_stream(self):
+        """Junta ao snapshot, na thread do Tk, as janelas que já chegaram."""
+        recebidas = 0
+        while True:
+            try:
+                tipo, item = self.stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == "janela":
+                janela, agregados, lidas, total = item
+                self.snapshot_data.extend_from_sheet(janela)
+                self.aggregates.merge(agregados)
+                self.stream_bar.config(maximum=max(total, 1), value=lidas)
+                self.stream_label_var.set(f"Carregando resultados... {len(self.snapshot_data)} linha(s)")
+                recebidas += 1
+                continue
+            self.stream_frame.destroy()
+            if tipo == "erro":
+                messagebox.showwarning("Carga Incompleta", f"Nem todos os resultados foram carregados: {item}\n"
+                                       "Os dados já lidos continuam disponíveis; reabra o app para carregar tudo.")
+            self.finish_resultados_load(completa=tipo == "fim" and not self.stream_cancel.is_set())
+            return
+        if recebidas:
+            self.refresh_form_unidades()
+            self.refresh_form_candidates()
+            self.refresh_relatorios()
+        self.after(100, self._poll_resultados_stream)
+
+    def finish_resultados_load(self, completa=True):
+        """Etapas que dependem dos Resultados completos: fila offline e feed de alterações."""
+        self.carga_parcial = not completa
+        self.refresh_form_unidades()
+        self.refresh_form_candidates()
+        self.refresh_relatorios()
+        self.sync_offline_data(silent=True)
+        self.update_status_bar()
+        if completa:
+            # Com a carga interrompida, o feed leria de uma vez todas as linhas que faltam
+            self.start_change_feed()
+
     def retry_load(self):
         """Função para o botão 'Tentar Novamente'."""
         for widget in self.loading_frame.winfo_children():
@@ -153,6 +601,7 @@ class App(bs.Window):
         self.create_negociacao_tab()
         self.create_formulario_tab()
         self.create_valores_tab()
+        self.create_relatorios_tab()
         
         self.enable_ui_components(False)
 
@@ -219,20 +668,20 @@ class App(bs.Window):
         self.c_serie_var = tk.StringVar()
         self.c_bolsa_resultado_var = tk.StringVar(value="➔ Bolsa obtida: -")
 
-        def update_serie_and_limits(*args):
-            turma = self.c_turma_var.get()
-            serie = be.TURMA_DE_INTERESSE_MAP.get(turma, "")
-            self.c_serie_var.set(serie)
-            max_acertos = 10 if serie == "1º ao 5º Ano" else 20
-            self.c_ac_mat_spinbox.config(to=max_acertos)
-            self.c_ac_port_spinbox.config(to=max_acertos)
-            if self.c_ac_mat_var.get() > max_acertos: self.c_ac_mat_var.set(max_acertos)
-            if self.c_ac_port_var.get() > max_acertos: self.c_ac_port_var.set(max_acertos)
-        
-        self.c_turma_var.trace_add("write", update_serie_and_limits)
-        self.c_ac_mat_var.trace_add("write", self.calcular_bolsa_display)
-        self.c_ac_port_var.trace_add("write", self.calcular_bolsa_display)
-        self.c_unidade_var.trace_add("write", self.calcular_bolsa_display)
+        # Valores derivados da carta: série -> limite de acertos -> total -> bolsa
+        m = self.carta_model = ReactiveForm(self)
+        m.input("turma", self.c_turma_var)
+        m.input("ac_mat", self.c_ac_mat_var)
+        m.input("ac_port", self.c_ac_port_var)
+        m.input("unidade", self.c_unidade_var)
+        m.derive("serie", ["turma"], lambda turma: be.TURMA_DE_INTERESSE_MAP.get(turma, ""))
+        m.derive("max_acertos", ["serie"], be.max_acertos)
+        m.derive("total", ["ac_mat", "ac_port", "max_acertos"],
+                 lambda mat, port, maximo: min(mat or 0, maximo) + min(port or 0, maximo))
+        m.derive("pct", ["total", "serie", "unidade"], be.calcula_bolsa)
+        m.effect(["serie"], self.c_serie_var.set)
+        m.effect(["max_acertos"], self.update_acertos_limits)
+        m.effect(["pct", "total"], self.show_bolsa_result)
 
         ttk.Label(self.form_frame, text="Nome do Candidato:").grid(row=0, column=0, padx=5, pady=5, sticky='w')
         ttk.Entry(self.form_frame, textvariable=self.c_nome_var, width=50).grid(row=0, column=1, columnspan=3, padx=5, pady=5, sticky='ew')
@@ -262,8 +711,11 @@ class App(bs.Window):
         action_frame.pack(fill='x', padx=10, pady=10)
         ttk.Button(action_frame, text="Gerar e Salvar Carta PDF", command=self.gerar_carta, style='success.TButton').pack(side='left', padx=10, expand=True)
         ttk.Button(action_frame, text="Sincronizar Dados Offline", command=self.sync_offline_data, style='info.TButton').pack(side='left', padx=10, expand=True)
+        self.importar_btn = ttk.Button(action_frame, text="Importar Resultados (CSV/XLSX)", command=self.importar_resultados, style='secondary.TButton')
+        self.importar_btn.pack(side='left', padx=10, expand=True)
+        ttk.Button(action_frame, text="Envios por E-mail", command=self.show_email_report, style='secondary.Outline.TButton').pack(side='left', padx=10, expand=True)
         
-        update_serie_and_limits()
+        self.carta_model.flush()
 
     def filter_hubspot_candidates_by_unit(self, event=None):
         """Filtra os candidatos já em memória com base na unidade selecionada."""
@@ -310,19 +762,28 @@ class App(bs.Window):
         self.c_ac_mat_var.set(0)
         self.c_ac_port_var.set(0)
         self.c_load_candidato_var.set("")
-        self.calcular_bolsa_display()
+        self.carta_model.flush()
 
-    def calcular_bolsa_display(self, *args):
-        """Calcula e exibe o percentual da bolsa na tela."""
-        try:
-            total = self.c_ac_mat_var.get() + self.c_ac_port_var.get()
-            serie = self.c_serie_var.get()
-            unidade = self.c_unidade_var.get()
-            pct = be.calcula_bolsa(total, serie, unidade)
+    def update_acertos_limits(self, max_acertos):
+        """Ajusta os spinboxes ao número de questões da série escolhida."""
+        if isinstance(max_acertos, Exception):
+            return
+        self.c_ac_mat_spinbox.config(to=max_acertos)
+        self.c_ac_port_spinbox.config(to=max_acertos)
+        for var in (self.c_ac_mat_var, self.c_ac_port_var):
+            try:
+                if var.get() > max_acertos: var.set(max_acertos)
+            except tk.TclError:
+                pass
+
+    def show_bolsa_result(self, pct, total):
+        """Exibe o percentual da bolsa calculado pelo modelo da carta."""
+        if isinstance(pct, Exception):
+            self.c_bolsa_resultado_var.set(f"➔ Bolsa obtida: erro no cálculo ({pct})")
+        else:
             self.c_bolsa_resultado_var.set(f"➔ Bolsa obtida: {pct*100:.0f}% ({total} acertos)")
-        except Exception as e:
-            messagebox.showerror("Erro de Cálculo", str(e))
 
+    @perfil.perfilado("gerar_carta")
     def gerar_carta(self):
         """Coleta dados, prepara o nome do arquivo, gera e salva o PDF."""
         aluno = self.c_nome_var.get()
@@ -330,66 +791,22 @@ class App(bs.Window):
             messagebox.showerror("Erro de Validação", "O nome do candidato é obrigatório.")
             return
         try:
+            # Aplica alterações ainda dentro do debounce antes de ler os valores
+            self.carta_model.flush()
             unidade_limpa = self.c_unidade_var.get()
             turma = self.c_turma_var.get()
             ac_mat = self.c_ac_mat_var.get()
             ac_port = self.c_ac_port_var.get()
-            serie_modalidade = self.c_serie_var.get()
-            total_acertos = ac_mat + ac_port
+            serie_modalidade = self.carta_model["serie"]
 
             brasilia_datetime = be.get_current_brasilia_datetime()
             hoje = brasilia_datetime.date()
             nome_bolsao = be.get_bolsao_name_for_date(hoje)
 
-            pct_bolsa = be.calcula_bolsa(total_acertos, serie_modalidade, unidade_limpa)
-            precos = be.precos_2027(serie_modalidade)
-            
-            # --- CÁLCULOS PÁGINA 1: ANUIDADE E PARCELAMENTO NORMAL ---
-            # Anuidade Total com o desconto da Bolsa (Normal)
-            anuidade_com_bolsa = precos["anuidade"] * (1 - pct_bolsa)
-            
-            # Parcelamento padrão (Matrícula R$ 300, Saldo em 12x)
-            entrada_normal = 300.00
-            saldo_restante_normal = anuidade_com_bolsa - entrada_normal
-            if saldo_restante_normal < 0: saldo_restante_normal = 0
-            val_12x_normal = saldo_restante_normal / 12
-
-            # --- CÁLCULOS PÁGINA 1: CONDIÇÃO ESPECIAL (HOJE) ---
-            # Regra: Desconto da bolsa + 5% extra
-            
-            pct_especial_hoje = pct_bolsa + 0.05
-            if pct_especial_hoje > 1.0: 
-                pct_especial_hoje = 1.0
-            
-            # Valor total da anuidade com o desconto especial
-            anuidade_especial_total = precos["anuidade"] * (1 - pct_especial_hoje)
-            
-            # Valor fixo da 1ª parcela
-            entrada_especial = 300.00
-            
-            # Abate a entrada para achar o saldo
-            saldo_restante_especial = anuidade_especial_total - entrada_especial
-            if saldo_restante_especial < 0: saldo_restante_especial = 0
-            
-            # O saldo é dividido em 12 parcelas
-            val_12x_especial = saldo_restante_especial / 12
-
-            # --- CRIAÇÃO DO TEXTO DINÂMICO PARA O CABEÇALHO ---
-            base_int = int(round(pct_bolsa * 100))
-            total_int = int(round(pct_especial_hoje * 100))
-            # Formato: "Condições de hoje 66% (61% + 5%)"
-            texto_condicao = f"Condições de hoje {total_int}% ({base_int}% + 5%)"
-
-            # --- CÁLCULOS PÁGINA 3: PROPOSTA ESPECIAL (GENÉRICA) ---
-            # Mantem a lógica de +5% para exibir os planos tradicionais na página 3
-            proposta_pct = pct_bolsa + 0.05
-            if proposta_pct > 1.0: proposta_pct = 1.0
-            anuidade_proposta = precos["anuidade"] * (1 - proposta_pct)
-            
-            entrada_proposta = 300.00
-            saldo_proposta = anuidade_proposta - entrada_proposta
-            if saldo_proposta < 0: saldo_proposta = 0
-            prop12_val = saldo_proposta / 12
+            pct_bolsa = self.carta_model["pct"]
+            if isinstance(pct_bolsa, Exception):
+                raise pct_bolsa
+            cond = be.calcula_condicoes_carta(pct_bolsa, serie_modalidade)
             
             aluno_safe = re.sub(r'[\\/*?:"<>|]', "", aluno.strip())
             bolsao_safe = re.sub(r'[\\/*?:"<>|]', "", nome_bolsao.strip()).replace(" ", "_")
@@ -410,20 +827,20 @@ class App(bs.Window):
                 "data_limite": (hoje + be.timedelta(days=7)).strftime("%d/%m/%Y"),
                 
                 # Valores Página 1 - Tabela Superior (Normal)
-                "anuidade_total_bolsa": be.format_currency(anuidade_com_bolsa),
-                "entrada_normal": be.format_currency(entrada_normal),
-                "val_12x_normal": be.format_currency(val_12x_normal),
+                "anuidade_total_bolsa": be.format_currency(cond["anuidade_com_bolsa"]),
+                "entrada_normal": be.format_currency(cond["entrada_normal"]),
+                "val_12x_normal": be.format_currency(cond["val_12x_normal"]),
                 
                 # Valores Página 1 - Tabela Inferior (Condição de Hoje)
                 # Passamos o texto dinâmico gerado aqui
-                "texto_condicao_hoje": texto_condicao,
-                "entrada_especial": be.format_currency(entrada_especial),
-                "val_12x_especial": be.format_currency(val_12x_especial),
+                "texto_condicao_hoje": cond["texto_condicao"],
+                "entrada_especial": be.format_currency(cond["entrada_especial"]),
+                "val_12x_especial": be.format_currency(cond["val_12x_especial"]),
                 
                 # Valores Página 3 (Proposta Especial +5% genérica)
-                "proposta_pct": f"{proposta_pct * 100:.0f}",
-                "entrada_proposta": be.format_currency(entrada_proposta),
-                "prop12_val": be.format_currency(prop12_val),
+                "proposta_pct": f"{cond['proposta_pct'] * 100:.0f}",
+                "entrada_proposta": be.format_currency(cond["entrada_proposta"]),
+                "prop12_val": be.format_currency(cond["prop12_val"]),
                 
                 "unidades_html": "".join(f"<span class='unidade-item'>{u}</span>" for u in be.UNIDADES_LIMPAS),
                 "tabelas_material_didatico": html_tabelas_material,
@@ -442,45 +859,25 @@ class App(bs.Window):
             if file_path:
                 with open(file_path, "wb") as f: f.write(pdf_bytes)
                 messagebox.showinfo("Sucesso", f"Carta PDF salva com sucesso em:\n{file_path}")
+                self.offer_email_delivery(aluno, unidade_limpa, pdf_bytes, file_path)
                 if messagebox.askyesno("Registrar na Planilha?", "Deseja registrar este resultado na planilha online?"):
-                    self.registrar_na_planilha(aluno, unidade_limpa, turma, ac_mat, ac_port, total_acertos, pct_bolsa, serie_modalidade, ctx, brasilia_datetime, nome_bolsao)
+                    self.registrar_na_planilha(aluno, unidade_limpa, turma, ac_mat, ac_port, pct_bolsa, serie_modalidade, brasilia_datetime, nome_bolsao)
         except Exception as e:
             messagebox.showerror("Erro ao Gerar Carta", str(e))
 
-    def registrar_na_planilha(self, aluno, unidade_limpa, turma, ac_mat, ac_port, total, pct, serie, ctx, brasilia_dt, nome_bolsao):
+    def registrar_na_planilha(self, aluno, unidade_limpa, turma, ac_mat, ac_port, pct, serie, brasilia_dt, nome_bolsao):
         """Envia os dados gerados para a planilha Resultados_Bolsao."""
-        row_data_map = {
-            "Data/Hora": brasilia_dt.strftime("%d/%m/%Y %H:%M:%S"),
-            "Nome do Aluno": aluno.strip().title(),
-            "Unidade": be.UNIDADES_MAP[unidade_limpa],
-            "Turma de Interesse": turma,
-            "Acertos Matemática": ac_mat,
-            "Acertos Português": ac_port,
-            "Total de Acertos": total,
-            "% Bolsa": f"{pct*100:.0f}%",
-            "Série / Modalidade": serie,
-            "Valor Anuidade à Vista": ctx["anuidade_total_bolsa"], 
-            "Valor da 1ª Cota": ctx["val_12x_normal"], # Registrando o valor da parcela normal como referência
-            "Valor da Mensalidade com Bolsa": ctx["val_12x_normal"],
-            "REGISTRO_ID": be.new_uuid(),
-            "Bolsão": nome_bolsao
-        }
+        row_data_map = be.build_resultado_record(aluno, unidade_limpa, turma, ac_mat, ac_port, pct, serie, brasilia_dt, nome_bolsao)
         
         try:
-            ws_res = be.get_ws("Resultados_Bolsao")
-            hmap_res = be.header_map("Resultados_Bolsao")
-            header_list = sorted(hmap_res, key=hmap_res.get)
-            nova_linha = [row_data_map.get(col_name, "") for col_name in header_list]
-            ws_res.append_row(nova_linha, value_input_option="USER_ENTERED")
+            rownum = be.append_resultados([row_data_map])[0]
+            if self.change_feed is not None:
+                self.change_feed.notify_activity()
             messagebox.showinfo("Sucesso", "Dados registrados na planilha online!")
-
-            try:
-                self.status_var.set("Sincronizando dados atualizados...")
-                self.update() 
-                self.snapshot_data = be.load_resultados_snapshot()
-                self.status_var.set("Dados sincronizados.")
-            except Exception as sync_error:
-                messagebox.showwarning("Aviso de Sincronização", f"O registro foi salvo, mas a sincronização automática falhou. Pode ser necessário reiniciar para editar.\nErro: {sync_error}")
+            # O registro entra direto no snapshot e nos agregados, sem recarregar a aba inteira
+            # (se foi para o shard de outra unidade, não faz parte do snapshot local)
+            if be.record_in_local_shard(row_data_map):
+                self.add_record_to_snapshot(row_data_map, rownum)
 
         except Exception as e:
             messagebox.showwarning(
@@ -488,11 +885,201 @@ class App(bs.Window):
                 f"Não foi possível registrar na planilha online.\nErro: {e}\n\nOs dados serão salvos localmente e enviados mais tarde."
             )
             self.save_to_offline_queue(row_data_map)
-            if self.snapshot_data:
-                self.snapshot_data['rows'].append(row_data_map)
+            self.add_record_to_snapshot(row_data_map)
         
-        if self.snapshot_data:
+        if self.snapshot_data is not None:
+            self.populate_form_filters_initial()
+
+    def add_record_to_snapshot(self, record, rownum=None, refresh=True):
+        """Acrescenta um registro ao snapshot em memória e atualiza os relatórios."""
+        self.add_records_to_snapshot([(record, rownum)], refresh=refresh)
+
+    def add_records_to_snapshot(self, pares, refresh=True):
+        """Acrescenta um lote de (registro, linha) ao snapshot de uma vez e atualiza os relatórios."""
+        if self.snapshot_data is None or not pares:
+            return
+        rows = self.snapshot_data.append_records([r for r, _ in pares], [n for _, n in pares])
+        if self.aggregates is not None:
+            for row in rows:
+                self.aggregates.add(row.to_dict())
+            if refresh:
+                self.refresh_relatorios()
+
+    # --- ENVIO DE CARTAS POR E-MAIL ---
+    def start_email_delivery(self):
+        """Liga o envio de cartas por e-mail, se este computador tiver SMTP configurado."""
+        if self.entregador is not None:
+            return
+        try:
+            config = envio_email.get_smtp_config()
+        except Exception:
+            return  # sem SMTP: as cartas continuam só como arquivo
+        self.outbox = envio_email.CaixaSaida()
+        self.email_index = envio_email.build_hubspot_email_index(self.hubspot_df)
+        self.entregador = envio_email.EntregadorCartas(self.outbox, config)
+        self.entregador.start()
+        self._email_report_key = None
+        self.after(3000, self._poll_email_delivery)
+
+    def _poll_email_delivery(self):
+        """Atualiza a barra de status quando a situação da caixa de saída muda."""
+        report = self.outbox.report()
+        key = (report["pendentes"], report["enviados"], report["falhas"])
+        if key != self._email_report_key:
+            self._email_report_key = key
+            self.update_status_bar()
+        self.after(3000, self._poll_email_delivery)
+
+    def offer_email_delivery(self, aluno, unidade_limpa, pdf_bytes, file_path):
+        """Oferece enviar a carta ao e-mail do candidato no Hubspot (coluna 'E-mail')."""
+        if self.entregador is None:
+            return
+        destino = envio_email.hubspot_email_for(self.email_index, aluno, unidade_limpa)
+        if not destino or not messagebox.askyesno("Enviar por E-mail?", f"Deseja enviar a carta para {destino}?"):
+            return
+        msg = envio_email.build_carta_email(self.entregador.pool.config["from"], destino, aluno, pdf_bytes, Path(file_path).name, unidade_limpa)
+        self.outbox.enqueue(msg, arquivo=str(Path(file_path).resolve()), aluno=aluno)
+        self.update_status_bar()
+
+    def show_email_report(self):
+        """Mostra a situação dos envios e permite reenviar os que falharam."""
+        if self.outbox is None:
+            messagebox.showinfo("Envios por E-mail", "O envio por e-mail não está configurado neste computador\n(chave 'smtp' do config_local.json).")
+            return
+        r = self.outbox.report()
+        texto = (f"Enviados: {r['enviados']} ({r['ultimo_minuto']} no último minuto)\n"
+                 f"Na fila: {r['pendentes']} (enviando agora: {r['enviando']})\n"
+                 f"Com falha: {r['falhas']}")
+        if not r["falhou"]:
+            messagebox.showinfo("Envios por E-mail", texto)
+            return
+        texto += "\n\n" + "\n".join(f"• {f['to']}: {f['erro']}" for f in r["falhou"][:10])
+        if len(r["falhou"]) > 10:
+            texto += f"\n... e mais {len(r['falhou']) - 10}."
+        if messagebox.askyesno("Envios por E-mail", texto + "\n\nTentar enviar novamente os que falharam?"):
+            self.outbox.retry_failed()
+            self.update_status_bar()
+
+    # --- FEED DE ALTERAÇÕES DOS OUTROS OPERADORES ---
+    def start_change_feed(self):
+        """Inicia a verificação em segundo plano das alterações feitas por outros operadores."""
+        if self.change_feed is None:
+            self.change_feed = be.ResultadosChangeFeed(self.snapshot_data)
+            self.change_feed.start()
+            self.after(1000, self._poll_change_feed)
+
+    def _poll_change_feed(self):
+        """Aplica, na thread do Tk, as mudanças encontradas pelo feed e lhe entrega a cópia atual do snapshot."""
+        for result in self.change_feed.pending():
+            try:
+                self.apply_remote_changes(result)
+            except Exception as e:
+                print(f"Aviso: não foi possível aplicar alterações remotas: {e}")
+        if self.snapshot_data is not None:
+            self.change_feed.publish(self.snapshot_data)
+        self.after(1000, self._poll_change_feed)
+
+    def apply_remote_changes(self, result):
+        """
+        Leva ao snapshot, aos relatórios e ao Formulário as linhas novas e
+        alteradas por outros operadores, sem mexer na seleção atual nem nos
+        campos que o usuário está editando.
+        """
+        snap = self.snapshot_data
+        if snap is None:
+            return
+        for reg_id, rownum in result["rownums"].items():
+            snap.set_rownum(reg_id, rownum)
+
+        alterados = 0
+        aberto_alterado = False
+        chegaram = [(record, rownum) for record, rownum in result["new"]
+                    if str(record.get("REGISTRO_ID")) not in snap.id_to_index]
+        self.add_records_to_snapshot(chegaram, refresh=False)
+        novos = len(chegaram)
+        for reg_id, updates in result["updated"]:
+            if snap.touched.get(reg_id, 0) > result["as_of"]:
+                continue  # a edição local é mais nova que a leitura
+            mudanca = snap.update_record(reg_id, updates)
+            if mudanca is None:
+                continue
+            if self.aggregates is not None:
+                self.aggregates.replace(*mudanca)
+            alterados += 1
+            aberto_alterado = aberto_alterado or reg_id == self.selected_reg_id
+
+        if not (novos or alterados):
+            return
+        self.refresh_relatorios()
+        self.refresh_form_candidates()
+        msg = f"Outros operadores: {novos} registro(s) novo(s), {alterados} alterado(s)."
+        if aberto_alterado:
+            msg += " O registro aberto no Formulário foi alterado."
+        self.status_var.set(msg)
+
+    def importar_resultados(self):
+        """Importa um arquivo de resultados da equipe de correção em uma thread, sem travar a interface."""
+        path = filedialog.askopenfilename(
+            title="Importar Resultados",
+            filetypes=[("Planilhas", "*.csv *.xlsx"), ("CSV", "*.csv"), ("Excel", "*.xlsx")]
+        )
+        if not path:
+            return
+        result = {"progresso": (0, 0, 0)}
+        hubspot_df = self.hubspot_df
+
+        def progresso(processadas, importadas, erros):
+            result["progresso"] = (processadas, importadas, erros)
+
+        def worker():
+            try:
+                result["data"] = be.import_resultados(path, hubspot_df, progress=progresso)
+            except Exception as e:
+                result["error"] = e
+
+        self.importar_btn.config(state='disabled')
+        self.status_var.set("Importando...")
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_importacao(thread, result)
+
+    def _poll_importacao(self, thread, result):
+        if thread.is_alive():
+            processadas, importadas, erros = result["progresso"]
+            self.status_var.set(f"Importando... {processadas} linha(s) lidas, {importadas} importada(s), {erros} erro(s).")
+            self.after(250, self._poll_importacao, thread, result)
+            return
+        self.importar_btn.config(state='normal')
+        if "error" in result:
+            messagebox.showerror("Erro na Importação", str(result["error"]))
+            self.update_status_bar()
+            return
+        self.show_importacao(result["data"])
+
+    def show_importacao(self, relatorio):
+        """Junta ao snapshot, de uma vez, as linhas importadas e mostra o resumo e os erros."""
+        if self.snapshot_data is not None:
+            # Durante a importação o feed de alterações pode já ter trazido parte das linhas
+            ids = self.snapshot_data.id_to_index
+            self.add_records_to_snapshot([(r, n) for r, n in relatorio["records"]
+                                          if str(r.get("REGISTRO_ID")) not in ids], refresh=False)
+        if self.snapshot_data is not None:
+            self.refresh_relatorios()
             self.populate_form_filters_initial()
+        self.update_status_bar()
+
+        erros = relatorio["errors"]
+        resumo = f"{relatorio['imported']} de {relatorio['total']} linha(s) importada(s)."
+        if not erros:
+            messagebox.showinfo("Importação Concluída", resumo)
+            return
+        exemplos = "\n".join(f"Linha {linha or '-'} ({nome}): {motivo}" for linha, nome, motivo in erros[:10])
+        if messagebox.askyesno("Importação Concluída com Erros",
+                               f"{resumo}\n{len(erros)} linha(s) com erro:\n\n{exemplos}\n\nDeseja salvar o relatório de erros?"):
+            destino = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
+                                                   initialfile="erros_importacao.csv", title="Salvar Relatório de Erros")
+            if destino:
+                pd.DataFrame(erros, columns=["Linha", "Nome", "Motivo"]).to_csv(destino, index=False, sep=";", encoding="utf-8-sig")
 
     # --- ABA 2: NEGOCIAÇÃO ---
     def create_negociacao_tab(self):
@@ -507,30 +1094,22 @@ class App(bs.Window):
         self.n_resultado_var = tk.StringVar()
         self.n_bolsa_percent_var = tk.StringVar(value="30%")
 
-        def update_negociacao_calculo(*args):
-            try:
-                self.n_bolsa_percent_var.set(f"{self.n_bolsa_sim_var.get()}%")
-                unidade = self.n_unidade_var.get()
-                serie = self.n_serie_var.get()
-                valor_minimo = be.calcula_valor_minimo(unidade, serie)
-                self.n_valor_minimo_var.set(f"Valor Mínimo Negociável: {be.format_currency(valor_minimo)}")
-                precos = be.precos_2027(serie)
-                valor_integral = precos["parcela_mensal"]
-                resultado_str = ""
-                if self.n_modo_sim_var.get() == "Bolsa (%)":
-                    bolsa_pct = self.n_bolsa_sim_var.get() / 100
-                    valor_final = valor_integral * (1 - bolsa_pct)
-                    resultado_str = f"Valor da Parcela: {be.format_currency(valor_final)}"
-                    if valor_final < valor_minimo: resultado_str += " (Abaixo do mínimo!)"
-                else:
-                    valor_desejado = self.n_valor_neg_var.get()
-                    bolsa_necessaria = (1 - (valor_desejado / valor_integral)) * 100 if valor_integral > 0 else 0
-                    resultado_str = f"Bolsa Necessária: {bolsa_necessaria:.2f}%"
-                    if valor_desejado < valor_minimo: resultado_str += " (Abaixo do mínimo!)"
-                self.n_resultado_var.set(resultado_str)
-            except Exception as e:
-                self.n_resultado_var.set("Erro no cálculo.")
-                messagebox.showerror("Erro de Cálculo", str(e))
+        m = self.negociacao_model = ReactiveForm(self)
+        m.input("unidade", self.n_unidade_var)
+        m.input("serie", self.n_serie_var)
+        m.input("modo", self.n_modo_sim_var)
+        m.input("bolsa", self.n_bolsa_sim_var)
+        m.input("valor_desejado", self.n_valor_neg_var)
+        m.derive("valor_minimo", ["unidade", "serie"], be.calcula_valor_minimo)
+        m.derive("valor_integral", ["serie"], lambda serie: be.precos_2027(serie)["parcela_mensal"])
+        m.derive("resultado", ["modo", "bolsa", "valor_desejado", "valor_integral", "valor_minimo"], self.calcula_resultado_negociacao)
+        m.effect(["bolsa"], lambda bolsa: self.n_bolsa_percent_var.set(f"{bolsa or 0}%"))
+        m.effect(["valor_minimo"], lambda v: self.n_valor_minimo_var.set(
+            "Valor Mínimo Negociável: erro no cálculo." if isinstance(v, Exception)
+            else f"Valor Mínimo Negociável: {be.format_currency(v)}"))
+        m.effect(["resultado"], lambda r: self.n_resultado_var.set("Erro no cálculo." if isinstance(r, Exception) else r))
+        m.derive("cotacao", ["valor_desejado"], be.cotacao_reversa)
+        m.effect(["cotacao", "unidade"], self.show_cotacao_reversa)
 
         top_frame = ttk.Frame(neg_frame)
         top_frame.pack(fill='x', padx=10, pady=5)
@@ -540,7 +1119,7 @@ class App(bs.Window):
         unidade_neg_combo.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
         self._configure_combobox_click(unidade_neg_combo)
         ttk.Label(top_frame, text="Série/Modalidade:").grid(row=1, column=0, padx=5, pady=5, sticky='w')
-        serie_neg_combo = ttk.Combobox(top_frame, textvariable=self.n_serie_var, values=list(be.TUITION.keys()), state='readonly')
+        self.serie_neg_combo = serie_neg_combo = ttk.Combobox(top_frame, textvariable=self.n_serie_var, values=list(be.TUITION.keys()), state='readonly')
         serie_neg_combo.grid(row=1, column=1, padx=5, pady=5, sticky='ew')
         self._configure_combobox_click(serie_neg_combo)
         ttk.Separator(neg_frame).pack(fill='x', padx=10, pady=10)
@@ -552,7 +1131,7 @@ class App(bs.Window):
         slider_frame = ttk.Frame(sim_frame)
         slider_frame.pack(fill='x', padx=20, pady=5)
         ttk.Radiobutton(sim_frame, text="Calcular por Bolsa (%)", variable=self.n_modo_sim_var, value="Bolsa (%)").pack(anchor='w')
-        ttk.Scale(slider_frame, from_=0, to=100, variable=self.n_bolsa_sim_var, orient='horizontal', length=350, command=update_negociacao_calculo).pack(side='left', fill='x', expand=True)
+        ttk.Scale(slider_frame, from_=0, to=100, variable=self.n_bolsa_sim_var, orient='horizontal', length=350).pack(side='left', fill='x', expand=True)
         ttk.Label(slider_frame, textvariable=self.n_bolsa_percent_var, font=("-size 10 -weight bold")).pack(side='left', padx=10)
 
         ttk.Radiobutton(sim_frame, text="Calcular por Valor da Parcela (R$)", variable=self.n_modo_sim_var, value="Valor da Parcela (R$)").pack(anchor='w', pady=(10,0))
@@ -563,17 +1142,80 @@ class App(bs.Window):
         
         ttk.Label(neg_frame, textvariable=self.n_resultado_var, font=("-size 14 -weight bold"), style='success.TLabel').pack(pady=20)
         
-        self.n_unidade_var.trace_add('write', update_negociacao_calculo)
-        self.n_serie_var.trace_add('write', update_negociacao_calculo)
-        self.n_modo_sim_var.trace_add('write', update_negociacao_calculo)
-        ttk.Button(sim_frame, text="Calcular", command=update_negociacao_calculo).pack(pady=10)
-        update_negociacao_calculo()
+        ttk.Button(sim_frame, text="Calcular", command=self.negociacao_model.flush).pack(pady=10)
+
+        # Cotação reversa: a parcela digitada contra todas as unidades e séries
+        rev_frame = ttk.LabelFrame(neg_frame, text="Parcela desejada em todas as unidades e séries", padding=10)
+        rev_frame.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        cols = ["Unidade", "Série/Modalidade", "Parcela integral", "Bolsa necessária", "Valor mínimo", "Bolsa máxima", "Situação"]
+        self.n_cotacao_tree = ttk.Treeview(rev_frame, columns=cols, show='headings', height=8)
+        for col in cols:
+            self.n_cotacao_tree.heading(col, text=col)
+            self.n_cotacao_tree.column(col, anchor=CENTER, width=110)
+        self.n_cotacao_tree.column("Série/Modalidade", anchor='w', width=220)
+        self.n_cotacao_tree.tag_configure('abaixo', foreground='#c0392b')
+        self.n_cotacao_tree.tag_configure('selecionada', font=("-weight bold"))
+        scroll = ttk.Scrollbar(rev_frame, orient='vertical', command=self.n_cotacao_tree.yview)
+        self.n_cotacao_tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side='right', fill='y')
+        self.n_cotacao_tree.pack(fill='both', expand=True)
+        self.negociacao_model.flush()
+
+    def show_cotacao_reversa(self, cotacao, unidade_sel):
+        """Preenche a tabela da cotação reversa; a unidade escolhida acima vem primeiro."""
+        tree = self.n_cotacao_tree
+        tree.delete(*tree.get_children())
+        if cotacao is None or isinstance(cotacao, Exception):
+            return
+        ordem = sorted(range(len(cotacao["unidades"])), key=lambda i: cotacao["unidades"][i] != unidade_sel)
+        for i in ordem:
+            unidade = cotacao["unidades"][i]
+            for j, serie in enumerate(cotacao["series"]):
+                if cotacao["sem_bolsa"][i, j]:
+                    situacao = "Sem bolsa"
+                elif cotacao["acima_do_minimo"][i, j]:
+                    situacao = "OK"
+                else:
+                    situacao = "Abaixo do mínimo"
+                tags = [] if cotacao["acima_do_minimo"][i, j] else ['abaixo']
+                if unidade == unidade_sel:
+                    tags.append('selecionada')
+                tree.insert("", END, tags=tags, values=(
+                    unidade, serie,
+                    be.format_currency(cotacao["parcela_integral"][i, j]),
+                    f"{cotacao['bolsa_necessaria'][i, j] * 100:.2f}%",
+                    be.format_currency(cotacao["valor_minimo"][i, j]),
+                    f"{cotacao['bolsa_maxima'][i, j] * 100:.2f}%",
+                    situacao,
+                ))
+
+    def calcula_resultado_negociacao(self, modo, bolsa, valor_desejado, valor_integral, valor_minimo):
+        """Texto do simulador: parcela para uma bolsa, ou bolsa para uma parcela desejada."""
+        if isinstance(valor_minimo, Exception):
+            raise valor_minimo
+        if isinstance(valor_integral, Exception):
+            raise valor_integral
+        if modo == "Bolsa (%)":
+            valor_final = valor_integral * (1 - (bolsa or 0) / 100)
+            resultado_str = f"Valor da Parcela: {be.format_currency(valor_final)}"
+            if valor_final < valor_minimo: resultado_str += " (Abaixo do mínimo!)"
+            return resultado_str
+        if valor_desejado is None:
+            return "Informe o valor da parcela."
+        bolsa_necessaria = (1 - (valor_desejado / valor_integral)) * 100 if valor_integral > 0 else 0
+        resultado_str = f"Bolsa Necessária: {bolsa_necessaria:.2f}%"
+        if valor_desejado < valor_minimo: resultado_str += " (Abaixo do mínimo!)"
+        return resultado_str
 
     # --- ABA 3: FORMULÁRIO BÁSICO ---
     def create_formulario_tab(self):
         self.f_unidade_var = tk.StringVar()
         self.f_bolsao_var = tk.StringVar()
-        self.f_candidato_var = tk.StringVar()
+        self.f_bolsa_var = tk.StringVar(value="Todas")
+        self.f_matricula_filtro_var = tk.StringVar(value="Todos")
+        self.f_periodo_var = tk.StringVar(value="Todo o período")
+        self.f_periodo_de_var = tk.StringVar()
+        self.f_periodo_ate_var = tk.StringVar()
         self.f_info_var = tk.StringVar()
         self.f_escola_var = tk.StringVar()
         self.f_resp_fin_var = tk.StringVar()
@@ -602,10 +1244,48 @@ class App(bs.Window):
         self.f_bolsao_combo = ttk.Combobox(filter_frame, textvariable=self.f_bolsao_var, values=["Filtre por unidade..."], state='readonly')
         self.f_bolsao_combo.grid(row=1, column=1, padx=5, pady=5, sticky='ew')
         self._configure_combobox_click(self.f_bolsao_combo)
-        ttk.Label(filter_frame, text="Candidato:").grid(row=2, column=0, padx=5, pady=5, sticky='w')
-        self.f_candidato_combo = ttk.Combobox(filter_frame, textvariable=self.f_candidato_var, values=["Filtre por bolsão..."], state='readonly', height=15)
-        self.f_candidato_combo.grid(row=2, column=1, padx=5, pady=5, sticky='ew')
-        self._configure_combobox_click(self.f_candidato_combo)
+        extra_filters = ttk.Frame(filter_frame)
+        extra_filters.grid(row=2, column=0, columnspan=2, sticky='ew')
+        ttk.Label(extra_filters, text="% Bolsa:").pack(side='left', padx=5, pady=5)
+        self.f_bolsa_combo = ttk.Combobox(extra_filters, textvariable=self.f_bolsa_var, values=["Todas"], state='readonly', width=8)
+        self.f_bolsa_combo.pack(side='left', padx=5, pady=5)
+        self._configure_combobox_click(self.f_bolsa_combo)
+        ttk.Label(extra_filters, text="Matriculou?").pack(side='left', padx=5, pady=5)
+        self.f_matricula_filtro_combo = ttk.Combobox(extra_filters, textvariable=self.f_matricula_filtro_var,
+                                                     values=["Todos", "Sim", "Não", be.MATRICULA_EM_BRANCO], state='readonly', width=10)
+        self.f_matricula_filtro_combo.pack(side='left', padx=5, pady=5)
+        self._configure_combobox_click(self.f_matricula_filtro_combo)
+        period_filters = ttk.Frame(filter_frame)
+        period_filters.grid(row=3, column=0, columnspan=2, sticky='ew')
+        ttk.Label(period_filters, text="Período:").pack(side='left', padx=5, pady=5)
+        self.f_periodo_combo = ttk.Combobox(period_filters, textvariable=self.f_periodo_var,
+                                            values=list(be.PERIODOS_FORMULARIO) + [PERIODO_INTERVALO], state='readonly', width=16)
+        self.f_periodo_combo.pack(side='left', padx=5, pady=5)
+        self._configure_combobox_click(self.f_periodo_combo)
+        ttk.Label(period_filters, text="De:").pack(side='left', padx=5, pady=5)
+        self.f_periodo_de_entry = ttk.Entry(period_filters, textvariable=self.f_periodo_de_var, width=11)
+        self.f_periodo_de_entry.pack(side='left', padx=5, pady=5)
+        ttk.Label(period_filters, text="Até:").pack(side='left', padx=5, pady=5)
+        self.f_periodo_ate_entry = ttk.Entry(period_filters, textvariable=self.f_periodo_ate_var, width=11)
+        self.f_periodo_ate_entry.pack(side='left', padx=5, pady=5)
+        for entry in (self.f_periodo_de_entry, self.f_periodo_ate_entry):
+            entry.bind("<Return>", self.on_period_dates_changed)
+            entry.bind("<FocusOut>", self.on_period_dates_changed)
+
+        self.f_grid = VirtualGrid(filter_frame, [
+            ("Nome do Aluno", "Candidato", 220, _fmt_texto),
+            ("Unidade", "Unidade", 110, lambda v: UNIDADE_CURTA.get(v, _fmt_texto(v))),
+            ("Bolsão", "Bolsão", 120, _fmt_texto),
+            ("% Bolsa", "% Bolsa", 60, be.format_percent),
+            ("Valor da Mensalidade com Bolsa", "Parcela", 90, _fmt_moeda),
+            ("Aluno Matriculou?", "Matriculou?", 80, _fmt_texto),
+            ("Data/Hora", "Data/Hora", 110, _fmt_data_hora),
+        ], on_select=self.on_grid_select)
+        self.f_grid.grid(row=4, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        export_frame = ttk.Frame(filter_frame)
+        export_frame.grid(row=5, column=0, columnspan=2, pady=(5, 0))
+        ttk.Button(export_frame, text="Exportar Resultados", command=lambda: self.exportar_dados("resultados"), style='info.Outline.TButton').pack(side='left', padx=5)
+        ttk.Button(export_frame, text="Exportar Hubspot", command=lambda: self.exportar_dados("hubspot"), style='info.Outline.TButton').pack(side='left', padx=5)
         
         edit_frame = ttk.LabelFrame(f_scrolled_frame, text="Editar Registro", padding=10)
         edit_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -619,10 +1299,12 @@ class App(bs.Window):
         ttk.Label(edit_frame, text="Telefone:").grid(row=3, column=0, padx=5, pady=5, sticky='w')
         ttk.Entry(edit_frame, textvariable=self.f_tel_var).grid(row=3, column=1, padx=5, pady=5, sticky='ew')
         ttk.Label(edit_frame, text="Valor Negociado (R$):").grid(row=4, column=0, padx=5, pady=5, sticky='w')
-        ttk.Entry(edit_frame, textvariable=self.f_valor_neg_var).grid(row=4, column=1, padx=5, pady=5, sticky='ew')
+        valor_neg_entry = ttk.Entry(edit_frame, textvariable=self.f_valor_neg_var)
+        valor_neg_entry.grid(row=4, column=1, padx=5, pady=5, sticky='ew')
         
         ttk.Label(edit_frame, text="Expectativa de mensalidade (R$):").grid(row=5, column=0, padx=5, pady=5, sticky='w')
-        ttk.Entry(edit_frame, textvariable=self.f_expectativa_var).grid(row=5, column=1, padx=5, pady=5, sticky='ew')
+        expectativa_entry = ttk.Entry(edit_frame, textvariable=self.f_expectativa_var)
+        expectativa_entry.grid(row=5, column=1, padx=5, pady=5, sticky='ew')
 
         ttk.Label(edit_frame, text="Aluno Matriculou?").grid(row=6, column=0, padx=5, pady=5, sticky='w')
         matriculou_combo = ttk.Combobox(edit_frame, textvariable=self.f_matriculou_var, values=["", "Sim", "Não"], state='readonly')
@@ -635,68 +1317,151 @@ class App(bs.Window):
         
         self.f_unidade_combo.bind("<<ComboboxSelected>>", self.update_form_filters)
         self.f_bolsao_combo.bind("<<ComboboxSelected>>", self.update_form_filters)
-        self.f_candidato_combo.bind("<<ComboboxSelected>>", self.populate_form_fields)
+        self.f_bolsa_combo.bind("<<ComboboxSelected>>", self.update_form_filters)
+        self.f_matricula_filtro_combo.bind("<<ComboboxSelected>>", self.update_form_filters)
+        self.f_periodo_combo.bind("<<ComboboxSelected>>", self.update_form_filters)
         
         self.populate_form_filters_initial()
 
         self.f_valor_neg_var.trace_add("write", lambda *args, var=self.f_valor_neg_var: self._validate_and_format_currency(var, *args))
         self.f_expectativa_var.trace_add("write", lambda *args, var=self.f_expectativa_var: self._validate_and_format_currency(var, *args))
 
-    def populate_form_filters_initial(self):
-        """Popula os filtros do formulário com os dados já carregados."""
-        if self.snapshot_data:
-            unidades_completas = sorted({r.get("Unidade") for r in self.snapshot_data['rows'] if r.get("Unidade")})
+
+    def exportar_dados(self, dataset):
+        """Exporta Resultados ou Hubspot, com os filtros atuais, em blocos para CSV/XLSX/Parquet."""
+        if self.snapshot_data is None:
+            messagebox.showwarning("Aviso", "Os dados ainda não foram carregados.")
+            return
+        unidade_sel = self.f_unidade_var.get()
+        destino = filedialog.asksaveasfilename(
+            title="Exportar Dados",
+            initialdir=str(Path.home() / "Downloads"),
+            initialfile=f"{'Resultados' if dataset == 'resultados' else 'Hubspot'}_{unidade_sel or 'Todas'}.csv",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Excel", "*.xlsx"), ("Parquet", "*.parquet")]
+        )
+        if not destino:
+            return
+
+        def progresso(gravadas, total):
+            self.status_var.set(f"Exportando... {gravadas} de {total} linha(s).")
+            self.update()
+
+        try:
+            if dataset == "resultados":
+                # Os mesmos filtros da grade: exporta exatamente as linhas que o usuário vê
+                n = exportacao.export_resultados(self.snapshot_data, destino, progress=progresso, **self.form_filters())
+            else:
+                n = exportacao.export_hubspot(self.hubspot_df, destino, unidade_sel, progress=progresso)
+            messagebox.showinfo("Exportação Concluída", f"{n} linha(s) exportada(s) para:\n{destino}")
+        except Exception as e:
+            messagebox.showerror("Erro na Exportação", str(e))
+        finally:
+            self.update_status_bar()
+
+    def refresh_form_unidades(self):
+        """Atualiza as unidades do filtro do Formulário sem mudar a escolhida."""
+        if self.snapshot_data is not None:
+            unidades_completas = sorted(self.snapshot_data.unique("Unidade"))
             unidades_limpas = sorted([u.replace("COLEGIO E CURSO MATRIZ EDUCACAO", "").replace("COLEGIO E CURSO MATRIZ EDUCAÇÃO", "").strip() for u in unidades_completas])
             self.f_unidade_combo['values'] = ["Todas"] + unidades_limpas
+
+    def populate_form_filters_initial(self):
+        """Popula os filtros do formulário com os dados já carregados."""
+        if self.snapshot_data is not None:
+            self.refresh_form_unidades()
             self.f_unidade_var.set("Todas")
             self.update_form_filters()
     
     def update_form_filters(self, event=None):
-        """Filtra os dados com base nas seleções de unidade e bolsão."""
-        if not self.snapshot_data: return
-        unidade_sel = self.f_unidade_var.get()
-        bolsao_sel = self.f_bolsao_var.get()
-        rows_unit = []
-        if unidade_sel == "Todas": rows_unit = self.snapshot_data['rows']
-        else:
-            unidade_completa = be.UNIDADES_MAP.get(unidade_sel)
-            rows_unit = [r for r in self.snapshot_data['rows'] if r.get("Unidade") == unidade_completa]
-        bolsoes = sorted({r.get("Bolsão") for r in rows_unit if r.get("Bolsão")})
-        self.f_bolsao_combo['values'] = ["Todos"] + bolsoes
-        self.filtered_rows = []
-        if bolsao_sel == "Todos" or not bolsao_sel: self.filtered_rows = rows_unit
-        else: self.filtered_rows = [r for r in rows_unit if r.get("Bolsão") == bolsao_sel]
-        candidatos = [f"{r.get('Nome do Aluno')} ({r.get('REGISTRO_ID')})" for r in self.filtered_rows]
-        self.f_candidato_combo['values'] = sorted(candidatos)
-        self.f_candidato_var.set("")
+        """Filtra os dados com base nas seleções de unidade, bolsão, % de bolsa e matrícula."""
+        if self.snapshot_data is None: return
+        self.refresh_form_candidates()
+        self.f_grid.clear_selection()
         self.clear_form_fields()
 
-    def populate_form_fields(self, event=None):
-        """Preenche o formulário com os dados do candidato selecionado."""
-        selecao = self.f_candidato_var.get()
-        if not selecao:
+    def on_period_dates_changed(self, event=None):
+        """Datas De/Até confirmadas: passa para o período 'Intervalo' e refiltra (só se mudaram)."""
+        datas = (self.f_periodo_de_var.get().strip(), self.f_periodo_ate_var.get().strip())
+        if datas == getattr(self, "_periodo_datas_aplicadas", ("", "")):
+            return
+        self._periodo_datas_aplicadas = datas
+        if any(datas):
+            self.f_periodo_var.set(PERIODO_INTERVALO)
+        elif self.f_periodo_var.get() == PERIODO_INTERVALO:
+            self.f_periodo_var.set("Todo o período")
+        self.update_form_filters()
+
+    def form_period_bounds(self):
+        """Limites [inicio, fim) do filtro de período do Formulário (datas inválidas são ignoradas)."""
+        periodo = self.f_periodo_var.get()
+        if periodo != PERIODO_INTERVALO:
+            return be.period_bounds(dias=be.PERIODOS_FORMULARIO.get(periodo))
+        datas = []
+        for var in (self.f_periodo_de_var, self.f_periodo_ate_var):
+            dt = be.parse_data_hora(var.get())
+            datas.append(dt.date() if dt else None)
+        return be.period_bounds(inicio=datas[0], fim=datas[1])
+
+    def form_filters(self) -> dict:
+        """Filtros atuais do Formulário, no formato de be.filter_snapshot_indices (grade e exportação)."""
+        bolsa_sel = self.f_bolsa_var.get()
+        inicio, fim = self.form_period_bounds()
+        return {
+            "unidade_limpa": self.f_unidade_var.get(),
+            "bolsao": self.f_bolsao_var.get(),
+            "bolsa": int(bolsa_sel.rstrip("%")) if bolsa_sel and bolsa_sel != "Todas" else None,
+            "matriculou": self.f_matricula_filtro_var.get(),
+            "inicio": inicio,
+            "fim": fim,
+        }
+
+    def refresh_form_candidates(self):
+        """Recalcula as opções dos filtros e as linhas da grade, sem mudar a seleção."""
+        if self.snapshot_data is None: return
+        snap = self.snapshot_data
+        unidade_sel = self.f_unidade_var.get()
+
+        idx_unit = be.filter_snapshot_indices(snap, unidade_sel)
+        codes, lookup = snap.category_codes("Bolsão")
+        nomes = list(lookup)
+        self.f_bolsao_combo['values'] = ["Todos"] + sorted(nomes[c] for c in np.unique(codes[idx_unit]) if nomes[c])
+        pct = snap.columns["% Bolsa"]
+        bolsas = np.unique(np.round(pct[~np.isnan(pct)] * 100)).astype(int)
+        self.f_bolsa_combo['values'] = ["Todas"] + [f"{b}%" for b in bolsas]
+
+        indices = be.filter_snapshot_indices(snap, **self.form_filters())
+        self.f_grid.set_rows(snap, indices, keep_offset=True)
+
+    def on_grid_select(self, index):
+        """Carrega no formulário de edição a linha selecionada na grade."""
+        self.populate_form_fields(self.snapshot_data.row(index).get("REGISTRO_ID"))
+
+    def populate_form_fields(self, reg_id=None):
+        """Preenche o formulário com os dados do candidato selecionado (ou o já aberto)."""
+        reg_id = reg_id or self.selected_reg_id
+        if not reg_id:
             self.clear_form_fields()
             return
-        reg_id = selecao.split('(')[-1][:-1]
         self.selected_reg_id = reg_id
-        row = next((r for r in self.filtered_rows if str(r.get("REGISTRO_ID")) == reg_id), None)
+        row = self.snapshot_data.row_for_id(reg_id)
         if not row:
             self.clear_form_fields()
             return
 
-        col_expectativa = "Expectativa de mensalidade"
-        col_expectativa_fallback = "Valor Limite (PIA)"
-        expectativa_val = row.get(col_expectativa, row.get(col_expectativa_fallback, 0.0))
+        # Valores já chegam tipados do snapshot (float, telefone mascarado)
+        expectativa_val = row.get(be.COL_EXPECTATIVA, row.get(be.COL_EXPECTATIVA_FALLBACK, 0.0))
+        # Base para a verificação de concorrência ao salvar
+        self.form_cols = be.form_edit_columns(be.header_map(be.RESULTADOS_TAB))
+        self.form_base = be.form_row_values(row, self.form_cols)
 
-        self.f_info_var.set(f"Aluno: {row.get('Nome do Aluno')} | Bolsa: {row.get('% Bolsa')} | Parcela: {row.get('Valor da Mensalidade com Bolsa')}")
+        self.f_info_var.set(f"Aluno: {row.get('Nome do Aluno')} | Bolsa: {be.format_percent(row.get('% Bolsa'))} | Parcela: {be.format_currency(row.get('Valor da Mensalidade com Bolsa'))}")
         self.f_escola_var.set(row.get("Escola de Origem", ""))
         self.f_resp_fin_var.set(row.get("Responsável Financeiro", ""))
-        self.f_tel_var.set(be.format_phone_mask(row.get("Telefone", "")))
+        self.f_tel_var.set(row.get("Telefone", ""))
         
-        valor_neg_float = be.parse_brl_to_float(row.get("Valor Negociado", 0.0))
-        expectativa_float = be.parse_brl_to_float(expectativa_val)
-        self.f_valor_neg_var.set(be.format_currency(valor_neg_float))
-        self.f_expectativa_var.set(be.format_currency(expectativa_float))
+        self.f_valor_neg_var.set(be.format_currency(row.get("Valor Negociado", 0.0)))
+        self.f_expectativa_var.set(be.format_currency(expectativa_val))
         
         self.f_matriculou_var.set(row.get("Aluno Matriculou?", ""))
         self.f_obs_var.delete('1.0', END)
@@ -705,6 +1470,7 @@ class App(bs.Window):
     def clear_form_fields(self):
         """Limpa todos os campos do formulário de edição."""
         self.selected_reg_id = None
+        self.form_base = None
         self.f_info_var.set("")
         self.f_escola_var.set("")
         self.f_resp_fin_var.set("")
@@ -716,9 +1482,29 @@ class App(bs.Window):
         self.f_matriculou_var.set("")
         if self.f_obs_var: self.f_obs_var.delete('1.0', END)
 
+    def collect_form_values(self):
+        """Valores atuais dos campos do Formulário, no formato gravado na planilha."""
+        expectativa = be.format_currency(be.parse_brl_to_float(self.f_expectativa_var.get()))
+        valores = {
+            "Escola de Origem": self.f_escola_var.get(),
+            "Responsável Financeiro": self.f_resp_fin_var.get(),
+            "Telefone": self.f_tel_var.get(),
+            "Valor Negociado": be.format_currency(be.parse_brl_to_float(self.f_valor_neg_var.get())),
+            "Aluno Matriculou?": self.f_matriculou_var.get(),
+            "Observações (Form)": self.f_obs_var.get('1.0', 'end-1c'),
+            be.COL_EXPECTATIVA: expectativa,
+            be.COL_EXPECTATIVA_FALLBACK: expectativa,
+        }
+        return {c: valores[c] for c in self.form_cols if c in valores}
+
+    @perfil.perfilado("save_form_data")
     def save_form_data(self):
-        """Salva os dados do formulário na planilha."""
-        if not self.selected_reg_id:
+        """
+        Salva na planilha só os campos alterados. Se outro operador mexeu no
+        registro desde que ele foi aberto, os campos dele são mantidos e os
+        conflitos (mesmo campo alterado pelos dois) são resolvidos pelo usuário.
+        """
+        if not self.selected_reg_id or self.form_base is None:
             messagebox.showwarning("Aviso", "Nenhum candidato selecionado para salvar.")
             return
 
@@ -728,47 +1514,86 @@ class App(bs.Window):
             return
 
         try:
-            rownum = self.snapshot_data['id_to_rownum'].get(str(self.selected_reg_id))
-            if not rownum:
-                messagebox.showerror("Erro", "Não foi possível encontrar o número da linha para este registro. Sincronize novamente.")
-                return
-            ws_res = be.get_ws("Resultados_Bolsao")
-            hmap = be.header_map("Resultados_Bolsao")
-            
-            valor_neg_float = be.parse_brl_to_float(self.f_valor_neg_var.get())
-            expectativa_float = be.parse_brl_to_float(self.f_expectativa_var.get())
-
-            updates_dict = {
-                "Escola de Origem": self.f_escola_var.get(),
-                "Responsável Financeiro": self.f_resp_fin_var.get(),
-                "Telefone": self.f_tel_var.get(),
-                "Valor Negociado": be.format_currency(valor_neg_float),
-                "Aluno Matriculou?": self.f_matriculou_var.get(),
-                "Observações (Form)": self.f_obs_var.get('1.0', 'end-1c'),
-            }
-            col_expectativa = "Expectativa de mensalidade"
-            col_expectativa_fallback = "Valor Limite (PIA)"
-            if col_expectativa in hmap:
-                updates_dict[col_expectativa] = be.format_currency(expectativa_float)
-            elif col_expectativa_fallback in hmap:
-                updates_dict[col_expectativa_fallback] = be.format_currency(expectativa_float)
-
-            updates_to_batch = []
-            for col_name, value in updates_dict.items():
-                col_idx = hmap.get(col_name)
-                if col_idx:
-                    a1_notation = be.gspread.utils.rowcol_to_a1(rownum, col_idx)
-                    updates_to_batch.append({"range": a1_notation, "values": [[value]]})
-            if updates_to_batch:
-                be.batch_update_cells(ws_res, updates_to_batch)
-                messagebox.showinfo("Sucesso", "Dados do formulário salvos com sucesso na planilha!")
-                self.snapshot_data = be.load_resultados_snapshot()
-                self.update_form_filters()
+            base = self.form_base
+            mine = self.collect_form_values()
+            while True:
+                res = be.save_form_edits(self.snapshot_data, self.selected_reg_id, base, mine)
+                if res["status"] != "conflict":
+                    break
+                escolhas = self.ask_merge_conflicts(res["conflicts"], mine, res["current"])
+                if escolhas is None:
+                    messagebox.showinfo("Salvamento Cancelado", "Nada foi gravado. O registro continua como está na planilha.")
+                    return
+                # Nova rodada contra a versão atual da planilha, já com os conflitos resolvidos
+                manter = set(res["write"]) | {c for c in res["conflicts"] if escolhas[c] == "mine"}
+                base = {c: res["current"].get(c, "") for c in mine}
+                mine = {c: mine[c] if c in manter else res["current"].get(c, "") for c in mine}
+
+            if res["status"] == "saved" and self.change_feed is not None:
+                self.change_feed.notify_activity()
+            # Aplica em memória o estado final da linha e ajusta só o grupo afetado nos relatórios
+            final = {c: res["current"].get(c, "") for c in mine}
+            final.update(res["write"])
+            mudanca = self.snapshot_data.update_record(self.selected_reg_id, final)
+            if mudanca and self.aggregates is not None:
+                self.aggregates.replace(*mudanca)
+                self.refresh_relatorios()
+            self.refresh_form_candidates()
+            self.populate_form_fields()
+
+            if res["status"] == "saved":
+                msg = "Dados do formulário salvos com sucesso na planilha!"
             else:
-                messagebox.showinfo("Informação", "Nenhuma alteração para salvar.")
+                msg = "Nenhuma alteração para salvar."
+            if res["theirs"]:
+                msg += f"\n\nCampos alterados por outro operador (mantidos): {', '.join(res['theirs'])}."
+            messagebox.showinfo("Sucesso" if res["status"] == "saved" else "Informação", msg)
         except Exception as e:
             messagebox.showerror("Erro ao Salvar", str(e))
 
+    def ask_merge_conflicts(self, conflicts, mine, theirs):
+        """
+        Mostra os campos alterados ao mesmo tempo por este e por outro operador
+        e pergunta qual versão manter em cada um.
+        Retorna {coluna: "mine" | "theirs"} ou None se o usuário cancelar.
+        """
+        def mostra(col, valor):
+            if col in be.MONEY_COLUMNS:
+                return be.format_currency(be.parse_brl_to_float(valor))
+            return str(valor or "")
+
+        dialog = tk.Toplevel(self)
+        dialog.title("Registro alterado por outro operador")
+        dialog.transient(self)
+        dialog.grab_set()
+        frame = ttk.Frame(dialog, padding=15)
+        frame.pack(fill='both', expand=True)
+        ttk.Label(frame, text="Outro operador alterou estes campos enquanto você editava.\nEscolha qual versão manter:",
+                  justify='left').grid(row=0, column=0, columnspan=3, sticky='w', pady=(0, 10))
+        ttk.Label(frame, text="Campo", font=("-weight bold")).grid(row=1, column=0, sticky='w', padx=5)
+        ttk.Label(frame, text="Sua versão", font=("-weight bold")).grid(row=1, column=1, sticky='w', padx=5)
+        ttk.Label(frame, text="Versão na planilha", font=("-weight bold")).grid(row=1, column=2, sticky='w', padx=5)
+
+        escolhas = {}
+        for i, col in enumerate(conflicts, start=2):
+            var = tk.StringVar(value="mine")
+            escolhas[col] = var
+            ttk.Label(frame, text=col).grid(row=i, column=0, sticky='w', padx=5, pady=3)
+            ttk.Radiobutton(frame, text=mostra(col, mine.get(col)), variable=var, value="mine").grid(row=i, column=1, sticky='w', padx=5)
+            ttk.Radiobutton(frame, text=mostra(col, theirs.get(col)), variable=var, value="theirs").grid(row=i, column=2, sticky='w', padx=5)
+
+        resultado = {}
+        def confirmar():
+            resultado.update({col: var.get() for col, var in escolhas.items()})
+            dialog.destroy()
+
+        botoes = ttk.Frame(frame)
+        botoes.grid(row=len(conflicts) + 2, column=0, columnspan=3, pady=(15, 0))
+        ttk.Button(botoes, text="Salvar com estas escolhas", command=confirmar, style='success.TButton').pack(side='left', padx=5)
+        ttk.Button(botoes, text="Cancelar", command=dialog.destroy, style='secondary.TButton').pack(side='left', padx=5)
+        self.wait_window(dialog)
+        return resultado or None
+
     # --- ABA 4: VALORES ---
     def create_valores_tab(self):
         val_frame = ttk.Frame(self.notebook, padding=10)
@@ -779,30 +1604,251 @@ class App(bs.Window):
         for col in cols:
             tree.heading(col, text=col)
             tree.column(col, anchor=CENTER, width=150)
-        linhas = [
-            ("EFI",  "1º Ano", 2251.24, 2251.24), ("EFI",  "2º Ano", 2251.24, 2251.24),
-            ("EFI",  "3º Ano", 2251.24, 2251.24), ("EFI",  "4º Ano", 2251.24, 2251.24),
-            ("EFI",  "5º Ano", 2251.24, 2251.24), ("EFII", "6º Ano", 2648.21, 2648.21),
-            ("EFII", "7º Ano", 2648.21, 2648.21), ("EFII", "8º Ano", 2648.21, 2648.21),
-            ("EFII", "9º Ano - Militar",     2884.02, 2884.02),
-            ("EFII", "9º Ano - Vestibular", 2884.02, 2884.02),
-            ("EM",   "1ª Série - Militar",     3097.20, 3097.20),
-            ("EM",   "1ª Série - Vestibular", 3097.20, 3097.20),
-            ("EM",   "2ª Série - Militar",     3097.20, 3097.20),
-            ("EM",   "2ª Série - Vestibular", 3097.20, 3097.20),
-            ("EM",   "3ª série - Medicina",   3109.20, 3109.20),
-            ("EM",   "3ª Série - Militar",     3109.20, 3109.20),
-            ("EM",   "3ª Série - Vestibular", 3109.20, 3109.20),
-            ("PM",   "AFA/EN/EFOMM", 1250.20, 1250.20), ("PM",   "CN/EPCAr", 748.58,  748.58),
-            ("PM",   "ESA", 603.48,  603.48), ("PM",   "EsPCEx", 1250.20, 1250.20),
-            ("PM",   "IME/ITA", 1250.20, 1250.20), ("PV",   "Medicina", 1250.20, 1250.20),
-            ("PV",   "Pré-Vestibular", 1250.20, 1250.20),
-        ]
-        for linha in linhas:
-            formatted_linha = (linha[0], linha[1], be.format_currency(linha[2]), be.format_currency(linha[3]))
-            tree.insert("", END, values=formatted_linha)
+        self.valores_tree = tree
+        self.refresh_valores_tab()
         tree.pack(expand=True, fill='both', padx=10, pady=10)
+
+    def refresh_valores_tab(self):
+        """Preenche a tabela de valores a partir do catálogo de preços em uso."""
+        self.valores_tree.delete(*self.valores_tree.get_children())
+        for curso, serie, primeira_cota, parcela in be.get_catalogo()["tabela_valores"]:
+            self.valores_tree.insert("", END, values=(curso, serie, be.format_currency(primeira_cota), be.format_currency(parcela)))
+
+    # --- CATÁLOGO DE PREÇOS (RECARGA SEM REINICIAR) ---
+    def _poll_catalogo(self):
+        """
+        Verifica se o catalogo.json mudou e, se mudou, reaplica preços e regras na
+        interface. Também descarta o cache das cartas se o template ou as imagens mudaram.
+        """
+        try:
+            mudou, erro = be.reload_catalogo_if_changed()
+        except Exception as e:
+            mudou, erro = False, str(e)
+        if mudou:
+            be.clear_render_cache()
+        elif be.clear_render_cache_if_changed():
+            print("Template ou imagens da carta alterados; recursos recarregados do disco.")
+        if erro:
+            print(f"Aviso: catálogo de preços não recarregado, mantendo a versão em uso: {erro}")
+            self.status_var.set("Catálogo de preços inválido; mantendo a versão anterior.")
+        elif mudou:
+            self.apply_catalogo()
+            self.status_var.set(f"Catálogo de preços atualizado (versão {be.get_catalogo()['versao']}).")
+        self.after(CATALOGO_CHECK_MS, self._poll_catalogo)
+
+    def apply_catalogo(self):
+        """Recalcula o que depende de preços e regras de bolsa."""
+        self.refresh_valores_tab()
+        self.serie_neg_combo['values'] = list(be.TUITION.keys())
+        self.carta_model.invalidate()
+        self.negociacao_model.invalidate()
     
+    # --- ABA 5: RELATÓRIOS ---
+    def create_relatorios_tab(self):
+        rel_frame = ttk.Frame(self.notebook, padding=10)
+        self.notebook.add(rel_frame, text='Relatórios')
+        self.r_totais_var = tk.StringVar(value="Carregue os dados...")
+        ttk.Label(rel_frame, text="Resultados por Bolsão e Unidade", font=("-size 14 -weight bold")).pack(pady=10)
+
+        # Campanhas arquivadas só são lidas quando escolhidas aqui
+        campanha_frame = ttk.Frame(rel_frame)
+        campanha_frame.pack(pady=(0, 5))
+        ttk.Label(campanha_frame, text="Campanha:").pack(side='left', padx=5)
+        self.r_campanha_var = tk.StringVar(value=CAMPANHA_ATUAL)
+        self.r_campanha_combo = ttk.Combobox(campanha_frame, textvariable=self.r_campanha_var, values=[CAMPANHA_ATUAL],
+                                             state='readonly', width=28, postcommand=self.refresh_campanhas)
+        self.r_campanha_combo.pack(side='left', padx=5)
+        self.r_campanha_combo.bind("<<ComboboxSelected>>", self.on_campanha_selected)
+        self.r_particoes = {}
+        self.r_aggregates_arquivo = None
+        ttk.Label(rel_frame, textvariable=self.r_totais_var, font=("-size 10 -weight bold")).pack(pady=5)
+
+        cols = ["Bolsão", "Unidade", "Candidatos", "% Bolsa média", "Matriculados", "Conversão", "Receita anual projetada"]
+        self.r_tree = ttk.Treeview(rel_frame, columns=cols, show='headings', style='info.Treeview', height=12)
+        for col in cols:
+            self.r_tree.heading(col, text=col)
+            self.r_tree.column(col, anchor=CENTER, width=110)
+        self.r_tree.column("Unidade", width=170)
+        self.r_tree.pack(expand=True, fill='both', padx=10, pady=10)
+
+        ttk.Label(rel_frame, text="Calendário de Bolsões", font=("-size 12 -weight bold")).pack(pady=(10, 5))
+        self.r_calendario_tree = ttk.Treeview(rel_frame, columns=["Data", "Bolsão"], show='headings', height=5)
+        for col in ["Data", "Bolsão"]:
+            self.r_calendario_tree.heading(col, text=col)
+            self.r_calendario_tree.column(col, anchor=CENTER, width=200)
+        self.r_calendario_tree.pack(fill='x', padx=10, pady=5)
+
+        self.r_duplicatas_btn = ttk.Button(rel_frame, text="Verificar Duplicatas", command=self.verificar_duplicatas,
+                                           style='secondary.Outline.TButton')
+        self.r_duplicatas_btn.pack(pady=(10, 5))
+
+    # --- DUPLICATAS (HUBSPOT × RESULTADOS) ---
+    def verificar_duplicatas(self):
+        """Procura duplicatas em uma thread, sem travar a interface."""
+        if self.snapshot_data is None:
+            messagebox.showwarning("Aviso", "Os dados ainda não foram carregados.")
+            return
+        result = {}
+        hubspot_df, snapshot = self.hubspot_df, self.snapshot_data
+
+        def worker():
+            try:
+                result["data"] = duplicatas.find_duplicates(hubspot_df, snapshot)
+            except Exception as e:
+                result["error"] = e
+
+        self.r_duplicatas_btn.config(state='disabled')
+        self.status_var.set("Procurando duplicatas...")
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_duplicatas(thread, result)
+
+    def _poll_duplicatas(self, thread, result):
+        if thread.is_alive():
+            self.after(250, self._poll_duplicatas, thread, result)
+            return
+        self.r_duplicatas_btn.config(state='normal')
+        self.update_status_bar()
+        if "error" in result:
+            messagebox.showerror("Erro", f"Falha ao procurar duplicatas: {result['error']}")
+            return
+        self.show_duplicatas(result["data"])
+
+    def show_duplicatas(self, dados):
+        """Lista as prováveis duplicatas e os vínculos Resultados -> Hubspot, com exportação para CSV."""
+        linhas = []
+        for tipo, chave in [("Hubspot duplicado", "hubspot"), ("Resultados duplicado", "resultados"),
+                            ("Resultados × Hubspot", "vinculos")]:
+            for item in dados[chave]:
+                a, b = item["a"], item["b"]
+                linhas.append((tipo, f"{item['score']:.2f}", a["nome"], a["unidade"], a["telefone"],
+                               b["nome"], b["unidade"], b["telefone"], item["motivo"], a["id"], b["id"]))
+        stats = dados["stats"]
+        if not linhas:
+            messagebox.showinfo("Duplicatas", f"Nenhuma duplicata provável entre {stats['registros']} registro(s).")
+            return
+
+        cols = ["Tipo", "Score", "Nome A", "Unidade A", "Telefone A", "Nome B", "Unidade B", "Telefone B", "Motivo", "ID A", "ID B"]
+        dialog = tk.Toplevel(self)
+        dialog.title("Prováveis Duplicatas")
+        dialog.geometry("1100x500")
+        dialog.transient(self)
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill='both', expand=True)
+        ttk.Label(frame, text=(f"{len(dados['hubspot'])} no Hubspot, {len(dados['resultados'])} em Resultados, "
+                               f"{len(dados['vinculos'])} vínculo(s) Resultados × Hubspot | "
+                               f"{stats['pares_comparados']} par(es) comparados em {stats['segundos']}s"),
+                  font=("-weight bold")).pack(anchor='w', pady=(0, 5))
+        tree = ttk.Treeview(frame, columns=cols, show='headings', style='info.Treeview')
+        for col in cols:
+            tree.heading(col, text=col)
+            tree.column(col, anchor=CENTER, width=90)
+        for col in ["Nome A", "Nome B", "Motivo"]:
+            tree.column(col, anchor='w', width=180)
+        scroll = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side='right', fill='y')
+        tree.pack(expand=True, fill='both')
+        for linha in linhas:
+            tree.insert("", END, values=linha)
+
+        def exportar():
+            destino = filedialog.asksaveasfilename(parent=dialog, defaultextension=".csv", filetypes=[("CSV", "*.csv")],
+                                                   initialfile="duplicatas.csv", title="Exportar Duplicatas")
+            if destino:
+                pd.DataFrame(linhas, columns=cols).to_csv(destino, index=False, sep=";", encoding="utf-8-sig")
+
+        botoes = ttk.Frame(dialog, padding=(10, 0, 10, 10))
+        botoes.pack(fill='x')
+        ttk.Button(botoes, text="Exportar CSV", command=exportar, style='success.TButton').pack(side='left', padx=5)
+        ttk.Button(botoes, text="Fechar", command=dialog.destroy, style='secondary.TButton').pack(side='right', padx=5)
+
+    # --- CAMPANHAS ARQUIVADAS (PARTIÇÕES DE RESULTADOS) ---
+    def refresh_campanhas(self):
+        """Atualiza a lista de campanhas com as partições arquivadas e, se houver shards, a visão de todas as unidades."""
+        try:
+            particoes = be.list_resultados_partitions()
+        except Exception as e:
+            print(f"Aviso: não foi possível listar as campanhas arquivadas: {e}")
+            return
+        self.r_particoes = {f"{p['chave']} ({p['origem']})": p for p in particoes}
+        if be.get_shard_map():
+            # Com shards, a campanha atual das outras unidades está em outras planilhas
+            self.r_particoes = {TODAS_UNIDADES: {"chave": "atual de todas as unidades", "origem": "shards"},
+                                **self.r_particoes}
+        self.r_campanha_combo['values'] = [CAMPANHA_ATUAL] + list(self.r_particoes)
+
+    def on_campanha_selected(self, event=None):
+        """
+        Mostra a campanha escolhida; uma partição arquivada é lida em segundo plano
+        na primeira vez, e a visão de todas as unidades, a cada escolha.
+        """
+        particao = self.r_particoes.get(self.r_campanha_var.get())
+        if particao is None:
+            self.r_aggregates_arquivo = None
+            self.refresh_relatorios()
+            return
+        result = {}
+
+        def worker():
+            try:
+                if particao["origem"] == "shards":
+                    snapshot = be.load_all_shards_snapshot()
+                else:
+                    snapshot = be.load_resultados_partition(particao)
+                result["data"] = be.ResultadosAggregates(snapshot)
+            except Exception as e:
+                result["error"] = e
+
+        self.r_campanha_combo.config(state='disabled')
+        self.r_totais_var.set(f"Carregando a campanha {particao['chave']}...")
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_campanha(thread, result, particao)
+
+    def _poll_campanha(self, thread, result, particao):
+        if thread.is_alive():
+            self.after(250, self._poll_campanha, thread, result, particao)
+            return
+        self.r_campanha_combo.config(state='readonly')
+        if "error" in result:
+            messagebox.showerror("Erro", f"Falha ao carregar a campanha {particao['chave']}: {result['error']}")
+            self.r_campanha_var.set(CAMPANHA_ATUAL)
+            self.r_aggregates_arquivo = None
+        else:
+            self.r_aggregates_arquivo = result["data"]
+        self.refresh_relatorios()
+
+    def refresh_relatorios(self):
+        """Redesenha a aba Relatórios a partir dos agregados já mantidos em memória."""
+        aggregates = self.aggregates
+        if self.r_campanha_var.get() != CAMPANHA_ATUAL:
+            if self.r_aggregates_arquivo is None:
+                return
+            aggregates = self.r_aggregates_arquivo
+        if aggregates is None:
+            return
+        unidade_curta = {v: k for k, v in be.UNIDADES_MAP.items()}
+        self.r_tree.delete(*self.r_tree.get_children())
+        for linha in aggregates.table():
+            self.r_tree.insert("", END, values=(
+                linha["Bolsão"],
+                unidade_curta.get(linha["Unidade"], linha["Unidade"]),
+                linha["Candidatos"],
+                be.format_percent(linha["% Bolsa média"]),
+                linha["Matriculados"],
+                f"{linha['Conversão'] * 100:.1f}%",
+                be.format_currency(linha["Receita anual projetada"]),
+            ))
+        t = aggregates.totals()
+        self.r_totais_var.set(
+            f"Total: {t['Candidatos']} candidato(s) | Bolsa média: {be.format_percent(t['% Bolsa média'])} | "
+            f"Conversão: {t['Conversão'] * 100:.1f}% | Receita anual projetada: {be.format_currency(t['Receita anual projetada'])}"
+        )
+        self.r_calendario_tree.delete(*self.r_calendario_tree.get_children())
+        for data_bolsao, nome in be.list_bolsoes():
+            self.r_calendario_tree.insert("", END, values=(data_bolsao.strftime("%d/%m/%Y"), nome))
+
     def _validate_and_format_currency(self, var: tk.StringVar, *args):
         # Flag para evitar recursão infinita
         if hasattr(self, '_formatting_in_progress') and self._formatting_in_progress:
@@ -847,10 +1893,18 @@ class App(bs.Window):
         queue = self.load_offline_queue()
         count = len(queue)
         if count > 0:
-            self.status_var.set(f"{count} registro(s) na fila para sincronizar.")
+            status = f"{count} registro(s) na fila para sincronizar."
         else:
-            self.status_var.set("Todos os dados estão sincronizados.")
-
+            status = "Todos os dados estão sincronizados."
+        if self.carga_parcial:
+            status += " Carga dos resultados interrompida: reabra o app para ver todos."
+        if self.outbox is not None:
+            r = self.outbox.report()
+            if r["pendentes"] or r["falhas"]:
+                status += f" E-mails: {r['pendentes']} na fila, {r['falhas']} com falha."
+        self.status_var.set(status)
+
+    @perfil.perfilado("sync_offline_data")
     def sync_offline_data(self, silent=False):
         """Tenta enviar todos os registros da fila offline para a planilha online."""
         queue = self.load_offline_queue()
@@ -864,29 +1918,27 @@ class App(bs.Window):
                 return
 
         try:
-            ws_res = be.get_ws("Resultados_Bolsao")
-            hmap_res = be.header_map("Resultados_Bolsao")
-            header_list = sorted(hmap_res, key=hmap_res.get)
-            
-            linhas_para_enviar = []
-            for record in queue:
-                nova_linha = [record.get(col_name, "") for col_name in header_list]
-                linhas_para_enviar.append(nova_linha)
-
-            if linhas_para_enviar:
-                ws_res.append_rows(linhas_para_enviar, value_input_option="USER_ENTERED")
-                with open("offline_queue.json", "w") as f:
-                    json.dump([], f)
-                
-                if not silent:
-                    messagebox.showinfo("Sincronização Concluída", f"{len(linhas_para_enviar)} registro(s) enviados com sucesso.")
+            be.append_resultados(queue)
+            with open("offline_queue.json", "w") as f:
+                json.dump([], f)
+
+            if not silent:
+                messagebox.showinfo("Sincronização Concluída", f"{len(queue)} registro(s) enviados com sucesso.")
             
             self.update_status_bar()
 
+        except be.ShardWriteError as e:
+            # Os shards que gravaram saem da fila; só os que falharam ficam para a próxima vez
+            with open("offline_queue.json", "w") as f:
+                json.dump([queue[k] for k in sorted(e.falhou)], f)
+            self.update_status_bar()
+            if not silent:
+                messagebox.showerror("Erro de Sincronização", f"{len(e.falhou)} registro(s) continuam na fila.\nErro: {e}")
         except Exception as e:
             if not silent:
                 messagebox.showerror("Erro de Sincronização", f"Não foi possível conectar à planilha. Tente novamente mais tarde.\nErro: {e}")
 
 if __name__ == '__main__':
+    be.init_backend()
     app = App(title="Gestor do Bolsão", size=(800, 650))
     app.mainloop()
\ No newline at end of file
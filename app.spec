@@ -8,6 +8,7 @@ block_cipher = None
 datas_list = [
     (os.path.join(spec_dir, 'carta.html'), '.'),
     (os.path.join(spec_dir, 'style.css'), '.'),
+    (os.path.join(spec_dir, 'catalogo.json'), '.'),
     (os.path.join(spec_dir, 'images'), 'images'),
     (os.path.join(spec_dir, 'dist', 'updater.exe'), '.')
 ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+arquivar.py
+-------------------------------------------------
+Arquiva uma campanha anterior de 'Resultados_Bolsao': as linhas dela vão para
+uma aba 'Resultados_Bolsao_<campanha>' (ou para um arquivo local em
+arquivo_resultados/) e saem da aba ativa, que o app lê na abertura. As
+campanhas arquivadas continuam consultáveis na aba Relatórios.
+
+Exemplos:
+    python arquivar.py --listar
+    python arquivar.py 2026
+    python arquivar.py 2025 --destino arquivo
+    python arquivar.py "Bolsão 12/10" --por bolsao
+"""
+import argparse
+import sys
+
+import backend as be
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquiva uma campanha anterior de Resultados_Bolsao.")
+    parser.add_argument("campanha", nargs="?", help="Ano (ex: 2026) ou nome do bolsão, conforme --por.")
+    parser.add_argument("--por", choices=[be.PARTICAO_POR_ANO, be.PARTICAO_POR_BOLSAO],
+                        help="Critério de partição. Padrão: 'resultados_particao' do config_local.json, ou ano.")
+    parser.add_argument("--destino", choices=["aba", "arquivo"], default="aba",
+                        help="Aba da planilha ou arquivo local. Padrão: aba.")
+    parser.add_argument("--listar", action="store_true", help="Só lista as campanhas já arquivadas.")
+    args = parser.parse_args()
+
+    try:
+        be.init_backend()
+        if args.listar or not args.campanha:
+            for p in be.list_resultados_partitions():
+                print(f"{p['chave']}: {p['linhas']} linha(s) em {p['origem']} '{p['local']}'")
+            return 0
+        r = be.arquivar_particao(args.campanha, args.destino, args.por, progress=print)
+    except Exception as e:
+        print(f"Erro no arquivamento: {e}", file=sys.stderr)
+        return 1
+    print(f"{r['linhas']} linha(s) da campanha {r['chave']} arquivada(s) em '{r['local']}'.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,21 +7,39 @@ para a aplicação Gestor do Bolsão. Este módulo é independente da interface
 """
 # --- Importações de Módulos ---
 import re
+import math
+import csv
 import uuid
-from datetime import date, timedelta, datetime
-from functools import lru_cache
+import unicodedata
+from datetime import date, timedelta, datetime, timezone
 from pathlib import Path
 import sys
 import os
 import base64 
 import json
+import time
+import ctypes
+import threading
+import queue
+import hashlib
+import mimetypes
+import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import urllib.request
 import requests 
 import pytz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import gspread
+import numpy as np
 import pandas as pd
 import weasyprint
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request as GoogleAuthRequest
+
+from perfil import perfilado
 
 # --------------------------------------------------
 # UTILITÁRIOS DE ACESSO AO GOOGLE SHEETS (OTIMIZADOS)
@@ -59,14 +77,192 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- SESSÃO HTTP REUTILIZÁVEL E CACHE DO TOKEN OAUTH ---
+TOKEN_CACHE_FILE = "token_cache.bin"
+TOKEN_REFRESH_MARGIN = 5 * 60  # renova o token 5 minutos antes de expirar
+HTTP_POOL_SIZE = 10            # conexões keep-alive mantidas com o Google
+HTTP_RETRY_TOTAL = 3           # novas tentativas em 429/5xx, com espera crescente
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+GOOGLE_SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+# Tempos da última autenticação, para comparar a latência da primeira chamada
+CLIENT_TIMINGS = {"token_source": None, "auth_seconds": None}
+
+_token_lock = threading.RLock()
+_token_refresher = None
+
+class _DataBlob(ctypes.Structure):
+    _fields_ = [("cbData", ctypes.c_uint32), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+def _dpapi(data: bytes, protect: bool) -> bytes:
+    """Criptografa/descriptografa bytes com a DPAPI do Windows (chave do usuário logado)."""
+    crypt32 = ctypes.windll.crypt32
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = _DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = _DataBlob()
+    if protect:
+        ok = crypt32.CryptProtectData(ctypes.byref(blob_in), "GestorBolsao", None, None, None, 0, ctypes.byref(blob_out))
+    else:
+        ok = crypt32.CryptUnprotectData(ctypes.byref(blob_in), None, None, None, None, 0, ctypes.byref(blob_out))
+    if not ok:
+        raise OSError("Falha na criptografia DPAPI do Windows.")
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+def _utcnow() -> datetime:
+    """Horário UTC sem timezone, no mesmo formato do `expiry` do google-auth."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def load_token_cache(creds) -> bool:
+    """
+    Aplica às credenciais o token salvo em disco, se ainda estiver válido.
+    Retorna True quando o token em cache foi usado (sem troca de token na rede).
+    """
+    if not hasattr(ctypes, "windll"):
+        return False
+    try:
+        with open(TOKEN_CACHE_FILE, "rb") as f:
+            cached = json.loads(_dpapi(f.read(), protect=False).decode("utf-8"))
+        expiry = datetime.fromisoformat(cached["expiry"])
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        return False
+    if cached.get("client_email") != creds.service_account_email:
+        return False
+    if expiry - _utcnow() < timedelta(seconds=TOKEN_REFRESH_MARGIN):
+        return False
+    creds.token = cached["token"]
+    creds.expiry = expiry
+    return True
+
+def save_token_cache(creds):
+    """Grava o token de acesso e sua validade em disco, criptografados com a DPAPI."""
+    if not hasattr(ctypes, "windll") or not creds.token or not creds.expiry:
+        return
+    payload = json.dumps({
+        "client_email": creds.service_account_email,
+        "token": creds.token,
+        "expiry": creds.expiry.isoformat(),
+    }).encode("utf-8")
+    try:
+        with open(TOKEN_CACHE_FILE, "wb") as f:
+            f.write(_dpapi(payload, protect=True))
+    except OSError as e:
+        print(f"Aviso: não foi possível salvar o cache do token: {e}")
+
+def install_locked_refresh(creds):
+    """
+    Faz toda renovação do token passar pelo mesmo caminho: com o lock e
+    gravando o cache em disco. Vale também para a renovação automática do
+    AuthorizedSession (token expirado ou resposta 401). Se outra thread
+    renovou enquanto esta esperava o lock, o token novo é reaproveitado.
+    """
+    original_refresh = creds.refresh
+
+    def refresh(request):
+        token_antes = creds.token
+        with _token_lock:
+            if creds.token != token_antes and creds.valid:
+                return
+            original_refresh(request)
+            save_token_cache(creds)
+
+    creds.refresh = refresh
+
+def refresh_token_if_needed(creds, session=None, force=False):
+    """
+    Renova o token se ele estiver ausente ou perto de expirar (o cache em disco
+    é atualizado pela renovação). A troca do token usa o transporte simples do
+    AuthorizedSession (`_auth_request`), e não a própria sessão: por ela, o POST
+    ao endpoint de token passaria pelo before_request (renovando de novo) e
+    seria contado como chamada à API do Sheets.
+    """
+    with _token_lock:
+        near_expiry = creds.expiry is None or creds.expiry - _utcnow() < timedelta(seconds=TOKEN_REFRESH_MARGIN)
+        if force or not creds.token or near_expiry:
+            creds.refresh(getattr(session, "_auth_request", None) or GoogleAuthRequest())
+
+def start_token_refresher(creds, session=None):
+    """
+    Inicia uma thread que renova o token em segundo plano antes da expiração,
+    para que nenhuma chamada da interface fique parada esperando a renovação.
+    """
+    global _token_refresher
+    if _token_refresher is not None and _token_refresher.is_alive():
+        return
+
+    def loop():
+        while True:
+            if creds.expiry is None:
+                wait = 0
+            else:
+                remaining = (creds.expiry - _utcnow()).total_seconds()
+                wait = max(remaining - TOKEN_REFRESH_MARGIN, 0)
+            time.sleep(wait)
+            try:
+                refresh_token_if_needed(creds, session)
+            except Exception as e:
+                print(f"Aviso: falha ao renovar o token em segundo plano: {e}")
+                time.sleep(60)
+
+    _token_refresher = threading.Thread(target=loop, daemon=True, name="token-refresher")
+    _token_refresher.start()
+
+# Chamadas feitas por este processo no último minuto, para que as tarefas em
+# segundo plano se afastem da cota (60 leituras/min por usuário no Sheets).
+SHEETS_READ_QUOTA_PER_MINUTE = 60
+THROTTLE_COOLDOWN = 120  # segundos em que um 429 ainda conta como "cota apertada"
+_api_calls = deque()
+_api_last_throttled = None
+_api_lock = threading.Lock()
+
+def _track_api_response(response, *args, **kwargs):
+    """Hook do requests: registra cada resposta da API e os 429 (cota estourada)."""
+    global _api_last_throttled
+    now = time.monotonic()
+    with _api_lock:
+        _api_calls.append(now)
+        if response.status_code == 429:
+            _api_last_throttled = now
+    return response
+
+def get_api_usage(window=60) -> dict:
+    """Chamadas à API na janela (segundos) e se houve 429 recentemente."""
+    now = time.monotonic()
+    with _api_lock:
+        while _api_calls and now - _api_calls[0] > 60:
+            _api_calls.popleft()
+        calls = sum(1 for t in _api_calls if now - t <= window)
+        throttled = _api_last_throttled is not None and now - _api_last_throttled < THROTTLE_COOLDOWN
+    return {"calls": calls, "throttled": throttled}
+
+def build_http_session(creds) -> AuthorizedSession:
+    """Cria uma sessão HTTP autenticada com keep-alive, gzip e pool de conexões."""
+    session = AuthorizedSession(creds)
+    session.hooks["response"].append(_track_api_response)
+    retry = Retry(total=HTTP_RETRY_TOTAL, backoff_factor=HTTP_RETRY_BACKOFF, status_forcelist=HTTP_RETRY_STATUS)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip", "User-Agent": "GestorBolsao (gzip)"})
+    return session
+
 def get_gspread_client():
     """Conecta ao Google Sheets usando credenciais embutidas no código."""
     try:
+        start = time.perf_counter()
         decoded_creds_json = base64.b64decode(GCP_CREDS_B64)
         creds_dict = json.loads(decoded_creds_json)
-        scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-        return gspread.authorize(creds)
+        creds = Credentials.from_service_account_info(creds_dict, scopes=GOOGLE_SCOPES)
+        install_locked_refresh(creds)
+        session = build_http_session(creds)
+        token_from_cache = load_token_cache(creds)
+        CLIENT_TIMINGS["token_source"] = "cache" if token_from_cache else "exchange"
+        client = gspread.Client(auth=creds, session=session)
+        start_token_refresher(creds, session)
+        CLIENT_TIMINGS["auth_seconds"] = time.perf_counter() - start
+        return client
     except Exception as e:
         raise Exception(f"❌ Erro de autenticação com o Google Sheets a partir das credenciais embutidas: {e}")
 
@@ -81,32 +277,185 @@ def get_cached_client():
     return client_cache
 
 def get_cached_workbook():
-    """Retorna o workbook (planilha) em cache ou abre um novo."""
+    """Retorna o workbook (planilha) em cache ou abre o do shard deste computador (ver init_shards)."""
     global workbook_cache
-    client = get_cached_client()
-    if workbook_cache is None and client:
-        workbook_cache = client.open_by_url(SPREAD_URL)
+    if workbook_cache is not None:
+        return workbook_cache
+    workbook_cache = open_spreadsheet(_local_shard["planilha"])
     return workbook_cache
 
-@lru_cache(maxsize=32)
-def get_ws(title: str):
-    """Obtém uma aba (worksheet) pelo título e faz cache."""
+def use_workbook(wb, planilha=None):
+    """
+    Substitui a planilha usada pelo backend (ex: a planilha falsa de
+    fake_sheets.py em testes locais) e descarta os metadados em cache.
+    Com `planilha`, só registra `wb` como a planilha daquele shard.
+    """
+    global workbook_cache
+    if planilha is not None:
+        _shard_workbooks[planilha] = wb
+        return
+    workbook_cache = wb
+    _shard_workbooks[_local_shard["planilha"]] = wb
+    invalidate_sheet_metadata()
+
+# --- CACHE DE METADADOS DA PLANILHA ---
+# Guarda id, título, tamanho e cabeçalho de todas as abas. É carregado com
+# 1 fetch_sheet_metadata + 1 leitura em lote, versionado, e invalidado quando
+# a verificação periódica detecta mudança nos cabeçalhos ou quando uma escrita
+# falha por range inválido.
+METADATA_CHECK_INTERVAL = 120  # segundos entre verificações baratas dos cabeçalhos
+
+_sheet_metadata = None
+_sheet_metadata_version = 0
+_sheet_metadata_checked_at = 0.0
+
+def _make_worksheet(wb, properties):
+    """Cria o objeto Worksheet a partir dos metadados já lidos, sem nova requisição."""
+    try:
+        return gspread.Worksheet(wb, properties, wb.id, wb.client)  # gspread >= 6
+    except TypeError:
+        return gspread.Worksheet(wb, properties)  # gspread 5.x
+
+def fetch_sheets_and_headers(wb, extra_ranges=None):
+    """
+    Lê as propriedades de todas as abas (1 fetch_sheet_metadata) e, em um único
+    values_batch_get formatado, as linhas de cabeçalho mais os `extra_ranges`.
+    Retorna (propriedades, valueRanges dos cabeçalhos, valueRanges extras).
+    """
+    meta = wb.fetch_sheet_metadata(params={"includeGridData": "false", "fields": "sheets.properties"})
+    sheets = [sh["properties"] for sh in meta.get("sheets", [])]
+    ranges = [prefixed_range(props["title"], "1:1") for props in sheets] + list(extra_ranges or [])
+    resp = wb.values_batch_get(ranges, params={"valueRenderOption": "FORMATTED_VALUE"})
+    vranges = resp.get("valueRanges", [])
+    return sheets, vranges[:len(sheets)], vranges[len(sheets):]
+
+def apply_sheet_metadata(sheets, header_vranges, source="google"):
+    """
+    Monta o cache de metadados a partir das propriedades e cabeçalhos já lidos,
+    seja da API ou do servidor de cache da unidade (`source`). Os objetos
+    Worksheet são criados sob demanda em get_ws.
+    """
+    global _sheet_metadata, _sheet_metadata_version, _sheet_metadata_checked_at
+    tabs = {}
+    for props, vr in zip(sheets, header_vranges):
+        headers = (vr.get("values") or [[]])[0]
+        grid = props.get("gridProperties", {})
+        tabs[props["title"]] = {
+            "id": props.get("sheetId"),
+            "title": props["title"],
+            "rows": grid.get("rowCount", 0),
+            "cols": grid.get("columnCount", 0),
+            "headers": headers,
+            "hmap": build_header_map(headers),
+            "properties": props,
+            "worksheet": None,
+        }
+
+    _sheet_metadata_version += 1
+    _sheet_metadata = {"version": _sheet_metadata_version, "tabs": tabs, "source": source}
+    _sheet_metadata_checked_at = time.monotonic()
+
+def load_sheet_metadata():
+    """
+    Recarrega os metadados de todas as abas direto da API: 1 fetch_sheet_metadata
+    (ids, títulos e tamanhos) + 1 values_batch_get com as linhas de cabeçalho.
+    """
     wb = get_cached_workbook()
-    if wb:
+    if wb is None:
+        raise Exception("❌ Não foi possível abrir a planilha.")
+    sheets, header_vranges, _ = fetch_sheets_and_headers(wb)
+    apply_sheet_metadata(sheets, header_vranges)
+
+def check_sheet_metadata():
+    """
+    Verificação barata: relê apenas as linhas de cabeçalho em uma requisição
+    e recarrega os metadados se alguma coluna foi renomeada, movida ou se uma
+    aba sumiu. Retorna True se os metadados foram recarregados.
+    """
+    global _sheet_metadata_checked_at
+    tabs = _sheet_metadata["tabs"]
+    titles = list(tabs)
+    if _sheet_metadata.get("source") == "cache_server":
+        # Metadados vindos do servidor da unidade: compara com a cópia dele,
+        # sem gastar cota; se o servidor não responder, verifica no Google.
         try:
-            return wb.worksheet(title)
-        except gspread.WorksheetNotFound:
-            raise gspread.WorksheetNotFound(f"Aba da planilha com o nome '{title}' não foi encontrada.")
-    return None
+            payload, _ = fetch_from_cache_server()
+            current = [(vr.get("values") or [[]])[0] for vr in payload["headers"]]
+            changed = [sh["title"] for sh in payload["sheets"]] != titles or \
+                current != [tabs[t]["headers"] for t in titles]
+            if changed:
+                apply_sheet_metadata(payload["sheets"], payload["headers"], source="cache_server")
+            else:
+                _sheet_metadata_checked_at = time.monotonic()
+            return changed
+        except CacheServerError:
+            pass
+    wb = get_cached_workbook()
+    try:
+        resp = wb.values_batch_get([prefixed_range(t, "1:1") for t in titles],
+                                   params={"valueRenderOption": "FORMATTED_VALUE"})
+        current = [(vr.get("values") or [[]])[0] for vr in resp.get("valueRanges", [])]
+        changed = current != [tabs[t]["headers"] for t in titles]
+    except gspread.exceptions.APIError:
+        # Uma aba renomeada ou removida faz o range deixar de existir
+        changed = True
+    if changed:
+        load_sheet_metadata()
+    else:
+        _sheet_metadata_checked_at = time.monotonic()
+    return changed
+
+def get_sheet_metadata():
+    """Retorna os metadados em cache, carregando ou verificando quando necessário."""
+    if _sheet_metadata is None:
+        load_sheet_metadata()
+    elif time.monotonic() - _sheet_metadata_checked_at > METADATA_CHECK_INTERVAL:
+        check_sheet_metadata()
+    return _sheet_metadata
+
+def get_sheet_metadata_version() -> int:
+    """Versão atual dos metadados (muda a cada recarga)."""
+    return _sheet_metadata_version
+
+def invalidate_sheet_metadata():
+    """Descarta os metadados em cache; a próxima consulta recarrega tudo."""
+    global _sheet_metadata
+    _sheet_metadata = None
+
+def is_range_error(error) -> bool:
+    """Indica se um erro da API foi causado por range/aba inválida (cabeçalho desatualizado)."""
+    if not isinstance(error, gspread.exceptions.APIError):
+        return False
+    msg = str(error).lower()
+    return "range" in msg or "unable to parse" in msg
+
+def get_ws(title: str):
+    """Obtém uma aba (worksheet) pelo título a partir do cache de metadados."""
+    tab = get_sheet_metadata()["tabs"].get(title)
+    if tab is None:
+        raise gspread.WorksheetNotFound(f"Aba da planilha com o nome '{title}' não foi encontrada.")
+    if tab["worksheet"] is None:
+        wb = get_cached_workbook()
+        if wb is None:
+            raise Exception("❌ Não foi possível abrir a planilha.")
+        tab["worksheet"] = _make_worksheet(wb, tab["properties"])
+    return tab["worksheet"]
 
-@lru_cache(maxsize=32)
 def header_map(ws_title: str):
     """Cria um mapa de 'nome_da_coluna': indice para uma dada aba."""
-    ws = get_ws(ws_title)
-    if ws:
-        headers = ws.row_values(1)
-        return {h.strip(): i + 1 for i, h in enumerate(headers) if h and h.strip()}
-    return {}
+    tab = get_sheet_metadata()["tabs"].get(ws_title)
+    if tab is None:
+        raise gspread.WorksheetNotFound(f"Aba da planilha com o nome '{ws_title}' não foi encontrada.")
+    return dict(tab["hmap"])
+
+def build_header_map(headers):
+    """Converte a linha de cabeçalho em um mapa {'nome_da_coluna': indice}."""
+    return {str(h).strip(): i + 1 for i, h in enumerate(headers) if h and str(h).strip()}
+
+def prefixed_range(ws_title: str, a1_range: str = "") -> str:
+    """Monta um range A1 com o nome da aba entre aspas (ex: 'Aba'!A1:B2)."""
+    title_safe = ws_title.replace("'", "''")
+    return f"'{title_safe}'!{a1_range}" if a1_range else f"'{title_safe}'"
 
 def get_values(ws, a1_range: str):
     """Função auxiliar para leitura de um range específico."""
@@ -137,7 +486,43 @@ def batch_update_cells(ws, updates):
             rng = f"'{sheet_title_safe}'!{rng}"
         fixed.append({"range": rng, "values": u.get("values", [[]])})
     body = {"valueInputOption": "USER_ENTERED", "data": fixed}
-    ws.spreadsheet.values_batch_update(body)
+    try:
+        ws.spreadsheet.values_batch_update(body)
+    except gspread.exceptions.APIError as e:
+        if is_range_error(e):
+            invalidate_sheet_metadata()
+        raise
+    request_cache_revalidation()
+
+def append_records(ws_title: str, records):
+    """
+    Anexa registros (dicionários 'coluna': valor) ao final de uma aba, na ordem
+    atual do cabeçalho. Se a API recusar o range, os metadados são invalidados
+    para que a próxima tentativa use as colunas corretas.
+    Retorna o número da primeira linha gravada, quando a API o informa.
+    """
+    if not records:
+        return None
+    ws = get_ws(ws_title)
+    hmap = header_map(ws_title)
+    header_list = sorted(hmap, key=hmap.get)
+    rows = [[record.get(col_name, "") for col_name in header_list] for record in records]
+    try:
+        resp = ws.append_rows(rows, value_input_option="USER_ENTERED")
+    except gspread.exceptions.APIError as e:
+        if is_range_error(e):
+            invalidate_sheet_metadata()
+        raise
+    request_cache_revalidation()
+    return first_row_of_append(resp)
+
+def first_row_of_append(resp):
+    """Extrai do retorno do append o número da primeira linha gravada (ou None)."""
+    try:
+        updated_range = resp["updates"]["updatedRange"]
+        return gspread.utils.a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+    except (KeyError, TypeError, IndexError, ValueError, gspread.exceptions.IncorrectCellLabel):
+        return None
 
 def ensure_size(ws, min_rows=2000, min_cols=40):
     """Garante que a planilha tenha um tamanho mínimo para evitar erros."""
@@ -165,80 +550,589 @@ def batch_get_values_prefixed(ws, ranges, value_render_option="UNFORMATTED_VALUE
     resp = ws.spreadsheet.values_batch_get(prefixed, params=params)
     return resp.get("valueRanges", [])
 
-def load_resultados_snapshot():
-    """
-    Função otimizada para carregar os dados da aba 'Resultados_Bolsao'.
-    """
-    ws = get_ws("Resultados_Bolsao")
-    if not ws:
-        return {"rows": [], "id_to_rownum": {}}
+RESULTADOS_COLUMNS = [
+    "REGISTRO_ID", "Nome do Aluno", "Unidade", "Bolsão", "% Bolsa", 
+    "Valor da Mensalidade com Bolsa", "Escola de Origem", "Valor Negociado",
+    "Responsável Financeiro", "Telefone", "Aluno Matriculou?", 
+    "Observações (Form)", "Data/Hora"
+]
+COL_EXPECTATIVA = "Expectativa de mensalidade"
+COL_EXPECTATIVA_FALLBACK = "Valor Limite (PIA)"
 
-    hmap = header_map("Resultados_Bolsao")
-    
-    columns_needed = [
-        "REGISTRO_ID", "Nome do Aluno", "Unidade", "Bolsão", "% Bolsa", 
-        "Valor da Mensalidade com Bolsa", "Escola de Origem", "Valor Negociado",
-        "Responsável Financeiro", "Telefone", "Aluno Matriculou?", 
-        "Observações (Form)", "Data/Hora"
-    ]
-
-    col_expectativa = "Expectativa de mensalidade"
-    col_expectativa_fallback = "Valor Limite (PIA)"
-    if col_expectativa in hmap:
-        columns_needed.append(col_expectativa)
-    elif col_expectativa_fallback in hmap:
-        columns_needed.append(col_expectativa_fallback)
+# Colunas editadas pela aba Formulário (a expectativa entra conforme o cabeçalho)
+FORM_EDIT_COLUMNS = ["Escola de Origem", "Responsável Financeiro", "Telefone", "Valor Negociado",
+                     "Aluno Matriculou?", "Observações (Form)"]
+
+def form_edit_columns(hmap):
+    """Colunas editáveis pelo Formulário presentes no cabeçalho atual."""
+    cols = [c for c in FORM_EDIT_COLUMNS if c in hmap]
+    if COL_EXPECTATIVA in hmap:
+        cols.append(COL_EXPECTATIVA)
+    elif COL_EXPECTATIVA_FALLBACK in hmap:
+        cols.append(COL_EXPECTATIVA_FALLBACK)
+    return cols
+
+def resultados_columns_needed(hmap):
+    """Lista as colunas de 'Resultados_Bolsao' usadas pelo app, validando o cabeçalho."""
+    columns_needed = list(RESULTADOS_COLUMNS)
+    if COL_EXPECTATIVA in hmap:
+        columns_needed.append(COL_EXPECTATIVA)
+    elif COL_EXPECTATIVA_FALLBACK in hmap:
+        columns_needed.append(COL_EXPECTATIVA_FALLBACK)
 
     missing = [c for c in columns_needed if c not in hmap]
     if missing:
-        if not (len(missing) == 1 and missing[0] in [col_expectativa, col_expectativa_fallback]):
-                 raise RuntimeError(f"Faltam colunas em 'Resultados_Bolsao': {', '.join(missing)}")
+        raise RuntimeError(f"Faltam colunas em '{RESULTADOS_TAB}': {', '.join(missing)}")
+    return columns_needed
 
-    letters = {c: a1_col_letter(hmap[c]) for c in columns_needed if c in hmap}
-    ranges = [f"{letters[c]}2:{letters[c]}" for c in columns_needed if c in hmap]
+def resultados_column_ranges(hmap, columns_needed):
+    """Monta os ranges A1 (da linha 2 até o fim) de cada coluna necessária."""
+    return [f"{a1_col_letter(hmap[c])}2:{a1_col_letter(hmap[c])}" for c in columns_needed]
 
-    vranges = batch_get_values_prefixed(ws, ranges)
+# --- SNAPSHOT COLUNAR E TIPADO ---
+# Colunas convertidas uma única vez na carga: dinheiro e percentual viram
+# arrays float64, telefone já fica mascarado e 'Data/Hora' vira datetime64.
+MONEY_COLUMNS = ("Valor da Mensalidade com Bolsa", "Valor Negociado", COL_EXPECTATIVA, COL_EXPECTATIVA_FALLBACK)
+PERCENT_COLUMNS = ("% Bolsa",)
+PHONE_COLUMNS = ("Telefone",)
+DATETIME_COLUMNS = ("Data/Hora",)
+SHEETS_EPOCH = datetime(1899, 12, 30)
+
+def parse_percent(x) -> float:
+    """Converte '61%', 0.61 ou 61 para a fração 0.61. Vazio ou inválido vira NaN."""
+    if x is None or x == "":
+        return float("nan")
+    if isinstance(x, (int, float)):
+        v = float(x)
+    else:
+        s = str(x).strip()
+        had_pct = s.endswith("%")
+        try:
+            v = float(s.rstrip("%").strip().replace(",", "."))
+        except ValueError:
+            return float("nan")
+        if had_pct:
+            return v / 100
+    return v / 100 if v > 1 else v
+
+def parse_data_hora(value):
+    """Converte 'dd/mm/YYYY HH:MM:SS' ou o número serial do Sheets em datetime (ou None)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return SHEETS_EPOCH + timedelta(days=float(value)) if value else None
+    s = str(value or "").strip()
+    for fmt in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+def format_percent(pct) -> str:
+    """Formata uma fração (0.61) como '61%'. NaN/None vira string vazia."""
+    try:
+        v = float(pct)
+    except (TypeError, ValueError):
+        return ""
+    return "" if np.isnan(v) else f"{v * 100:.0f}%"
+
+def _parse_datetime_column(raw_values):
+    """
+    Converte a coluna 'Data/Hora' inteira de uma vez: seriais numéricos do
+    Sheets e textos 'dd/mm/YYYY HH:MM:SS' são vetorizados pelo pandas; só os
+    formatos alternativos caem no parse_data_hora linha a linha.
+    """
+    values = pd.Series(list(raw_values), dtype=object)
+    serials = pd.to_numeric(values.where(values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))), errors="coerce")
+    texts = values.where(serials.isna()).fillna("").astype(str).str.strip()
+    parsed = pd.to_datetime(texts, format="%d/%m/%Y %H:%M:%S", errors="coerce")
+    parsed = parsed.fillna(pd.Timestamp(SHEETS_EPOCH) + pd.to_timedelta(serials.where(serials > 0), unit="D"))
+    leftovers = parsed.isna() & (texts != "")
+    if leftovers.any():
+        # Textos que nem o parse_data_hora entende ficam NaT, em vez de derrubar a carga
+        parsed[leftovers] = pd.to_datetime(pd.Series([parse_data_hora(v) for v in texts[leftovers]],
+                                                     index=texts[leftovers].index, dtype=object), errors="coerce")
+    return parsed.to_numpy(dtype="datetime64[s]")
+
+def _typed_column(col, raw_values):
+    """Converte uma coluna bruta para a sua representação tipada definitiva."""
+    if col in MONEY_COLUMNS:
+        return np.fromiter((parse_brl_to_float(v) for v in raw_values), dtype=np.float64, count=len(raw_values))
+    if col in PERCENT_COLUMNS:
+        return np.fromiter((parse_percent(v) for v in raw_values), dtype=np.float64, count=len(raw_values))
+    if col in DATETIME_COLUMNS:
+        return _parse_datetime_column(raw_values)
+    if col in PHONE_COLUMNS:
+        return [format_phone_mask(v) for v in raw_values]
+    return [v if v is not None else "" for v in raw_values]
+
+def _fingerprint_value(v):
+    """Normaliza um valor tipado para a impressão digital (NaN/NaT/None viram vazio)."""
+    if v is None:
+        return ""
+    if isinstance(v, (float, np.floating)):
+        return "" if np.isnan(v) else f"{float(v):.2f}"
+    if isinstance(v, np.datetime64):
+        return "" if np.isnat(v) else str(v)
+    return str(v).strip()
+
+def row_fingerprint(values) -> str:
+    """Hash curto de uma sequência de valores tipados de uma linha."""
+    joined = "\x1f".join(_fingerprint_value(v) for v in values)
+    return hashlib.blake2b(joined.encode("utf-8"), digest_size=8).hexdigest()
+
+def _epoch_seconds(value) -> int:
+    """Converte date/datetime (ingênuo, horário de Brasília) para segundos, como no datetime64[s]."""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return int(np.datetime64(value.replace(tzinfo=None), "s").astype(np.int64))
+
+class SnapshotRow:
+    """Visão leve de uma linha do snapshot; lê direto das colunas compartilhadas."""
+    __slots__ = ("_snapshot", "_index")
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self._index = index
+
+    def get(self, col, default=None):
+        column = self._snapshot.columns.get(col)
+        if column is None:
+            return default
+        value = column[self._index]
+        if isinstance(value, np.datetime64):
+            return None if np.isnat(value) else value.astype(datetime)
+        if isinstance(value, np.floating):
+            return float(value)
+        return value
+
+    def __getitem__(self, col):
+        if col not in self._snapshot.columns:
+            raise KeyError(col)
+        return self.get(col)
+
+    @property
+    def index(self):
+        return self._index
+
+    def to_dict(self):
+        return {c: self.get(c) for c in self._snapshot.columns}
+
+class ResultadosSnapshot:
+    """
+    Snapshot colunar da aba 'Resultados_Bolsao'. Cada coluna é guardada uma
+    vez (lista para texto, array NumPy para números e datas), e as linhas são
+    visões (SnapshotRow) sobre essas colunas, sem um dicionário por linha.
+    """
+
+    def __init__(self, columns_needed, series):
+        self.column_names = list(columns_needed)
+        self.columns = {c: _typed_column(c, series.get(c, [])) for c in self.column_names}
+        self.id_to_index = {}
+        for i, rid in enumerate(self.columns.get("REGISTRO_ID", [])):
+            if rid:
+                self.id_to_index[str(rid)] = i
+        # Linhas além deste ponto foram acrescentadas em memória; só as que têm
+        # número de linha conhecido (extra_rownums) estão na planilha
+        self.sheet_row_count = len(self)
+        self.extra_rownums = {}
+        # REGISTRO_ID -> instante (monotonic) da última alteração em memória
+        self.touched = {}
+        # Muda a cada alteração; invalida os índices derivados (códigos, ordenação)
+        self.version = 0
+        self._derived = {}
+
+    def __len__(self):
+        return len(self.columns["REGISTRO_ID"]) if "REGISTRO_ID" in self.columns else 0
+
+    def __iter__(self):
+        return (SnapshotRow(self, i) for i in range(len(self)))
+
+    @property
+    def rows(self):
+        """Sequência de visões de linha (compatível com o antigo snapshot['rows'])."""
+        return [SnapshotRow(self, i) for i in range(len(self))]
+
+    def row(self, index):
+        return SnapshotRow(self, index)
+
+    def rownum_for_id(self, reg_id):
+        """Número da linha na planilha de um REGISTRO_ID, ou None se não estiver nela."""
+        i = self.id_to_index.get(str(reg_id))
+        if i is None:
+            return None
+        if str(reg_id) in self.extra_rownums:
+            return self.extra_rownums[str(reg_id)]
+        return i + 2 if i < self.sheet_row_count else None
+
+    def set_rownum(self, reg_id, rownum):
+        """Corrige o número da linha de um registro (ex: linhas removidas ou reordenadas na planilha)."""
+        if str(reg_id) in self.id_to_index:
+            self.extra_rownums[str(reg_id)] = rownum
+            self.version += 1
+
+    def frozen_copy(self, cols):
+        """
+        Cópia de REGISTRO_ID, de `cols` e dos números de linha, para outra
+        thread comparar (ex: o feed de alterações) sem ler as colunas que a
+        thread do Tk está alterando. Feita na thread que altera o snapshot.
+        """
+        copy = ResultadosSnapshot.__new__(ResultadosSnapshot)
+        copy.column_names = [c for c in self.column_names if c == "REGISTRO_ID" or c in cols]
+        copy.columns = {c: self.columns[c].copy() for c in copy.column_names}
+        copy.id_to_index = dict(self.id_to_index)
+        copy.sheet_row_count = self.sheet_row_count
+        copy.extra_rownums = dict(self.extra_rownums)
+        copy.touched = {}
+        copy.version = self.version
+        copy._derived = {}
+        return copy
+
+    def fingerprint(self, index, cols):
+        """Impressão digital dos valores tipados de `cols` na linha `index`."""
+        return row_fingerprint(self.columns[c][index] if c in self.columns else "" for c in cols)
+
+    def row_for_id(self, reg_id):
+        """Retorna a linha de um REGISTRO_ID em O(1), ou None."""
+        i = self.id_to_index.get(str(reg_id))
+        return None if i is None else SnapshotRow(self, i)
+
+    def _cached(self, kind, col, build):
+        """Resultado de `build()` guardado até a próxima alteração do snapshot."""
+        hit = self._derived.get((kind, col))
+        if hit is not None and hit[0] == self.version:
+            return hit[1]
+        value = build()
+        self._derived[(kind, col)] = (self.version, value)
+        return value
+
+    def category_codes(self, col):
+        """
+        Códigos inteiros de uma coluna de texto (pd.factorize) e o mapa
+        {valor: código}, para filtrar por igualdade com comparações vetorizadas.
+        """
+        def build():
+            codes, uniques = pd.factorize(pd.Series(self.columns.get(col, []), dtype=object).fillna(""))
+            return codes, {v: i for i, v in enumerate(uniques)}
+        return self._cached("codes", col, build)
+
+    def sort_ranks(self, col):
+        """
+        Posição de cada linha na ordenação crescente de `col` (chave
+        pré-calculada): ordenar um subconjunto é só argsort dos seus ranks.
+        Vazios/NaN/NaT ficam no fim; texto é comparado sem acento e sem caixa.
+        """
+        def build():
+            column = self.columns.get(col, [])
+            if isinstance(column, np.ndarray) and column.dtype.kind == "M":
+                keys = np.where(np.isnat(column), np.iinfo(np.int64).max, column.astype("int64"))
+            elif isinstance(column, np.ndarray):
+                keys = np.where(np.isnan(column), np.inf, column)
+            else:
+                # Normaliza só os valores distintos e ordena os códigos inteiros
+                codes, lookup = self.category_codes(col)
+                distinct = np.array([normalize_key(v) or "\uffff" for v in lookup], dtype=object)
+                code_rank = np.empty(len(distinct), dtype=np.int64)
+                code_rank[np.argsort(distinct, kind="stable")] = np.arange(len(distinct))
+                keys = code_rank[codes]
+            order = np.argsort(keys, kind="stable")
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            return ranks
+        return self._cached("ranks", col, build)
+
+    def time_index(self, col="Data/Hora"):
+        """
+        Índice temporal de uma coluna de datas: (instantes em segundos, em
+        ordem crescente; linhas correspondentes). Linhas sem data (NaT) ficam
+        de fora. Montado uma vez por versão do snapshot.
+        """
+        def build():
+            column = self.columns.get(col)
+            if not isinstance(column, np.ndarray) or column.dtype.kind != "M":
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            rows = np.flatnonzero(~np.isnat(column))
+            seconds = column[rows].astype("datetime64[s]").astype(np.int64)
+            order = np.argsort(seconds, kind="stable")
+            return seconds[order], rows[order]
+        return self._cached("time", col, build)
+
+    def indices_in_period(self, inicio=None, fim=None, col="Data/Hora"):
+        """
+        Linhas (na ordem da planilha) com `col` em [inicio, fim); qualquer
+        limite pode ser None. Duas buscas binárias no índice temporal: o custo
+        depende do tamanho do resultado, não do snapshot.
+        """
+        seconds, rows = self.time_index(col)
+        lo = 0 if inicio is None else np.searchsorted(seconds, _epoch_seconds(inicio), side="left")
+        hi = len(seconds) if fim is None else np.searchsorted(seconds, _epoch_seconds(fim), side="left")
+        return np.sort(rows[lo:hi])
+
+    def sort_indices(self, indices, col, descending=False):
+        """Ordena os índices `indices` pela coluna `col` usando os ranks pré-calculados."""
+        indices = np.asarray(indices, dtype=np.int64)
+        ranks = self.sort_ranks(col)[indices]
+        if descending:
+            ranks = -ranks
+        return indices[np.argsort(ranks, kind="stable")]
+
+    def unique(self, col):
+        """Valores distintos e não vazios de uma coluna de texto."""
+        return {v for v in self.columns.get(col, []) if v}
+
+    def append_record(self, record, rownum=None):
+        """
+        Acrescenta um registro ao snapshot em memória e retorna a nova linha.
+        `rownum` é o número da linha na planilha; sem ele (ex: fila offline)
+        o registro fica visível, mas não pode ser editado até a próxima carga.
+        """
+        return self.append_records([record], [rownum])[0]
+
+    def append_records(self, records, rownums=None):
+        """
+        Acrescenta vários registros de uma vez e retorna as novas linhas.
+        Cada coluna é remontada uma única vez por lote (e não uma vez por
+        registro), então importar ou sincronizar N linhas custa O(n + N).
+        `rownums` segue a ordem de `records` (None onde não se sabe a linha).
+        """
+        records = list(records)
+        if not records:
+            return []
+        rownums = list(rownums) if rownums is not None else [None] * len(records)
+        start = len(self)
+        for c in self.column_names:
+            typed = _typed_column(c, [record.get(c, "") for record in records])
+            column = self.columns[c]
+            self.columns[c] = np.concatenate([column, typed]) if isinstance(column, np.ndarray) else column + typed
+        self.version += 1
+        now = time.monotonic()
+        for k, (record, rownum) in enumerate(zip(records, rownums)):
+            rid = record.get("REGISTRO_ID")
+            if rid:
+                self.id_to_index[str(rid)] = start + k
+                self.touched[str(rid)] = now
+                if rownum:
+                    self.extra_rownums[str(rid)] = rownum
+        return [SnapshotRow(self, start + k) for k in range(len(records))]
+
+    def extend_from_sheet(self, window):
+        """
+        Acrescenta as linhas de `window` (outro snapshot, com as linhas seguintes
+        da planilha) logo depois das linhas já lidas da planilha, antes das
+        acrescentadas em memória. Uma linha acrescentada em memória que já
+        aparece na janela é descartada: vale a linha da planilha.
+        """
+        s, n = self.sheet_row_count, len(window)
+        window_ids = [str(rid) for rid in window.columns["REGISTRO_ID"]]
+        extras = [i for i in range(s, len(self))
+                  if str(self.columns["REGISTRO_ID"][i]) not in window.id_to_index]
+        extra_ids = [str(self.columns["REGISTRO_ID"][i]) for i in extras]
+        for c in self.column_names:
+            column, new = self.columns[c], window.columns[c]
+            if isinstance(column, np.ndarray):
+                self.columns[c] = np.concatenate([column[:s], new, column[extras]])
+            else:
+                self.columns[c] = column[:s] + list(new) + [column[i] for i in extras]
+        for rid in window.id_to_index:
+            self.extra_rownums.pop(rid, None)
+        for k, rid in enumerate(window_ids):
+            if rid:
+                self.id_to_index[rid] = s + k
+        for k, rid in enumerate(extra_ids):
+            if rid:
+                self.id_to_index[rid] = s + n + k
+        self.sheet_row_count = s + n
+        self.version += 1
+
+    def update_record(self, reg_id, updates):
+        """
+        Aplica em memória os valores gravados na planilha para um registro.
+        Retorna (valores_antes, valores_depois) da linha, ou None se o ID não existir.
+        """
+        i = self.id_to_index.get(str(reg_id))
+        if i is None:
+            return None
+        before = SnapshotRow(self, i).to_dict()
+        for c, value in updates.items():
+            if c in self.columns:
+                self.columns[c][i] = _typed_column(c, [value])[0]
+        self.touched[str(reg_id)] = time.monotonic()
+        self.version += 1
+        return before, SnapshotRow(self, i).to_dict()
+
+def build_resultados_snapshot(columns_needed, vranges):
+    """Monta o ResultadosSnapshot a partir dos valueRanges lidos."""
     series = {}
-    valid_columns_from_fetch = [c for c in columns_needed if c in hmap]
-    for c, vr in zip(valid_columns_from_fetch, vranges):
+    for c, vr in zip(columns_needed, vranges):
         vals = vr.get("values", [])
         series[c] = [row[0] if row else "" for row in vals]
 
     max_len = max((len(v) for v in series.values()), default=0)
-    for c in valid_columns_from_fetch:
-        col = series[c]
+    for c in columns_needed:
+        col = series.setdefault(c, [])
         if len(col) < max_len:
             col.extend([""] * (max_len - len(col)))
 
-    rows = [{c: series.get(c, [""] * max_len)[i] for c in columns_needed} for i in range(max_len)]
+    return ResultadosSnapshot(columns_needed, series)
+
+# --- AGREGADOS PARA RELATÓRIOS (MANUTENÇÃO INCREMENTAL) ---
+PARCELAS_POR_ANO = 12
+
+class ResultadosAggregates:
+    """
+    Agregados por (Bolsão, Unidade) sobre o snapshot de Resultados:
+    candidatos, % Bolsa média, conversão de 'Aluno Matriculou?' e receita
+    anual projetada (Valor Negociado x 12). A carga inicial usa um groupby
+    vetorizado; depois, cada inclusão ou edição ajusta só o grupo afetado.
+    """
+    # Posições no vetor de somas de cada grupo
+    CANDIDATOS, PCT_SOMA, PCT_QTD, MATRICULADOS, RECEITA_MENSAL = range(5)
+
+    def __init__(self, snapshot):
+        self.groups = {}
+        if len(snapshot) == 0:
+            return
+        cols = snapshot.columns
+        pct = cols["% Bolsa"]
+        valor = cols["Valor Negociado"]
+        df = pd.DataFrame({
+            "bolsao": cols["Bolsão"],
+            "unidade": cols["Unidade"],
+            "pct": np.nan_to_num(pct, nan=0.0),
+            "pct_n": ~np.isnan(pct),
+            "matriculou": np.asarray(cols["Aluno Matriculou?"], dtype=object) == "Sim",
+            "valor": valor,
+        })
+        g = df.groupby(["bolsao", "unidade"], sort=False).agg(
+            candidatos=("pct", "size"), pct_soma=("pct", "sum"), pct_qtd=("pct_n", "sum"),
+            matriculados=("matriculou", "sum"), receita_mensal=("valor", "sum"),
+        )
+        for key, vals in zip(g.index, g.itertuples(index=False)):
+            self.groups[key] = [int(vals.candidatos), float(vals.pct_soma), int(vals.pct_qtd),
+                                int(vals.matriculados), float(vals.receita_mensal)]
+
+    @staticmethod
+    def _contribution(values):
+        """Vetor de contribuição de uma linha (dicionário de valores tipados)."""
+        pct = values.get("% Bolsa")
+        has_pct = pct is not None and not np.isnan(pct)
+        return [1, pct if has_pct else 0.0, 1 if has_pct else 0,
+                1 if values.get("Aluno Matriculou?") == "Sim" else 0,
+                float(values.get("Valor Negociado") or 0.0)]
+
+    def _apply(self, values, sign):
+        key = (values.get("Bolsão") or "", values.get("Unidade") or "")
+        acc = self.groups.setdefault(key, [0, 0.0, 0, 0, 0.0])
+        for pos, v in enumerate(self._contribution(values)):
+            acc[pos] += sign * v
+        if acc[self.CANDIDATOS] <= 0:
+            del self.groups[key]
+
+    def add(self, values):
+        """Inclui uma linha nova nos agregados."""
+        self._apply(values, +1)
+
+    def remove(self, values):
+        """Retira uma linha dos agregados."""
+        self._apply(values, -1)
+
+    def replace(self, old_values, new_values):
+        """Atualiza os agregados após a edição de uma linha."""
+        self.remove(old_values)
+        self.add(new_values)
+
+    def merge(self, other):
+        """Soma aos agregados os de outro conjunto de linhas (ex: uma janela da carga progressiva)."""
+        for key, vals in other.groups.items():
+            acc = self.groups.setdefault(key, [0, 0.0, 0, 0, 0.0])
+            for pos, v in enumerate(vals):
+                acc[pos] += v
+
+    def table(self):
+        """Linhas prontas para exibição, ordenadas por bolsão e unidade."""
+        linhas = []
+        for (bolsao, unidade), acc in sorted(self.groups.items()):
+            candidatos = acc[self.CANDIDATOS]
+            linhas.append({
+                "Bolsão": bolsao,
+                "Unidade": unidade,
+                "Candidatos": candidatos,
+                "% Bolsa média": acc[self.PCT_SOMA] / acc[self.PCT_QTD] if acc[self.PCT_QTD] else float("nan"),
+                "Matriculados": acc[self.MATRICULADOS],
+                "Conversão": acc[self.MATRICULADOS] / candidatos if candidatos else 0.0,
+                "Receita anual projetada": acc[self.RECEITA_MENSAL] * PARCELAS_POR_ANO,
+            })
+        return linhas
+
+    def totals(self):
+        """Totais gerais (todas as unidades e bolsões)."""
+        t = [sum(acc[pos] for acc in self.groups.values()) for pos in range(5)]
+        return {
+            "Candidatos": t[self.CANDIDATOS],
+            "% Bolsa média": t[self.PCT_SOMA] / t[self.PCT_QTD] if t[self.PCT_QTD] else float("nan"),
+            "Matriculados": t[self.MATRICULADOS],
+            "Conversão": t[self.MATRICULADOS] / t[self.CANDIDATOS] if t[self.CANDIDATOS] else 0.0,
+            "Receita anual projetada": t[self.RECEITA_MENSAL] * PARCELAS_POR_ANO,
+        }
+
+def load_resultados_snapshot(ws_title=None):
+    """
+    Função otimizada para carregar os dados da aba 'Resultados_Bolsao' (ou de
+    uma partição arquivada com o mesmo cabeçalho).
+    """
+    ws_title = ws_title or RESULTADOS_TAB
+    ws = get_ws(ws_title)
+    if not ws:
+        return ResultadosSnapshot(RESULTADOS_COLUMNS, {})
 
-    id_to_rownum = {}
-    for i, rid in enumerate(series.get("REGISTRO_ID", []), start=2):
-        if rid:
-            id_to_rownum[str(rid)] = i
+    hmap = header_map(ws_title)
+    columns_needed = resultados_columns_needed(hmap)
+    vranges = batch_get_values_prefixed(ws, resultados_column_ranges(hmap, columns_needed))
+    return build_resultados_snapshot(columns_needed, vranges)
 
-    return {"rows": rows, "id_to_rownum": id_to_rownum}
+# --- CARGA PROGRESSIVA (EM JANELAS DE LINHAS) ---
+# Para abas grandes: em vez de uma leitura única das colunas inteiras, lê
+# janelas de STREAM_WINDOW_ROWS linhas (1 values_batch_get por janela). Cada
+# janela chega como um snapshot pequeno, já tipado e com os seus agregados, e
+# é juntada ao snapshot principal pela thread do Tk (extend_from_sheet e
+# ResultadosAggregates.merge). Só os valores brutos de uma janela ficam em
+# memória por vez, e a carga pode ser cancelada entre duas janelas.
+STREAM_WINDOW_ROWS = 5000
+
+def iter_resultados_windows(window=STREAM_WINDOW_ROWS, cancel=None, ws_title=None):
+    """
+    Gera (snapshot_da_janela, agregados_da_janela, linhas_lidas, total_estimado).
+    O total vem do tamanho da aba nos metadados (pode incluir linhas vazias no
+    fim); a leitura para na primeira janela vazia ou quando `cancel`
+    (threading.Event) é acionado.
+    """
+    ws_title = ws_title or RESULTADOS_TAB
+    tab = get_sheet_metadata()["tabs"].get(ws_title)
+    if tab is None:
+        raise gspread.WorksheetNotFound(f"Aba da planilha com o nome '{ws_title}' não foi encontrada.")
+    hmap = dict(tab["hmap"])
+    columns_needed = resultados_columns_needed(hmap)
+    letters = [a1_col_letter(hmap[c]) for c in columns_needed]
+    ws = get_ws(ws_title)
+    last_row = max(tab["rows"], 2)
+    first, blank = 2, 0
+    while first <= last_row:
+        if cancel is not None and cancel.is_set():
+            return
+        last = min(first + window - 1, last_row)
+        vranges = batch_get_values_prefixed(ws, [f"{L}{first}:{L}{last}" for L in letters])
+        values, n_rows = _column_values(columns_needed, vranges)
+        if n_rows == 0:
+            return
+        # Linhas vazias no fim da janela anterior só contam se houver dados depois delas
+        series = {c: [""] * blank + values[c] for c in columns_needed}
+        snapshot = ResultadosSnapshot(columns_needed, series)
+        yield snapshot, ResultadosAggregates(snapshot), last - 1, last_row - 1
+        blank = (last - first + 1) - n_rows
+        first = last + 1
 
 # --------------------------------------------------
 # DADOS DE REFERÊNCIA E CONFIGURAÇÕES (CONSTANTES)
 # --------------------------------------------------
-TUITION = {
-    "1ª e 2ª Série EM Militar": {"anuidade": 40263.66, "parcela13": 3097.20},
-    "1ª e 2ª Série EM Vestibular": {"anuidade": 40263.66, "parcela13": 3097.20},
-    "1º ao 5º Ano": {"anuidade": 29266.09, "parcela13": 2251.24},
-    "3ª Série (PV/PM)": {"anuidade": 40419.58, "parcela13": 3109.20},
-    "3ª Série EM Medicina": {"anuidade": 40419.58, "parcela13": 3109.20},
-    "6º ao 8º Ano": {"anuidade": 34426.69, "parcela13": 2648.21},
-    "9º Ano EF II Militar": {"anuidade": 37492.31, "parcela13": 2884.02},
-    "9º Ano EF II Vestibular": {"anuidade": 37492.31, "parcela13": 2884.02},
-    "AFA/EN/EFOMM": {"anuidade": 16252.60, "parcela13": 1250.20},
-    "CN/EPCAr": {"anuidade": 9731.57, "parcela13": 748.58},
-    "ESA": {"anuidade": 7845.21, "parcela13": 603.48},
-    "EsPCEx": {"anuidade": 16252.60, "parcela13": 1250.20},
-    "IME/ITA": {"anuidade": 16252.60, "parcela13": 1250.20},
-    "Medicina (Pré)": {"anuidade": 16252.60, "parcela13": 1250.20},
-    "Pré-Vestibular": {"anuidade": 16252.60, "parcela13": 1250.20},
-}
 TURMA_DE_INTERESSE_MAP = {
     "1ª série IME ITA Jr": "1ª e 2ª Série EM Militar", "1ª série do EM - Militar": "1ª e 2ª Série EM Militar",
     "1ª série do EM - Pré-Vestibular": "1ª e 2ª Série EM Vestibular", "1º ano do EF1": "1º ao 5º Ano",
@@ -264,93 +1158,216 @@ UNIDADES_COMPLETAS = [
 ]
 UNIDADES_MAP = {name.replace("COLEGIO E CURSO MATRIZ EDUCACAO", "").replace("COLEGIO E CURSO MATRIZ EDUCAÇÃO", "").strip(): name for name in UNIDADES_COMPLETAS}
 UNIDADES_LIMPAS = sorted(list(UNIDADES_MAP.keys()))
-DESCONTOS_MAXIMOS_POR_UNIDADE = {
-    "RETIRO DOS ARTISTAS": 0.50, "CAMPO GRANDE": 0.6320, "ROCHA MIRANDA": 0.6606,
-    "TAQUARA": 0.6755, "NOVA IGUACU": 0.6700, "DUQUE DE CAXIAS": 0.6823,
-    "BANGU": 0.6806, "MADUREIRA": 0.7032, "TIJUCA": 0.6800, "SÃO JOÃO DE MERITI": 0.7197,
-}
+# --- CATÁLOGO DE PREÇOS E REGRAS DE BOLSA ---
+# Mensalidades, descontos máximos, segmentos, faixas de bolsa, material
+# didático e a tabela da aba Valores vêm do catalogo.json (versionado). Um
+# catalogo.json ao lado do executável (ou o caminho em "catalogo_path" no
+# config_local.json) tem precedência sobre o embutido: mudar um preço não
+# exige um novo EXE, e o app recarrega o arquivo sem reiniciar. O documento é
+# validado e compilado a cada carga (tabela densa de bolsa por nº de acertos,
+# HTML do material por unidade e vetores de preços para a cotação reversa);
+# compilar leva milissegundos, então não há cache do compilado em disco.
+CATALOGO_FILE = "catalogo.json"
+CATALOGO_FORMATO = 2   # versão da estrutura compilada (entra no hash do catálogo)
 
-# --- NOVA ESTRUTURA PARA REGRAS DE BOLSA ---
-SEGMENTO_MAP = {
-    "1º ao 5º Ano": "EFAI",
-    "6º ao 8º Ano": "EFAF_68",
-    "9º Ano EF II Militar": "EFAF_9",
-    "9º Ano EF II Vestibular": "EFAF_9",
-    "1ª e 2ª Série EM Militar": "EM_CL",
-    "1ª e 2ª Série EM Vestibular": "EM_CL",
-    "3ª Série (PV/PM)": "EM_CL",
-    "3ª Série EM Medicina": "EM_CL",
-    "AFA/EN/EFOMM": "EM_CL",
-    "CN/EPCAr": "EM_CL",
-    "ESA": "EM_CL",
-    "EsPCEx": "EM_CL",
-    "IME/ITA": "EM_CL",
-    "Medicina (Pré)": "EM_CL",
-    "Pré-Vestibular": "EM_CL",
-}
+class CatalogoInvalido(Exception):
+    """O catalogo.json não passou na validação."""
+
+# Preenchidos por _apply_catalogo; mantidos como nomes do módulo para o código existente
+TUITION = {}
+DESCONTOS_MAXIMOS_POR_UNIDADE = {}
+SEGMENTO_MAP = {}
+REGRAS_BOLSA_POR_UNIDADE = {}
+_catalogo = None
+_catalogo_stamp = None
+
+def catalogo_sources():
+    """Arquivos de catálogo em ordem de preferência: configurado, local e embutido."""
+    sources = []
+    configured = load_local_config().get("catalogo_path")
+    embutido = os.path.join(os.path.dirname(os.path.abspath(__file__)), CATALOGO_FILE)
+    for path in (configured, CATALOGO_FILE, embutido):
+        if path and os.path.abspath(path) not in [os.path.abspath(p) for p in sources]:
+            sources.append(path)
+    return sources
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def validate_catalogo(doc):
+    """Confere a estrutura e a coerência do catálogo. Levanta CatalogoInvalido com todos os problemas."""
+    problemas = []
+    for chave in ("versao", "mensalidades", "descontos_maximos", "segmentos", "regras_bolsa", "material_didatico", "tabela_valores"):
+        if chave not in doc:
+            problemas.append(f"chave '{chave}' ausente")
+    if problemas:
+        raise CatalogoInvalido("; ".join(problemas))
+
+    for serie, precos in doc["mensalidades"].items():
+        if not all(_is_number(precos.get(k)) and precos[k] > 0 for k in ("anuidade", "parcela13")):
+            problemas.append(f"mensalidade de '{serie}' precisa de anuidade e parcela13 positivas")
+    for unidade, desconto in doc["descontos_maximos"].items():
+        if not _is_number(desconto) or not 0 <= desconto <= 1:
+            problemas.append(f"desconto máximo de '{unidade}' fora de 0..1")
+    segmentos_validos = set(doc["segmentos"].values())
+    for serie in doc["segmentos"]:
+        if serie not in doc["mensalidades"]:
+            problemas.append(f"série '{serie}' tem segmento, mas não tem mensalidade")
+    for unidade, regras in doc["regras_bolsa"].items():
+        for segmento, faixas in regras.items():
+            if segmento not in segmentos_validos:
+                problemas.append(f"{unidade}: segmento desconhecido '{segmento}'")
+            ocupados = set()
+            for faixa in faixas:
+                if len(faixa) != 3 or not all(_is_number(x) for x in faixa):
+                    problemas.append(f"{unidade}/{segmento}: faixa inválida {faixa}")
+                    continue
+                inicio, fim, pct = faixa
+                if inicio < 0 or fim < inicio or int(inicio) != inicio or int(fim) != fim:
+                    problemas.append(f"{unidade}/{segmento}: faixa de acertos inválida {faixa}")
+                elif not 0 <= pct <= 1:
+                    problemas.append(f"{unidade}/{segmento}: percentual fora de 0..1 em {faixa}")
+                elif ocupados & set(range(int(inicio), int(fim) + 1)):
+                    problemas.append(f"{unidade}/{segmento}: faixas sobrepostas em {faixa}")
+                else:
+                    ocupados |= set(range(int(inicio), int(fim) + 1))
+    material = doc["material_didatico"]
+    tabelas = [material.get("padrao", {})] + list(material.get("por_unidade", {}).values()) + list(material.get("extras", []))
+    for tabela in tabelas:
+        if not all(isinstance(item, list) and len(item) == 3 for item in tabela.get("itens", [])):
+            problemas.append(f"material '{tabela.get('titulo', '?')}': cada item deve ser [curso, valor, parcelamento]")
+    for linha in doc["tabela_valores"]:
+        if len(linha) != 3 or linha[2] not in doc["mensalidades"]:
+            problemas.append(f"linha da tabela de valores inválida ou sem mensalidade: {linha}")
+    if problemas:
+        raise CatalogoInvalido("; ".join(problemas))
+
+def _material_table_html(titulo, itens):
+    html = f'<table class="pag2"><tr><th colspan="3">{titulo}</th></tr>'
+    for curso, valor, parcelas in itens:
+        html += f'<tr><td>{curso}</td><td>{valor}</td><td>{parcelas}</td></tr>'
+    return html + '</table><br>'
+
+def compile_catalogo(doc) -> dict:
+    """Converte o documento validado nas estruturas de consulta usadas pelo app."""
+    tuition = {serie: {"anuidade": float(p["anuidade"]), "parcela13": float(p["parcela13"])}
+               for serie, p in doc["mensalidades"].items()}
+
+    regras, bolsa_tabelas = {}, {}
+    for unidade, por_segmento in doc["regras_bolsa"].items():
+        regras[unidade] = {}
+        for segmento, faixas in por_segmento.items():
+            regras[unidade][segmento] = {(int(a), int(b)): float(p) for a, b, p in faixas}
+            # Tabela densa: posição = nº de acertos; None onde nenhuma faixa cobre
+            tabela = [None] * (max((int(b) for _, b, _ in faixas), default=-1) + 1)
+            for a, b, p in faixas:
+                tabela[int(a):int(b) + 1] = [float(p)] * (int(b) - int(a) + 1)
+            bolsa_tabelas[(unidade, segmento)] = tabela
+
+    material = doc["material_didatico"]
+    padrao = material.get("padrao", {})
+    extras_html = "".join(_material_table_html(t["titulo"], t["itens"]) for t in material.get("extras", []))
+    def material_html(unidade):
+        especifico = material.get("por_unidade", {}).get(unidade)
+        titulo, itens = padrao.get("titulo", "Material Didático"), padrao.get("itens", [])
+        if especifico:
+            titulo = especifico.get("titulo", titulo)
+            if especifico.get("substitui"):
+                itens = especifico["itens"]
+            else:
+                # Mesmo curso: o valor da unidade substitui o padrão, na mesma posição
+                sobrepor = {item[0]: item for item in especifico["itens"]}
+                itens = [sobrepor.pop(item[0], item) for item in itens] + list(sobrepor.values())
+        return _material_table_html(titulo, itens) + extras_html
+
+    return {
+        "versao": str(doc["versao"]),
+        "tuition": tuition,
+        "descontos_maximos": {u: float(d) for u, d in doc["descontos_maximos"].items()},
+        "segmentos": dict(doc["segmentos"]),
+        "regras_bolsa": regras,
+        "bolsa_tabelas": bolsa_tabelas,
+        "material_html": {u: material_html(u) for u in UNIDADES_LIMPAS},
+        "material_html_padrao": material_html(None),
+        "tabela_valores": [(curso, serie_exibida, tuition[serie]["parcela13"], tuition[serie]["parcela13"])
+                           for curso, serie_exibida, serie in doc["tabela_valores"]],
+        # Vetores (séries) e (unidades) para calcular todas as combinações de uma vez
+        "negociacao": {
+            "series": list(tuition),
+            "unidades": list(UNIDADES_LIMPAS),
+            "parcela": np.array([p["parcela13"] for p in tuition.values()]),
+            "anuidade": np.array([p["anuidade"] for p in tuition.values()]),
+            "desconto_maximo": np.array([float(doc["descontos_maximos"].get(u, 0)) for u in UNIDADES_LIMPAS]),
+        },
+    }
+
+def load_catalogo(path) -> dict:
+    """Lê, valida e compila um catálogo. O hash identifica o conteúdo para detectar mudanças."""
+    raw = Path(path).read_bytes()
+    digest = hashlib.sha256(raw + f"|formato={CATALOGO_FORMATO}".encode("utf-8")).hexdigest()[:16]
+    try:
+        doc = json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise CatalogoInvalido(f"{path}: JSON inválido ({e})")
+    validate_catalogo(doc)
+    compiled = compile_catalogo(doc)
+    compiled["hash"] = digest
+    return compiled
+
+def _apply_catalogo(compiled, stamp):
+    global _catalogo, _catalogo_stamp, TUITION, DESCONTOS_MAXIMOS_POR_UNIDADE, SEGMENTO_MAP, REGRAS_BOLSA_POR_UNIDADE
+    TUITION = compiled["tuition"]
+    DESCONTOS_MAXIMOS_POR_UNIDADE = compiled["descontos_maximos"]
+    SEGMENTO_MAP = compiled["segmentos"]
+    REGRAS_BOLSA_POR_UNIDADE = compiled["regras_bolsa"]
+    _catalogo, _catalogo_stamp = compiled, stamp
+
+def get_catalogo() -> dict:
+    """Catálogo compilado em uso (versao, hash, tabelas de bolsa, HTML do material, tabela de valores)."""
+    return _catalogo
+
+def reload_catalogo_if_changed(force=False):
+    """
+    Recarrega o catálogo se o arquivo preferido mudou (data/tamanho).
+    Retorna (mudou, erro). Com erro de validação, o catálogo em uso é mantido.
+    """
+    global _catalogo_stamp
+    path = next((p for p in catalogo_sources() if os.path.exists(p)), None)
+    if path is None:
+        return False, "nenhum catalogo.json encontrado"
+    st = os.stat(path)
+    stamp = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if not force and stamp == _catalogo_stamp:
+        return False, None
+    try:
+        compiled = load_catalogo(path)
+    except Exception as e:
+        _catalogo_stamp = stamp  # avisa uma vez por alteração do arquivo
+        return False, f"{path}: {e}"
+    changed = _catalogo is None or compiled["hash"] != _catalogo["hash"]
+    compiled["origem"] = os.path.abspath(path)
+    _apply_catalogo(compiled, stamp)
+    return changed, None
+
+def init_catalogo():
+    """Carga inicial: usa o primeiro catálogo válido (o embutido é o último recurso)."""
+    erros = []
+    for path in catalogo_sources():
+        if not os.path.exists(path):
+            continue
+        try:
+            compiled = load_catalogo(path)
+        except Exception as e:
+            erros.append(f"{path}: {e}")
+            continue
+        st = os.stat(path)
+        compiled["origem"] = os.path.abspath(path)
+        _apply_catalogo(compiled, (os.path.abspath(path), st.st_mtime_ns, st.st_size))
+        for erro in erros:
+            print(f"Aviso: catálogo ignorado ({erro}).")
+        return
+    raise Exception("❌ Nenhum catálogo de preços válido encontrado. " + " | ".join(erros))
 
-REGRAS_BOLSA_POR_UNIDADE = {
-    "BANGU": {
-        "EFAI": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "CAMPO GRANDE": {
-        "EFAI": { (0, 5): 0.50, (6, 10): 0.55, (11, 15): 0.60, (16, 18): 0.65, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.52, (6, 10): 0.57, (11, 15): 0.62, (16, 18): 0.67, (19, 20): 0.72, (21, 23): 0.77, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.52, (6, 10): 0.57, (11, 15): 0.62, (16, 18): 0.67, (19, 20): 0.72, (21, 23): 0.77, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.53, (6, 10): 0.58, (11, 15): 0.63, (16, 18): 0.68, (19, 20): 0.73, (21, 23): 0.78, (24, 24): 1.00 },
-    },
-    "DUQUE DE CAXIAS": {
-        "EFAI": {},
-        "EFAF_68": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "MADUREIRA": {
-        "EFAI": {},
-        "EFAF_68": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "NOVA IGUACU": {
-        "EFAI": { (0, 5): 0.53, (6, 10): 0.58, (11, 15): 0.63, (16, 18): 0.68, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "RETIRO DOS ARTISTAS": {
-        "EFAI": { (0, 5): 0.45, (6, 10): 0.50, (11, 15): 0.55, (16, 18): 0.60, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.50, (6, 10): 0.55, (11, 15): 0.60, (16, 18): 0.65, (19, 20): 0.70, (21, 23): 0.75, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.47, (6, 10): 0.52, (11, 15): 0.57, (16, 18): 0.62, (19, 20): 0.67, (21, 23): 0.72, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.47, (6, 10): 0.52, (11, 15): 0.57, (16, 18): 0.62, (19, 20): 0.67, (21, 23): 0.72, (24, 24): 1.00 },
-    },
-    "ROCHA MIRANDA": {
-        "EFAI": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.53, (6, 10): 0.58, (11, 15): 0.63, (16, 18): 0.68, (19, 20): 0.73, (21, 23): 0.78, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.53, (6, 10): 0.58, (11, 15): 0.63, (16, 18): 0.68, (19, 20): 0.73, (21, 23): 0.78, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "SÃO JOÃO DE MERITI": {
-        "EFAI": { (0, 5): 0.58, (6, 10): 0.63, (11, 15): 0.68, (16, 18): 0.73, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.58, (6, 10): 0.63, (11, 15): 0.68, (16, 18): 0.73, (19, 20): 0.78, (21, 23): 0.83, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.58, (6, 10): 0.63, (11, 15): 0.68, (16, 18): 0.73, (19, 20): 0.78, (21, 23): 0.83, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.58, (6, 10): 0.63, (11, 15): 0.68, (16, 18): 0.73, (19, 20): 0.78, (21, 23): 0.83, (24, 24): 1.00 },
-    },
-    "TAQUARA": {
-        "EFAI": { (0, 5): 0.53, (6, 10): 0.58, (11, 15): 0.63, (16, 18): 0.68, (19, 20): 0.75 },
-        "EFAF_68": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-    "TIJUCA": {
-        "EFAI": {},
-        "EFAF_68": { (0, 5): 0.55, (6, 10): 0.60, (11, 15): 0.65, (16, 18): 0.70, (19, 20): 0.75, (21, 23): 0.80, (24, 24): 1.00 },
-        "EFAF_9": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-        "EM_CL": { (0, 5): 0.57, (6, 10): 0.62, (11, 15): 0.67, (16, 18): 0.72, (19, 20): 0.77, (21, 23): 0.82, (24, 24): 1.00 },
-    },
-}
 
 # --------------------------------------------------
 # FUNÇÕES DE LÓGICA E UTILITÁRIOS
@@ -371,29 +1388,82 @@ def get_current_brasilia_date() -> date:
     """Função auxiliar que retorna apenas a data de Brasília."""
     return get_current_brasilia_datetime().date()
 
-@lru_cache(maxsize=1)
+# --- CALENDÁRIO DE BOLSÕES (CACHE COM TTL) ---
+BOLSAO_CALENDAR_TTL = 30 * 60  # segundos
+BOLSAO_AVULSO = "Bolsão Avulso"
+
+_bolsao_calendar = None      # {date: "Nome do Bolsão"}
+_bolsao_calendar_loaded_at = 0.0
+
+def fetch_bolsao_calendar():
+    """
+    Lê as colunas de data (A) e nome (C) da aba 'Bolsão' em uma única
+    requisição em lote (ou do servidor de cache da unidade, se houver) e
+    devolve um dicionário {data: nome do bolsão}.
+    """
+    if get_cache_server_url():
+        try:
+            payload, _ = fetch_from_cache_server()
+            return build_bolsao_calendar(payload["bolsao_dates"].get("values", []),
+                                         payload["bolsao_names"].get("values", []))
+        except CacheServerError as e:
+            print(f"Aviso: {e}. Lendo o calendário direto do Google Sheets.")
+    ws_bolsao = get_ws("Bolsão")
+    if not ws_bolsao:
+        return {}
+    dates_vr, names_vr = batch_get_values_prefixed(ws_bolsao, ["A2:A", "C2:C"], value_render_option="FORMATTED_VALUE")
+    return build_bolsao_calendar(dates_vr.get("values", []), names_vr.get("values", []))
+
+def build_bolsao_calendar(dates_cells, names_cells):
+    """Monta o índice {data: nome} a partir das células lidas da aba 'Bolsão'."""
+    calendar = {}
+    for i, date_cell in enumerate(dates_cells):
+        if not date_cell or i >= len(names_cells) or not names_cells[i] or not names_cells[i][0]:
+            continue
+        try:
+            bolsao_date = datetime.strptime(str(date_cell[0]).strip(), "%d/%m/%Y").date()
+        except ValueError:
+            continue
+        # Se houver duas linhas para a mesma data, vale a primeira (mesmo comportamento de antes)
+        calendar.setdefault(bolsao_date, str(names_cells[i][0]).strip())
+    return calendar
+
+def set_bolsao_calendar(calendar):
+    """Substitui o calendário em memória (usado também pela carga inicial em lote)."""
+    global _bolsao_calendar, _bolsao_calendar_loaded_at
+    _bolsao_calendar = dict(calendar)
+    _bolsao_calendar_loaded_at = time.monotonic()
+
+def get_bolsao_calendar(force_refresh=False):
+    """
+    Retorna o calendário de bolsões {data: nome}, buscando na planilha apenas
+    quando o cache está vazio ou expirou. Se a busca falhar, mantém a última
+    versão conhecida e registra o aviso, em vez de esconder o erro.
+    """
+    expired = time.monotonic() - _bolsao_calendar_loaded_at > BOLSAO_CALENDAR_TTL
+    if _bolsao_calendar is None or expired or force_refresh:
+        try:
+            set_bolsao_calendar(fetch_bolsao_calendar())
+        except Exception as e:
+            if _bolsao_calendar is None:
+                print(f"Aviso: não foi possível carregar o calendário de bolsões: {e}")
+                return {}
+            print(f"Aviso: falha ao atualizar o calendário de bolsões, usando a versão em cache: {e}")
+    return _bolsao_calendar
+
 def get_bolsao_name_for_date(target_date=None):
     """Verifica a data e retorna o nome do bolsão ou 'Bolsão Avulso'."""
     if target_date is None:
         target_date = get_current_brasilia_date()
-    try:
-        ws_bolsao = get_ws("Bolsão")
-        if not ws_bolsao: return "Bolsão Avulso" # Proteção caso a aba não carregue
-        
-        dates_cells = ws_bolsao.get('A2:A', value_render_option='FORMATTED_STRING')
-        names_cells = ws_bolsao.get('C2:C')
-        dates_col = [cell[0] for cell in dates_cells if cell]
-        names_col = [cell[0] for cell in names_cells if cell]
-        
-        for i, date_str in enumerate(dates_col):
-            if i < len(names_col) and names_col[i]:
-                try:
-                    bolsao_date = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    if bolsao_date == target_date:
-                        return names_col[i]
-                except ValueError: continue
-        return "Bolsão Avulso"
-    except Exception: return "Bolsão Avulso"
+    return get_bolsao_calendar().get(target_date, BOLSAO_AVULSO)
+
+def list_bolsoes():
+    """Lista todos os bolsões do calendário como [(data, nome)], em ordem cronológica."""
+    return sorted(get_bolsao_calendar().items())
+
+def max_acertos(serie_modalidade: str) -> int:
+    """Número máximo de acertos por prova (EFAI tem 10 questões; os demais, 20)."""
+    return 10 if serie_modalidade == "1º ao 5º Ano" else 20
 
 def precos_2027(serie_modalidade: str) -> dict:
     """Busca os preços corretos no dicionário TUITION para 2027."""
@@ -426,20 +1496,87 @@ def calcula_bolsa(acertos: int, serie_modalidade: str, unidade: str) -> float:
         print(f"Aviso: Regras de bolsa não encontradas para a unidade '{unidade}'. Usando 0% de bolsa.")
         return 0.0
 
-    tabela_bolsa = regras_unidade.get(segmento)
+    tabela_bolsa = _catalogo["bolsa_tabelas"].get((unidade, segmento))
     if not tabela_bolsa:
         print(f"Aviso: Segmento '{segmento}' não possui regras de bolsa para a unidade '{unidade}'. Usando 0% de bolsa.")
         return 0.0
 
-    # Procura a faixa de acertos correta na tabela
-    for (min_acertos, max_acertos), percentual in tabela_bolsa.items():
-        if min_acertos <= acertos <= max_acertos:
-            return percentual
+    # Tabela densa do catálogo: a posição é o número de acertos
+    if 0 <= acertos < len(tabela_bolsa) and tabela_bolsa[acertos] is not None:
+        return tabela_bolsa[acertos]
     
     # Caso o número de acertos não se encaixe em nenhuma faixa (ex: acertos negativos)
     print(f"Aviso: Nenhum percentual encontrado para {acertos} acertos no segmento {segmento} da unidade {unidade}. Usando 0%.")
     return 0.0
 
+# --- VALORES DA CARTA E REGISTRO DE RESULTADO ---
+ENTRADA_PADRAO = 300.00
+BONUS_CONDICAO_HOJE = 0.05
+
+def calcula_condicoes_carta(pct_bolsa: float, serie_modalidade: str) -> dict:
+    """
+    Calcula os valores exibidos na carta: anuidade e parcelamento normal
+    (página 1), condição especial de hoje com +5% (página 1) e a proposta
+    especial genérica (página 3). Todos com entrada de R$ 300 e saldo em 12x.
+    """
+    precos = precos_2027(serie_modalidade)
+
+    # --- PÁGINA 1: ANUIDADE E PARCELAMENTO NORMAL ---
+    anuidade_com_bolsa = precos["anuidade"] * (1 - pct_bolsa)
+    saldo_restante_normal = max(anuidade_com_bolsa - ENTRADA_PADRAO, 0)
+    val_12x_normal = saldo_restante_normal / 12
+
+    # --- PÁGINA 1: CONDIÇÃO ESPECIAL (HOJE) - desconto da bolsa + 5% extra ---
+    pct_especial_hoje = min(pct_bolsa + BONUS_CONDICAO_HOJE, 1.0)
+    anuidade_especial_total = precos["anuidade"] * (1 - pct_especial_hoje)
+    saldo_restante_especial = max(anuidade_especial_total - ENTRADA_PADRAO, 0)
+    val_12x_especial = saldo_restante_especial / 12
+
+    # Formato: "Condições de hoje 66% (61% + 5%)"
+    base_int = int(round(pct_bolsa * 100))
+    total_int = int(round(pct_especial_hoje * 100))
+    texto_condicao = f"Condições de hoje {total_int}% ({base_int}% + 5%)"
+
+    # --- PÁGINA 3: PROPOSTA ESPECIAL (GENÉRICA) - mantém a lógica de +5% ---
+    proposta_pct = min(pct_bolsa + BONUS_CONDICAO_HOJE, 1.0)
+    anuidade_proposta = precos["anuidade"] * (1 - proposta_pct)
+    saldo_proposta = max(anuidade_proposta - ENTRADA_PADRAO, 0)
+    prop12_val = saldo_proposta / 12
+
+    return {
+        "anuidade_com_bolsa": anuidade_com_bolsa,
+        "entrada_normal": ENTRADA_PADRAO,
+        "val_12x_normal": val_12x_normal,
+        "pct_especial_hoje": pct_especial_hoje,
+        "entrada_especial": ENTRADA_PADRAO,
+        "val_12x_especial": val_12x_especial,
+        "texto_condicao": texto_condicao,
+        "proposta_pct": proposta_pct,
+        "entrada_proposta": ENTRADA_PADRAO,
+        "prop12_val": prop12_val,
+    }
+
+def build_resultado_record(aluno, unidade_limpa, turma, ac_mat, ac_port, pct, serie, brasilia_dt, nome_bolsao) -> dict:
+    """Monta o registro da aba 'Resultados_Bolsao' para um candidato avaliado."""
+    cond = calcula_condicoes_carta(pct, serie)
+    val_12x_normal = format_currency(cond["val_12x_normal"])
+    return {
+        "Data/Hora": brasilia_dt.strftime("%d/%m/%Y %H:%M:%S"),
+        "Nome do Aluno": aluno.strip().title(),
+        "Unidade": UNIDADES_MAP[unidade_limpa],
+        "Turma de Interesse": turma,
+        "Acertos Matemática": ac_mat,
+        "Acertos Português": ac_port,
+        "Total de Acertos": ac_mat + ac_port,
+        "% Bolsa": f"{pct*100:.0f}%",
+        "Série / Modalidade": serie,
+        "Valor Anuidade à Vista": format_currency(cond["anuidade_com_bolsa"]),
+        "Valor da 1ª Cota": val_12x_normal,  # Registrando o valor da parcela normal como referência
+        "Valor da Mensalidade com Bolsa": val_12x_normal,
+        "REGISTRO_ID": new_uuid(),
+        "Bolsão": nome_bolsao
+    }
+
 def format_currency(v: float) -> str:
     """Formata um número float para uma string de moeda brasileira (ex: R$ 1.234,56)."""
     try:
@@ -472,6 +1609,114 @@ def format_phone_mask(raw: str) -> str:
         return f"({digits[:2]}) {digits[2:6]}-{digits[6:10]}"
     return digits
 
+# --- CACHE DE RECURSOS DO WEASYPRINT ---
+# Compartilhado por todas as renderizações do processo (carta avulsa e lote):
+# o template, os bytes de style.css/imagens e as imagens já decodificadas
+# (opção `cache` do WeasyPrint) são carregados do disco uma única vez.
+# O app confere a data dos arquivos junto com o catálogo (clear_render_cache_if_changed):
+# trocar o template ou uma imagem vale sem reiniciar.
+_asset_cache = {}          # url -> (bytes, mime_type)
+_decoded_image_cache = {}  # repassado ao write_pdf(cache=...)
+_template_cache = {}
+_asset_stamps = {}         # caminho no disco -> (mtime_ns, tamanho) quando foi lido
+_asset_lock = threading.Lock()
+_asset_stats = {"hits": 0, "misses": 0}
+_url_fetcher = None
+
+def _fetch_cached_asset(url):
+    """Devolve (bytes, mime) de um arquivo local, lendo do disco só na primeira vez."""
+    if not url.startswith("file:"):
+        return None
+    with _asset_lock:
+        cached = _asset_cache.get(url)
+        if cached is not None:
+            _asset_stats["hits"] += 1
+            return cached
+    path = urllib.request.url2pathname(url.split("?")[0][len("file:"):])
+    stamp = _file_stamp(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if mime.startswith("text/"):
+        mime += "; charset=utf-8"
+    with _asset_lock:
+        _asset_stats["misses"] += 1
+        _asset_cache[url] = (data, mime)
+        _asset_stamps[path] = stamp
+    return data, mime
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def get_url_fetcher():
+    """url_fetcher do WeasyPrint com cache em memória, compatível com as APIs antiga e nova."""
+    global _url_fetcher
+    if _url_fetcher is not None:
+        return _url_fetcher
+
+    if hasattr(weasyprint, "URLFetcher"):
+        # WeasyPrint >= 66: o fetcher é uma classe e devolve URLFetcherResponse
+        class CachedURLFetcher(weasyprint.URLFetcher):
+            def fetch(self, url, headers=None):
+                cached = _fetch_cached_asset(url)
+                if cached is None:
+                    return super().fetch(url, headers)
+                data, mime = cached
+                return weasyprint.urls.URLFetcherResponse(url, data, {"Content-Type": mime})
+        _url_fetcher = CachedURLFetcher()
+    else:
+        # Versões anteriores: o fetcher é uma função que devolve um dicionário
+        def cached_url_fetcher(url):
+            cached = _fetch_cached_asset(url)
+            if cached is None:
+                return weasyprint.default_url_fetcher(url)
+            data, mime = cached
+            return {"string": data, "mime_type": mime.split(";")[0], "encoding": "utf-8", "redirected_url": url}
+        _url_fetcher = cached_url_fetcher
+    return _url_fetcher
+
+def get_render_cache_stats() -> dict:
+    """Contadores de acertos/faltas do cache de recursos das cartas."""
+    with _asset_lock:
+        return {**_asset_stats, "assets": len(_asset_cache), "decoded_images": len(_decoded_image_cache)}
+
+def clear_render_cache():
+    """Esvazia o cache de recursos (ex: após trocar o template ou as imagens)."""
+    with _asset_lock:
+        _asset_cache.clear()
+        _decoded_image_cache.clear()
+        _template_cache.clear()
+        _asset_stamps.clear()
+        _asset_stats.update(hits=0, misses=0)
+
+def clear_render_cache_if_changed() -> bool:
+    """Esvazia o cache de recursos se o template ou algum arquivo lido mudou (ou sumiu) no disco."""
+    with _asset_lock:
+        stamps = dict(_asset_stamps)
+    for path, stamp in stamps.items():
+        try:
+            changed = _file_stamp(path) != stamp
+        except OSError:
+            changed = True
+        if changed:
+            clear_render_cache()
+            return True
+    return False
+
+def _load_template(html_path) -> str:
+    with _asset_lock:
+        template = _template_cache.get(html_path)
+    if template is None:
+        stamp = _file_stamp(html_path)
+        with open(html_path, encoding="utf-8") as f:
+            template = f.read()
+        with _asset_lock:
+            _template_cache[html_path] = template
+            _asset_stamps[str(html_path)] = stamp
+    return template
+
+@perfilado("gera_pdf_html")
 def gera_pdf_html(ctx: dict) -> bytes:
     """
     Gera um arquivo PDF a partir de um template HTML e um dicionário de dados.
@@ -480,18 +1725,49 @@ def gera_pdf_html(ctx: dict) -> bytes:
     base_dir = Path(__file__).parent
     html_path = base_dir / "carta.html"
     try:
-        with open(html_path, encoding="utf-8") as f:
-            html_template = f.read()
+        html_template = _load_template(html_path)
         html_renderizado = html_template
         for k, v in ctx.items():
             html_renderizado = html_renderizado.replace(f"{{{{{k}}}}}", str(v))
-        html_obj = weasyprint.HTML(string=html_renderizado, base_url=str(base_dir))
-        return html_obj.write_pdf()
+        html_obj = weasyprint.HTML(string=html_renderizado, base_url=str(base_dir), url_fetcher=get_url_fetcher())
+        return html_obj.write_pdf(cache=_decoded_image_cache)
     except FileNotFoundError:
         raise Exception("Arquivo 'carta.html' ou 'style.css' não encontrado no diretório.")
     except Exception as e:
         raise Exception(f"Erro ao gerar PDF: {e}")
 
+HUBSPOT_COLUMNS = ["Unidade", "Nome do Candidato", "Contato ID", "Status do Contato",
+                   "Contato Realizado", "Observações", "Celular Tratado", "Nome",
+                   "E-mail", "Turma de Interesse - Geral", "Fonte original"]
+
+def check_hubspot_columns(hmap_h):
+    """Garante que a aba 'Hubspot' tenha todas as colunas usadas pelo app."""
+    missing_cols = [c for c in HUBSPOT_COLUMNS if c not in hmap_h]
+    if missing_cols:
+        raise Exception(f"As seguintes colunas necessárias não foram encontradas na aba 'Hubspot': {', '.join(missing_cols)}")
+
+def build_hubspot_df(records):
+    """Converte os registros da aba 'Hubspot' no DataFrame usado pela interface."""
+    df = pd.DataFrame(records)
+    if "Contato Realizado" in df.columns:
+        df.rename(columns={"Contato Realizado": "Contato realizado"}, inplace=True)
+    return df
+
+def values_to_records(values):
+    """
+    Converte uma matriz de valores (cabeçalho na primeira linha) em uma lista
+    de dicionários, com a mesma conversão numérica do get_all_records do gspread.
+    """
+    if not values:
+        return []
+    headers = values[0]
+    width = len(headers)
+    records = []
+    for row in values[1:]:
+        row = list(row[:width]) + [""] * (width - len(row))
+        records.append(dict(zip(headers, gspread.utils.numericise_all(row))))
+    return records
+
 def get_hubspot_data_for_activation():
     """Obtém dados da aba 'Hubspot' para a funcionalidade de carregar candidato."""
     try:
@@ -499,23 +1775,1160 @@ def get_hubspot_data_for_activation():
         if not ws_hub:
             return pd.DataFrame()
 
-        hmap_h = header_map("Hubspot")
-        cols_needed = ["Unidade", "Nome do Candidato", "Contato ID", "Status do Contato",
-                       "Contato Realizado", "Observações", "Celular Tratado", "Nome",
-                       "E-mail", "Turma de Interesse - Geral", "Fonte original"]
-        missing_cols = [c for c in cols_needed if c not in hmap_h]
-        if missing_cols:
-            raise Exception(f"As seguintes colunas necessárias não foram encontradas na aba 'Hubspot': {', '.join(missing_cols)}")
-
+        check_hubspot_columns(header_map("Hubspot"))
         data = ws_hub.get_all_records(head=1)
-        df = pd.DataFrame(data)
-        if "Contato Realizado" in df.columns:
-            df.rename(columns={"Contato Realizado": "Contato realizado"}, inplace=True)
-        return df
+        return build_hubspot_df(data)
+
+    except Exception as e:
+        raise Exception(f"❌ Falha ao carregar dados do Hubspot: {e}")
+
+# --------------------------------------------------
+# SERVIDOR DE CACHE DA UNIDADE (LEITURA INDIRETA)
+# --------------------------------------------------
+# Opcional: um computador da unidade roda servidor_cache.py, que mantém uma
+# única cópia das leituras da carga inicial e a revalida periodicamente no
+# Google. Os desktops leem dele (com If-None-Match) e, se ele não responder ou
+# a cópia estiver velha demais, leem direto do Google como antes. As escritas
+# continuam indo direto para a planilha.
+LOCAL_CONFIG_FILE = "config_local.json"
+CACHE_SERVER_ENV = "GESTOR_CACHE_URL"
+CACHE_SERVER_TOKEN_ENV = "GESTOR_CACHE_TOKEN"
+CACHE_SERVER_TIMEOUT = 3         # segundos; acima disso o desktop lê direto do Google
+CACHE_SERVER_MAX_AGE = 10 * 60   # segundos; cópia mais velha que isso é ignorada
+BOOTSTRAP_PAYLOAD_VERSION = 1
+
+_cache_server_state = {"payload": None, "etag": None}
+_cache_server_config = None
+
+class CacheServerError(Exception):
+    """Falha ao ler do servidor de cache da unidade (indisponível, erro ou cópia velha)."""
+
+def load_local_config() -> dict:
+    """Lê as configurações locais deste computador (ex: endereço do servidor de cache)."""
+    try:
+        with open(LOCAL_CONFIG_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def get_cache_server_config() -> dict:
+    """
+    Endereço e token do servidor de cache (variáveis de ambiente ou
+    config_local.json), lidos uma vez por processo: {"url", "token"}.
+    O token é compartilhado entre o servidor e os desktops da unidade.
+    """
+    global _cache_server_config
+    if _cache_server_config is None:
+        config = load_local_config()
+        url = os.environ.get(CACHE_SERVER_ENV) or config.get("cache_server_url")
+        _cache_server_config = {
+            "url": url.rstrip("/") if url else None,
+            "token": os.environ.get(CACHE_SERVER_TOKEN_ENV) or config.get("cache_server_token") or None,
+        }
+    return _cache_server_config
+
+def get_cache_server_url():
+    """Endereço do servidor de cache, ou None."""
+    return get_cache_server_config()["url"]
+
+def cache_server_headers() -> dict:
+    """Cabeçalho de autenticação enviado ao servidor de cache (vazio sem token)."""
+    token = get_cache_server_config()["token"]
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def fetch_from_cache_server(url=None):
+    """
+    Lê o payload da carga inicial do servidor de cache. Envia o ETag da última
+    cópia recebida; em 304 reaproveita a cópia em memória.
+    Retorna (payload, mudou) ou levanta CacheServerError.
+    """
+    url = url or get_cache_server_url()
+    if not url:
+        raise CacheServerError("servidor de cache não configurado")
+    headers = cache_server_headers()
+    if _cache_server_state["etag"] and _cache_server_state["payload"] is not None:
+        headers["If-None-Match"] = _cache_server_state["etag"]
+    try:
+        resp = requests.get(f"{url}/bootstrap", headers=headers, timeout=CACHE_SERVER_TIMEOUT)
+    except requests.RequestException as e:
+        raise CacheServerError(f"servidor de cache indisponível: {e}")
+
+    if resp.status_code == 304:
+        payload, changed = _cache_server_state["payload"], False
+    elif resp.status_code == 200:
+        try:
+            payload = resp.json()
+        except ValueError:
+            raise CacheServerError("resposta inválida do servidor de cache")
+        if payload.get("version") != BOOTSTRAP_PAYLOAD_VERSION:
+            raise CacheServerError(f"versão de payload incompatível: {payload.get('version')}")
+        changed = True
+    elif resp.status_code == 401:
+        raise CacheServerError("servidor de cache recusou o token (confira 'cache_server_token')")
+    else:
+        raise CacheServerError(f"servidor de cache respondeu HTTP {resp.status_code}")
+
+    if time.time() - payload.get("fetched_at", 0) > CACHE_SERVER_MAX_AGE:
+        raise CacheServerError("a cópia do servidor de cache está desatualizada")
+    if changed:
+        _cache_server_state.update(payload=payload, etag=resp.headers.get("ETag"))
+    return payload, changed
+
+def request_cache_revalidation():
+    """
+    Avisa o servidor de cache (se houver) que a planilha mudou, para que os
+    outros desktops vejam a escrita sem esperar a próxima revalidação.
+    Não bloqueia e ignora falhas.
+    """
+    url = get_cache_server_url()
+    if not url:
+        return
 
+    def _notify():
+        try:
+            requests.post(f"{url}/revalidate", headers=cache_server_headers(), timeout=CACHE_SERVER_TIMEOUT)
+        except requests.RequestException:
+            pass
+
+    threading.Thread(target=_notify, daemon=True).start()
+
+# --------------------------------------------------
+# CARGA INICIAL EM LOTE (BOOTSTRAP)
+# --------------------------------------------------
+def fetch_bootstrap_payload(wb, include_resultados=True):
+    """
+    Lê da planilha as respostas brutas da carga inicial em 3 chamadas:
+      1. fetch_sheet_metadata com id, título e tamanho de todas as abas;
+      2. um values_batch_get formatado com os cabeçalhos de todas as abas,
+         a aba 'Hubspot' inteira e as colunas A/C da aba 'Bolsão';
+      3. um values_batch_get não formatado com as colunas de 'Resultados_Bolsao'.
+    Os dois lotes são separados porque o Hubspot e o calendário são lidos
+    formatados (como no get_all_records) e os Resultados, não formatados.
+    O payload é serializável em JSON: é o mesmo servido pelo servidor de cache.
+    Com include_resultados=False a 3ª leitura fica de fora (o app lê os
+    Resultados depois, em janelas, com iter_resultados_windows).
+    """
+    sheets, header_vranges, extra_vranges = fetch_sheets_and_headers(wb, extra_ranges=[
+        prefixed_range("Hubspot"),
+        prefixed_range("Bolsão", "A2:A"),
+        prefixed_range("Bolsão", "C2:C"),
+    ])
+    hub_vr, bolsao_dates_vr, bolsao_names_vr = (list(extra_vranges) + [{}, {}, {}])[:3]
+
+    res_headers = next(((vr.get("values") or [[]])[0]
+                        for props, vr in zip(sheets, header_vranges)
+                        if props["title"] == RESULTADOS_TAB), [])
+    hmap_res = build_header_map(res_headers)
+    columns_needed = resultados_columns_needed(hmap_res)
+    data_resp = {}
+    if include_resultados:
+        ranges = [prefixed_range(RESULTADOS_TAB, r) for r in resultados_column_ranges(hmap_res, columns_needed)]
+        data_resp = wb.values_batch_get(ranges, params={"valueRenderOption": "UNFORMATTED_VALUE"})
+
+    return {
+        "version": BOOTSTRAP_PAYLOAD_VERSION,
+        "fetched_at": time.time(),
+        "sheets": sheets,
+        "headers": header_vranges,
+        "hubspot": hub_vr,
+        "bolsao_dates": bolsao_dates_vr,
+        "bolsao_names": bolsao_names_vr,
+        "resultados_columns": columns_needed,
+        "resultados": data_resp.get("valueRanges", []),
+        "resultados_pendentes": not include_resultados,
+    }
+
+def build_bootstrap_data(payload, source="google"):
+    """Aplica os metadados e monta snapshot, Hubspot e calendário a partir do payload."""
+    apply_sheet_metadata(payload["sheets"], payload["headers"], source=source)
+
+    hub_values = payload["hubspot"].get("values", [])
+    hmap_hub = build_header_map(hub_values[0] if hub_values else [])
+    try:
+        check_hubspot_columns(hmap_hub)
+        hubspot_df = build_hubspot_df(values_to_records(hub_values))
     except Exception as e:
         raise Exception(f"❌ Falha ao carregar dados do Hubspot: {e}")
 
+    calendar = build_bolsao_calendar(payload["bolsao_dates"].get("values", []),
+                                     payload["bolsao_names"].get("values", []))
+    set_bolsao_calendar(calendar)
+
+    snapshot = build_resultados_snapshot(payload["resultados_columns"], payload["resultados"])
+    return {
+        "snapshot": snapshot,
+        "resultados_pendentes": payload.get("resultados_pendentes", False),
+        "hubspot_df": hubspot_df,
+        "bolsao_calendar": calendar,
+        "header_maps": {RESULTADOS_TAB: header_map(RESULTADOS_TAB), "Hubspot": hmap_hub},
+    }
+
+def bootstrap_initial_data(stream_resultados=False):
+    """
+    Carrega tudo o que o app precisa na abertura com o mínimo de idas à API.
+    Se houver servidor de cache na unidade, lê dele (nenhuma chamada à API);
+    senão, ou se ele falhar, abre a planilha (só na primeira vez) e faz as 3
+    leituras de fetch_bootstrap_payload.
+    Retorna as mesmas estruturas das funções individuais, a origem dos dados,
+    o número de chamadas e os tempos da primeira chamada (inclui a
+    autenticação) e da carga total.
+    Com stream_resultados=True (lendo do Google), o snapshot volta vazio e
+    "resultados_pendentes" indica que as linhas devem vir de iter_resultados_windows.
+    """
+    start = time.perf_counter()
+    if get_cache_server_url():
+        try:
+            payload, _ = fetch_from_cache_server()
+            dados = build_bootstrap_data(payload, source="cache_server")
+            elapsed = time.perf_counter() - start
+            dados.update(source="cache_server", api_calls=0, timings={
+                "token_source": None, "first_call_seconds": elapsed, "total_seconds": elapsed,
+            })
+            return dados
+        except CacheServerError as e:
+            print(f"Aviso: {e}. Lendo direto do Google Sheets.")
+
+    api_calls = 0
+    if workbook_cache is None:
+        api_calls += 1
+    wb = get_cached_workbook()
+    if wb is None:
+        raise Exception("❌ Não foi possível abrir a planilha.")
+    first_call_seconds = time.perf_counter() - start
+
+    dados = build_bootstrap_data(fetch_bootstrap_payload(wb, include_resultados=not stream_resultados))
+    api_calls += 2 if stream_resultados else 3
+    dados.update(source="google", api_calls=api_calls, timings={
+        "token_source": CLIENT_TIMINGS["token_source"],
+        "first_call_seconds": first_call_seconds,
+        "total_seconds": time.perf_counter() - start,
+    })
+    return dados
+
+# --------------------------------------------------
+# PARTIÇÕES DE RESULTADOS (CAMPANHAS ARQUIVADAS)
+# --------------------------------------------------
+# A aba 'Resultados_Bolsao' guarda só a partição ativa (a campanha atual) e é a
+# única lida na abertura. Campanhas anteriores são arquivadas, por ano da
+# 'Data/Hora' ou por bolsão ("resultados_particao" no config_local.json), numa
+# aba 'Resultados_Bolsao_<chave>' ou num arquivo local arquivo_resultados/<chave>.json.gz,
+# e só são lidas quando alguém as consulta. Partições arquivadas não mudam,
+# então ficam em memória depois da primeira leitura.
+RESULTADOS_TAB = "Resultados_Bolsao"
+RESULTADOS_ARCHIVE_PREFIX = RESULTADOS_TAB + "_"
+RESULTADOS_ARCHIVE_DIR = "arquivo_resultados"
+PARTICAO_POR_ANO, PARTICAO_POR_BOLSAO = "ano", "bolsao"
+
+_partition_cache = {}
+
+def get_partition_scheme() -> str:
+    """Critério de partição configurado: 'ano' (padrão) ou 'bolsao'."""
+    scheme = load_local_config().get("resultados_particao", PARTICAO_POR_ANO)
+    return scheme if scheme in (PARTICAO_POR_ANO, PARTICAO_POR_BOLSAO) else PARTICAO_POR_ANO
+
+def partition_key(data_hora, bolsao, scheme=PARTICAO_POR_ANO) -> str:
+    """Chave da partição de uma linha (ex: '2026' ou 'Bolsão 12/10'), ou '' se não der para saber."""
+    if scheme == PARTICAO_POR_BOLSAO:
+        return str(bolsao or "").strip()
+    dt = parse_data_hora(data_hora)
+    return str(dt.year) if dt else ""
+
+def partition_slug(chave) -> str:
+    """Chave em forma segura para título de aba e nome de arquivo ('Bolsão 12/10' -> 'Bolsao_12_10')."""
+    return re.sub(r"[^A-Za-z0-9]+", "_", strip_accents(str(chave))).strip("_")
+
+def list_resultados_partitions() -> list:
+    """
+    Partições arquivadas conhecidas, sem chamadas à API (os títulos das abas já
+    vêm nos metadados): [{"chave", "origem": "aba" | "arquivo", "local", "linhas"}].
+    """
+    partitions = []
+    for title, tab in get_sheet_metadata()["tabs"].items():
+        if title.startswith(RESULTADOS_ARCHIVE_PREFIX):
+            partitions.append({"chave": title[len(RESULTADOS_ARCHIVE_PREFIX):], "origem": "aba",
+                               "local": title, "linhas": max(tab["rows"] - 1, 0)})
+    for path in sorted(Path(RESULTADOS_ARCHIVE_DIR).glob("*.json.gz")):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                meta = json.load(f)
+            partitions.append({"chave": meta["chave"], "origem": "arquivo", "local": str(path), "linhas": meta["linhas"]})
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Aviso: arquivo de partição ilegível ({path}): {e}")
+    return sorted(partitions, key=lambda p: p["chave"], reverse=True)
+
+def load_resultados_partition(partition) -> ResultadosSnapshot:
+    """Snapshot (somente leitura) de uma partição arquivada, lido na primeira consulta."""
+    key = (partition["origem"], partition["local"])
+    if partition["origem"] == "arquivo":
+        key += (os.path.getmtime(partition["local"]),)
+    snapshot = _partition_cache.get(key)
+    if snapshot is not None:
+        return snapshot
+    if partition["origem"] == "arquivo":
+        with gzip.open(partition["local"], "rt", encoding="utf-8") as f:
+            doc = json.load(f)
+        hmap = build_header_map(doc["cabecalho"])
+        columns_needed = resultados_columns_needed(hmap)
+        # Mesmo formato dos valueRanges de coluna lidos da API
+        vranges = [{"values": [[row[hmap[c] - 1] if hmap[c] - 1 < len(row) else ""] for row in doc["valores"]]}
+                   for c in columns_needed]
+        snapshot = build_resultados_snapshot(columns_needed, vranges)
+    else:
+        snapshot = load_resultados_snapshot(partition["local"])
+    _partition_cache[key] = snapshot
+    return snapshot
+
+def arquivar_particao(chave, destino="aba", scheme=None, progress=None) -> dict:
+    """
+    Move as linhas de uma campanha de 'Resultados_Bolsao' para a partição
+    arquivada (aba ou arquivo local) e as remove da aba ativa. Antes de apagar,
+    confere se as linhas ainda têm os mesmos REGISTRO_IDs (outro operador pode
+    ter mexido na aba enquanto isso); se não tiverem, ou se a remoção falhar, a
+    aba/arquivo recém-criado é apagado e nada muda, para que dê para tentar de
+    novo. Retorna {"chave", "linhas", "local"}.
+    """
+    scheme = scheme or get_partition_scheme()
+    chave = str(chave).strip()
+    if scheme == PARTICAO_POR_ANO and chave == str(get_current_brasilia_date().year):
+        raise Exception("❌ A campanha do ano atual é a partição ativa e não pode ser arquivada.")
+    if scheme == PARTICAO_POR_BOLSAO and chave == get_bolsao_name_for_date():
+        raise Exception("❌ O bolsão de hoje é a partição ativa e não pode ser arquivado.")
+    slug = partition_slug(chave)
+    if not slug:
+        raise Exception("❌ Informe a campanha (ano ou bolsão) a arquivar.")
+    title = RESULTADOS_ARCHIVE_PREFIX + slug
+    path = Path(RESULTADOS_ARCHIVE_DIR) / f"{slug}.json.gz"
+    tabs = get_sheet_metadata()["tabs"]
+    if (destino == "aba" and title in tabs) or (destino == "arquivo" and path.exists()):
+        raise Exception(f"❌ A campanha '{chave}' já foi arquivada.")
+
+    def report(etapa):
+        if progress:
+            progress(etapa)
+
+    report("Lendo a aba ativa...")
+    wb = get_cached_workbook()
+    ws = get_ws(RESULTADOS_TAB)
+    hmap = header_map(RESULTADOS_TAB)
+    headers = tabs[RESULTADOS_TAB]["headers"]
+    last_col = a1_col_letter(len(headers))
+    rows = (batch_get_values_prefixed(ws, [f"A2:{last_col}"])[0].get("values", []))
+    pos_data, pos_bolsao, pos_id = hmap["Data/Hora"] - 1, hmap["Bolsão"] - 1, hmap["REGISTRO_ID"] - 1
+
+    def cell(row, pos):
+        return row[pos] if pos < len(row) else ""
+
+    selected = [(k + 2, row) for k, row in enumerate(rows)
+                if partition_key(cell(row, pos_data), cell(row, pos_bolsao), scheme) == chave]
+    if not selected:
+        raise Exception(f"❌ Nenhuma linha da campanha '{chave}' na aba ativa.")
+    report(f"Arquivando {len(selected)} linha(s)...")
+
+    if destino == "aba":
+        # 'Data/Hora' também formatada: gravada crua, a aba de arquivo mostraria números de série
+        col_data = a1_col_letter(pos_data + 1)
+        datas = batch_get_values_prefixed(ws, [f"{col_data}2:{col_data}"], value_render_option="FORMATTED_VALUE")[0].get("values", [])
+        datas_selecionadas = [[cell(datas[r - 2], 0) if r - 2 < len(datas) else ""] for r, _ in selected]
+        resp = wb.batch_update({"requests": [{"addSheet": {"properties": {
+            "title": title, "gridProperties": {"rowCount": len(selected) + 1, "columnCount": len(headers)}}}}]})
+        archive_sheet_id = resp["replies"][0]["addSheet"]["properties"]["sheetId"]
+        local = title
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        local = str(path)
+
+    def desfazer():
+        """Apaga a partição recém-criada, deixando a campanha pronta para nova tentativa."""
+        try:
+            if destino == "aba":
+                wb.batch_update({"requests": [{"deleteSheet": {"sheetId": archive_sheet_id}}]})
+                invalidate_sheet_metadata()
+            elif path.exists():
+                path.unlink()
+        except Exception as e:
+            print(f"Aviso: não foi possível apagar '{local}'; remova-a antes de tentar de novo: {e}")
+
+    try:
+        if destino == "aba":
+            # Valores crus (IDs e números exatos) e, por cima, a 'Data/Hora' como o usuário digitaria
+            wb.values_batch_update({"valueInputOption": "RAW", "data": [{
+                "range": prefixed_range(title, "A1"), "values": [list(headers)] + [row for _, row in selected]}]})
+            wb.values_batch_update({"valueInputOption": "USER_ENTERED", "data": [{
+                "range": prefixed_range(title, f"{col_data}2"), "values": datas_selecionadas}]})
+        else:
+            # No arquivo a 'Data/Hora' fica como número de série, que não depende da localidade da planilha
+            tmp = path.with_suffix(".tmp")
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump({"chave": chave, "particao": scheme, "linhas": len(selected), "arquivado_em": time.time(),
+                           "cabecalho": list(headers), "valores": [row for _, row in selected]},
+                          f, ensure_ascii=False, default=str)
+            os.replace(tmp, path)
+
+        report("Removendo as linhas da aba ativa...")
+        current = batch_get_values_prefixed(ws, [f"{a1_col_letter(pos_id + 1)}2:{a1_col_letter(pos_id + 1)}"])[0].get("values", [])
+        for r, row in selected:
+            now = current[r - 2][0] if r - 2 < len(current) and current[r - 2] else ""
+            if str(now) != str(cell(row, pos_id)):
+                raise Exception("❌ A aba ativa mudou durante o arquivamento; nada foi alterado. Tente de novo.")
+        sheet_id = tabs[RESULTADOS_TAB]["id"]
+        wb.batch_update({"requests": [
+            {"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": a - 1, "endIndex": b}}}
+            for a, b in reversed(row_blocks(r for r, _ in selected))
+        ]})
+    except Exception:
+        desfazer()
+        raise
+    invalidate_sheet_metadata()
+    request_cache_revalidation()
+    return {"chave": chave, "linhas": len(selected), "local": local}
+
+# --------------------------------------------------
+# SHARDS POR UNIDADE (UMA PLANILHA OU ABA POR UNIDADE)
+# --------------------------------------------------
+# Opcional: em vez de todas as unidades dividirem a mesma 'Resultados_Bolsao',
+# cada unidade pode ter a sua planilha (ou aba). O mapa fica no config_local.json:
+#   "unidade": "BANGU",
+#   "shards": {"BANGU": {"planilha": "<url ou id>", "aba": "Resultados_Bolsao"},
+#              "CAMPO GRANDE": {"aba": "Resultados_CAMPO_GRANDE"}}
+# Sem "planilha", o shard fica na planilha principal (SPREAD_URL); sem "aba",
+# usa 'Resultados_Bolsao'. Unidades fora do mapa continuam na aba principal.
+# O desktop abre só o shard da sua "unidade": carga inicial, feed de
+# alterações, Formulário e arquivamento leem e gravam nele, que por isso
+# precisa ter também as abas 'Hubspot' e 'Bolsão' (ex: IMPORTRANGE da planilha
+# principal). Registros de outra unidade (ex: importação de um arquivo com
+# várias unidades) vão para o shard da unidade deles. A visão de todas as
+# unidades (relatórios, exportação) lê os shards em paralelo.
+# A cota da API é da conta de serviço, não da planilha: os shards deixam cada
+# aba do tamanho de uma unidade (carga e feed proporcionais a ela), mas as
+# chamadas de todos os desktops continuam somando na mesma cota.
+SHARD_ABA_PADRAO = "Resultados_Bolsao"
+SHARD_FANOUT_WORKERS = 6   # shards lidos ao mesmo tempo na visão de todas as unidades
+
+_shard_workbooks = {}
+_shard_workbooks_lock = threading.Lock()
+_local_shard = {"unidade": None, "planilha": SPREAD_URL, "aba": SHARD_ABA_PADRAO}
+
+class ShardWriteError(Exception):
+    """
+    Falha ao gravar em um ou mais shards. `rownums` segue a ordem dos registros
+    (como em append_resultados) e `falhou` tem os índices dos que não foram gravados.
+    """
+
+    def __init__(self, message, rownums, falhou):
+        super().__init__(message)
+        self.rownums = rownums
+        self.falhou = falhou
+
+def get_shard_map() -> dict:
+    """Mapa {unidade_limpa: {"planilha", "aba"}} do config_local.json, com os valores padrão preenchidos."""
+    shards = {}
+    for unidade, shard in (load_local_config().get("shards") or {}).items():
+        if unidade not in UNIDADES_MAP:
+            print(f"Aviso: unidade desconhecida no mapa de shards: {unidade}")
+            continue
+        shard = shard or {}
+        shards[unidade] = {"planilha": shard.get("planilha") or SPREAD_URL, "aba": shard.get("aba") or SHARD_ABA_PADRAO}
+    return shards
+
+def shard_for(unidade_limpa, shards=None) -> dict:
+    """Shard de uma unidade ({"planilha", "aba"}); a aba principal se ela não estiver no mapa."""
+    shards = get_shard_map() if shards is None else shards
+    return shards.get(unidade_limpa, {"planilha": SPREAD_URL, "aba": SHARD_ABA_PADRAO})
+
+def get_local_shard() -> dict:
+    """Shard aberto por este computador: {"unidade", "planilha", "aba"}."""
+    return dict(_local_shard)
+
+def is_local_shard(shard) -> bool:
+    return shard["planilha"] == _local_shard["planilha"] and shard["aba"] == _local_shard["aba"]
+
+def init_shards():
+    """Escolhe o shard deste computador ("unidade" no config_local.json) e a aba de Resultados do app."""
+    global RESULTADOS_TAB, RESULTADOS_ARCHIVE_PREFIX
+    unidade = load_local_config().get("unidade")
+    unidade = unidade if unidade in UNIDADES_MAP else None
+    _local_shard.update(unidade=unidade, **shard_for(unidade))
+    RESULTADOS_TAB = _local_shard["aba"]
+    RESULTADOS_ARCHIVE_PREFIX = RESULTADOS_TAB + "_"
+
+def open_spreadsheet(planilha):
+    """Abre (uma vez por processo) a planilha de um shard, pela URL ou pelo id."""
+    wb = _shard_workbooks.get(planilha)
+    if wb is None:
+        client = get_cached_client()
+        wb = client.open_by_url(planilha) if planilha.startswith("http") else client.open_by_key(planilha)
+        with _shard_workbooks_lock:
+            wb = _shard_workbooks.setdefault(planilha, wb)
+    return wb
+
+def _append_to_shard(shard, records):
+    """Anexa registros à aba de outro shard, na ordem do cabeçalho dela (1 leitura + 1 append)."""
+    wb = open_spreadsheet(shard["planilha"])
+    resp = wb.values_get(prefixed_range(shard["aba"], "1:1"))
+    headers = [str(h).strip() for h in (resp.get("values") or [[]])[0]]
+    rows = [[record.get(h, "") if h else "" for h in headers] for record in records]
+    wb.values_append(prefixed_range(shard["aba"], "A1"),
+                     params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
+                     body={"values": rows})
+
+def append_resultados(records) -> list:
+    """
+    Anexa registros de Resultados, cada um no shard da sua unidade (1 append por
+    shard). Retorna o número da linha de cada registro, na mesma ordem; os
+    gravados em outro shard (ou sem número informado pela API) voltam com None.
+    Se algum shard falhar, os demais são gravados assim mesmo e ShardWriteError
+    informa quais registros ficaram de fora.
+    """
+    if not records:
+        return []
+    shards = get_shard_map()
+    if not shards:
+        first_row = append_records(RESULTADOS_TAB, records)
+        return [first_row + k if first_row else None for k in range(len(records))]
+
+    unidade_curta = {v: k for k, v in UNIDADES_MAP.items()}
+    grupos = {}
+    for k, record in enumerate(records):
+        shard = shard_for(unidade_curta.get(record.get("Unidade")), shards)
+        grupos.setdefault((shard["planilha"], shard["aba"]), []).append(k)
+
+    rownums, falhou, erros = [None] * len(records), set(), []
+    for (planilha, aba), indices in grupos.items():
+        shard = {"planilha": planilha, "aba": aba}
+        try:
+            if is_local_shard(shard):
+                first_row = append_records(RESULTADOS_TAB, [records[k] for k in indices])
+                for j, k in enumerate(indices):
+                    rownums[k] = first_row + j if first_row else None
+            else:
+                _append_to_shard(shard, [records[k] for k in indices])
+        except Exception as e:
+            falhou.update(indices)
+            erros.append(f"'{aba}' ({planilha}): {e}")
+    if falhou:
+        raise ShardWriteError("Falha ao gravar no(s) shard(s) " + "; ".join(erros), rownums, falhou)
+    return rownums
+
+def record_in_local_shard(record, shards=None) -> bool:
+    """True se o registro pertence ao shard aberto por este computador (e, portanto, ao snapshot local)."""
+    unidade_curta = {v: k for k, v in UNIDADES_MAP.items()}
+    return is_local_shard(shard_for(unidade_curta.get(record.get("Unidade")), shards))
+
+def shard_groups(shards=None) -> dict:
+    """{(planilha, aba): [unidades]} com todas as unidades, agrupadas pelo shard de cada uma."""
+    shards = get_shard_map() if shards is None else shards
+    grupos = {}
+    for unidade in UNIDADES_LIMPAS:
+        shard = shard_for(unidade, shards)
+        grupos.setdefault((shard["planilha"], shard["aba"]), []).append(unidade)
+    return grupos
+
+def read_shard_resultados(planilha, aba):
+    """
+    Lê a aba de Resultados de um shard inteira numa chamada (o cabeçalho vem
+    junto, então não depende dos metadados da planilha local).
+    Retorna (colunas, séries brutas por coluna).
+    """
+    wb = open_spreadsheet(planilha)
+    resp = wb.values_batch_get([prefixed_range(aba)], params={"valueRenderOption": "UNFORMATTED_VALUE"})
+    values = (resp.get("valueRanges") or [{}])[0].get("values", [])
+    hmap = build_header_map(values[0] if values else [])
+    missing = [c for c in RESULTADOS_COLUMNS if c not in hmap]
+    if missing:
+        raise RuntimeError(f"faltam colunas: {', '.join(missing)}")
+    columns_needed = resultados_columns_needed(hmap)
+    series = {}
+    for c in columns_needed:
+        i = hmap[c] - 1
+        series[c] = [row[i] if i < len(row) else "" for row in values[1:]]
+    return columns_needed, series
+
+def load_all_shards_snapshot(workers=SHARD_FANOUT_WORKERS) -> ResultadosSnapshot:
+    """
+    Visão de todas as unidades para relatórios e exportação: lê a aba de cada
+    shard em paralelo (1 chamada por shard) e junta as linhas num snapshot
+    somente leitura. Um REGISTRO_ID presente em mais de um shard (ex: linhas
+    copiadas na migração para o shard) entra uma vez só. Se algum shard falhar,
+    levanta RuntimeError em vez de devolver totais incompletos.
+    """
+    grupos = list(shard_groups())
+
+    def ler(shard):
+        try:
+            return read_shard_resultados(*shard), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(grupos)))) as pool:
+        lidos = list(pool.map(ler, grupos))
+    falhas = [f"'{aba}' ({planilha}): {erro}" for (planilha, aba), (_, erro) in zip(grupos, lidos) if erro]
+    if falhas:
+        raise RuntimeError("Falha ao ler o(s) shard(s) de Resultados: " + "; ".join(falhas))
+
+    columns = []
+    for cols, _ in (r for r, _ in lidos):
+        columns.extend(c for c in cols if c not in columns)
+    merged = {c: [] for c in columns}
+    vistos = set()
+    for _, series in (r for r, _ in lidos):
+        keep = []
+        for i, rid in enumerate(series["REGISTRO_ID"]):
+            rid = str(rid)
+            if rid and rid in vistos:
+                continue
+            vistos.add(rid)
+            keep.append(i)
+        for c in columns:
+            col = series.get(c) or [""] * len(series["REGISTRO_ID"])
+            merged[c].extend(col[i] for i in keep)
+    snapshot = ResultadosSnapshot(columns, merged)
+    snapshot.sheet_row_count = 0  # linhas de várias planilhas: nenhuma tem número de linha válido aqui
+    return snapshot
+
+# --------------------------------------------------
+# FEED DE ALTERAÇÕES DE RESULTADOS (SEGUNDO PLANO)
+# --------------------------------------------------
+# Cada verificação lê, numa só chamada, o REGISTRO_ID e as colunas editáveis
+# de todas as linhas, calcula a impressão digital de cada linha e compara com
+# o snapshot. Só as linhas novas são lidas por inteiro (segunda chamada, e só
+# quando há novidade). Com servidor de cache, a verificação é um If-None-Match.
+CHANGE_FEED_MIN_INTERVAL = 10   # segundos, com atividade recente
+CHANGE_FEED_MAX_INTERVAL = 120  # segundos, com a planilha parada ou a cota apertada
+CHANGE_FEED_BACKOFF = 1.5       # crescimento do intervalo a cada verificação sem mudança
+CHANGE_FEED_QUOTA_SHARE = 0.5   # acima desta fração da cota por minuto, o feed desacelera
+
+def _column_values(columns, vranges):
+    """Converte valueRanges de colunas em {coluna: valores}, todas com o mesmo tamanho."""
+    values = {c: [row[0] if row else "" for row in vr.get("values", [])] for c, vr in zip(columns, vranges)}
+    n_rows = max((len(v) for v in values.values()), default=0)
+    for v in values.values():
+        v.extend([""] * (n_rows - len(v)))
+    return values, n_rows
+
+def diff_resultados(snapshot, values, n_rows):
+    """
+    Compara colunas lidas da planilha ({coluna: valores brutos}, posição k =
+    linha k + 2) com o snapshot, pela impressão digital das colunas lidas.
+    Retorna as linhas alteradas [(id, {coluna: valor})], as novas [(id,
+    número da linha)] e os registros cujo número de linha mudou {id: linha}.
+    """
+    ids = values["REGISTRO_ID"]
+    cols = [c for c in values if c != "REGISTRO_ID"]
+    typed = {c: _typed_column(c, values[c]) for c in cols}
+    updated, new_rows, rownums = [], [], {}
+    for k in range(n_rows):
+        rid = str(ids[k]).strip() if ids[k] not in (None, "") else ""
+        if not rid:
+            continue
+        rownum = k + 2
+        i = snapshot.id_to_index.get(rid)
+        if i is None:
+            new_rows.append((rid, rownum))
+            continue
+        if snapshot.rownum_for_id(rid) != rownum:
+            rownums[rid] = rownum
+        if row_fingerprint(typed[c][k] for c in cols) != snapshot.fingerprint(i, cols):
+            updated.append((rid, {c: values[c][k] for c in cols}))
+    return {"updated": updated, "new_rows": new_rows, "rownums": rownums}
+
+def row_blocks(rownums):
+    """Agrupa números de linha em blocos consecutivos [(primeira, última)], em ordem crescente."""
+    blocks = []
+    for r in sorted(rownums):
+        if blocks and r == blocks[-1][1] + 1:
+            blocks[-1][1] = r
+        else:
+            blocks.append([r, r])
+    return [tuple(b) for b in blocks]
+
+def fetch_resultados_rows(rownums, hmap, columns_needed):
+    """
+    Lê linhas inteiras de 'Resultados_Bolsao' em uma chamada (linhas
+    consecutivas viram um só range) e devolve {linha: registro}.
+    """
+    blocks = row_blocks(rownums)
+    last_col = a1_col_letter(max(hmap[c] for c in columns_needed))
+    vranges = batch_get_values_prefixed(get_ws(RESULTADOS_TAB), [f"A{a}:{last_col}{b}" for a, b in blocks])
+    records = {}
+    for (first, _), vr in zip(blocks, vranges):
+        for offset, row in enumerate(vr.get("values", [])):
+            records[first + offset] = {c: row[hmap[c] - 1] if hmap[c] - 1 < len(row) else "" for c in columns_needed}
+    return records
+
+def poll_resultados_changes(snapshot):
+    """
+    Uma verificação do feed. Retorna {"updated", "new", "rownums", "as_of",
+    "api_calls"}; "new" traz (registro, número da linha) prontos para o
+    snapshot e "as_of" é o instante (monotonic) em que os dados foram lidos,
+    para não sobrescrever edições locais mais novas.
+    """
+    if get_cache_server_url():
+        try:
+            payload, changed = fetch_from_cache_server()
+            as_of = time.monotonic() - max(0.0, time.time() - payload["fetched_at"])
+            result = {"updated": [], "new": [], "rownums": {}, "as_of": as_of, "api_calls": 0}
+            if changed:
+                values, n_rows = _column_values(payload["resultados_columns"], payload["resultados"])
+                diff = diff_resultados(snapshot, values, n_rows)
+                result.update(updated=diff["updated"], rownums=diff["rownums"],
+                              new=[({c: values[c][r - 2] for c in values}, r) for _, r in diff["new_rows"]])
+            return result
+        except CacheServerError:
+            pass  # lê direto do Google
+
+    as_of = time.monotonic()
+    hmap = header_map(RESULTADOS_TAB)
+    watched = ["REGISTRO_ID"] + form_edit_columns(hmap)
+    vranges = batch_get_values_prefixed(get_ws(RESULTADOS_TAB), resultados_column_ranges(hmap, watched))
+    values, n_rows = _column_values(watched, vranges)
+    diff = diff_resultados(snapshot, values, n_rows)
+    new, api_calls = [], 1
+    if diff["new_rows"]:
+        rows = fetch_resultados_rows([r for _, r in diff["new_rows"]], hmap, resultados_columns_needed(hmap))
+        api_calls += 1
+        new = [(rows[r], r) for _, r in diff["new_rows"] if r in rows]
+    return {"updated": diff["updated"], "new": new, "rownums": diff["rownums"], "as_of": as_of, "api_calls": api_calls}
+
+class ResultadosChangeFeed:
+    """
+    Roda poll_resultados_changes em uma thread com intervalo adaptativo: volta
+    ao mínimo quando há mudanças ou atividade local, cresce enquanto a
+    planilha está parada e vai ao máximo quando a cota está apertada.
+    Os resultados com mudanças ficam numa fila, que a interface esvazia com
+    pending() na thread do Tk (o snapshot só é alterado lá). A thread do feed
+    nunca lê o snapshot em uso: compara com a cópia entregue por publish(),
+    que a interface chama na thread do Tk.
+    """
+
+    def __init__(self, snapshot=None):
+        self.interval = CHANGE_FEED_MIN_INTERVAL
+        self._lock = threading.Lock()
+        self._frozen = None
+        self._frozen_key = None
+        if snapshot is not None:
+            self.publish(snapshot)
+        self._results = queue.Queue()
+        self._due = time.monotonic() + self.interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def publish(self, snapshot):
+        """Entrega ao feed uma cópia do snapshot, se ele mudou desde a última (chamar na thread que o altera)."""
+        key = (id(snapshot), snapshot.version)
+        if key == self._frozen_key:
+            return
+        frozen = snapshot.frozen_copy(form_edit_columns(dict.fromkeys(snapshot.column_names)))
+        with self._lock:
+            self._frozen, self._frozen_key = frozen, key
+
+    def notify_activity(self):
+        """Chamado quando este operador grava algo: a próxima verificação vem logo."""
+        self.interval = CHANGE_FEED_MIN_INTERVAL
+        self._due = min(self._due, time.monotonic() + self.interval)
+        self._wakeup.set()
+
+    def pending(self):
+        """Retira da fila os resultados ainda não aplicados."""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def next_interval(self, changed):
+        usage = get_api_usage()
+        if usage["throttled"]:
+            return CHANGE_FEED_MAX_INTERVAL
+        interval = CHANGE_FEED_MIN_INTERVAL if changed else self.interval * CHANGE_FEED_BACKOFF
+        if usage["calls"] > SHEETS_READ_QUOTA_PER_MINUTE * CHANGE_FEED_QUOTA_SHARE:
+            interval *= 2
+        return min(interval, CHANGE_FEED_MAX_INTERVAL)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            while not self._stopped.is_set() and time.monotonic() < self._due:
+                self._wakeup.wait(self._due - time.monotonic())
+                self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            with self._lock:
+                snapshot = self._frozen
+            changed = False
+            if snapshot is not None:
+                try:
+                    result = poll_resultados_changes(snapshot)
+                    changed = bool(result["updated"] or result["new"] or result["rownums"])
+                    if changed:
+                        self._results.put(result)
+                    self.interval = self.next_interval(changed)
+                except Exception as e:
+                    print(f"Aviso: falha ao verificar alterações em Resultados: {e}")
+                    self.interval = min(self.interval * 2, CHANGE_FEED_MAX_INTERVAL)
+            self._due = time.monotonic() + self.interval
+
+# --------------------------------------------------
+# GRAVAÇÃO DO FORMULÁRIO (CONCORRÊNCIA OTIMISTA)
+# --------------------------------------------------
+# O Formulário guarda os valores da linha no momento em que foi aberta (base).
+# Ao salvar, a linha atual é relida (1 chamada, logo antes da escrita, já que
+# a API não tem escrita condicional) e comparada com a base pela impressão
+# digital. Só os campos alterados pelo usuário são gravados; se outro
+# operador mudou o mesmo campo, o conflito volta para a interface decidir.
+
+def normalize_form_value(col, value) -> str:
+    """Valor comparável de um campo do Formulário (moeda, telefone e texto normalizados)."""
+    return _fingerprint_value(_typed_column(col, [value])[0])
+
+def form_row_values(row, cols) -> dict:
+    """Valores atuais (tipados) dos campos do Formulário de uma linha do snapshot."""
+    return {c: row.get(c, "") for c in cols}
+
+def form_fingerprint(values, cols) -> str:
+    """Impressão digital dos campos do Formulário, na ordem de `cols`."""
+    return row_fingerprint(_typed_column(c, [values.get(c, "")])[0] for c in cols)
+
+def read_resultados_row(rownum, hmap, cols) -> dict:
+    """Lê o REGISTRO_ID e as colunas `cols` de uma linha, em uma requisição."""
+    ws = get_ws(RESULTADOS_TAB)
+    wanted = ["REGISTRO_ID"] + list(cols)
+    ranges = [gspread.utils.rowcol_to_a1(rownum, hmap[c]) for c in wanted]
+    vranges = batch_get_values_prefixed(ws, ranges)
+    return {c: ((vr.get("values") or [[""]])[0] or [""])[0] for c, vr in zip(wanted, vranges)}
+
+def merge_form_edits(base, mine, theirs, cols):
+    """
+    Junção campo a campo entre a base, a versão do usuário e a da planilha.
+    Retorna {"write": campos a gravar, "theirs": campos mudados só pela
+    planilha, "conflicts": campos mudados pelos dois com valores diferentes}.
+    """
+    write, from_sheet, conflicts = {}, {}, []
+    for c in cols:
+        b = normalize_form_value(c, base.get(c, ""))
+        m = normalize_form_value(c, mine.get(c, ""))
+        t = normalize_form_value(c, theirs.get(c, ""))
+        if m == b:
+            if t != b:
+                from_sheet[c] = theirs.get(c, "")
+        elif t == b:
+            write[c] = mine[c]
+        elif t != m:
+            conflicts.append(c)
+    return {"write": write, "theirs": from_sheet, "conflicts": conflicts}
+
+def save_form_edits(snapshot, reg_id, base, mine):
+    """
+    Grava no registro só os campos que o usuário mudou, verificando antes se a
+    linha foi alterada por outra pessoa desde que o Formulário foi aberto.
+    Retorna {"status": "saved" | "conflict" | "unchanged", "write", "theirs",
+    "conflicts", "current"}; em conflito nada é gravado.
+    """
+    hmap = header_map(RESULTADOS_TAB)
+    cols = [c for c in form_edit_columns(hmap) if c in mine]
+    rownum = snapshot.rownum_for_id(reg_id)
+    if not rownum:
+        raise Exception("Não foi possível encontrar o número da linha para este registro. Sincronize novamente.")
+
+    current = read_resultados_row(rownum, hmap, cols)
+    if str(current["REGISTRO_ID"]).strip() != str(reg_id):
+        # A linha mudou de posição (linhas apagadas ou reordenadas): localiza pelo ID
+        rownum = find_row_by_id(get_ws(RESULTADOS_TAB), hmap["REGISTRO_ID"], reg_id)
+        if not rownum:
+            raise Exception("O registro não foi encontrado na planilha. Ele pode ter sido excluído.")
+        snapshot.set_rownum(reg_id, rownum)
+        current = read_resultados_row(rownum, hmap, cols)
+
+    if form_fingerprint(current, cols) == form_fingerprint(base, cols):
+        merge = merge_form_edits(base, mine, base, cols)  # ninguém mexeu na linha
+    else:
+        merge = merge_form_edits(base, mine, current, cols)
+    merge["current"] = current
+    if merge["conflicts"]:
+        merge["status"] = "conflict"
+        return merge
+    if not merge["write"]:
+        merge["status"] = "unchanged"
+        return merge
+
+    batch_update_cells(get_ws(RESULTADOS_TAB), [
+        {"range": gspread.utils.rowcol_to_a1(rownum, hmap[c]), "values": [[v]]} for c, v in merge["write"].items()
+    ])
+    merge["status"] = "saved"
+    return merge
+
+# --------------------------------------------------
+# IMPORTAÇÃO EM LOTE DE RESULTADOS (CSV/XLSX)
+# --------------------------------------------------
+IMPORT_CHUNK_SIZE = 500
+# Coluna lógica -> nomes aceitos no cabeçalho do arquivo (comparados sem acento/caixa)
+IMPORT_COLUMNS = {
+    "nome": ["nome", "nome do aluno", "nome do candidato", "aluno", "candidato"],
+    "unidade": ["unidade"],
+    "turma": ["turma", "turma de interesse"],
+    "acertos_mat": ["acertos matematica", "matematica", "acertos - matematica"],
+    "acertos_port": ["acertos portugues", "portugues", "acertos - portugues"],
+    "bolsao": ["bolsao"],  # opcional: se ausente, usa o bolsão do dia
+}
+IMPORT_REQUIRED = ("nome", "unidade", "turma", "acertos_mat", "acertos_port")
+
+def strip_accents(text: str) -> str:
+    """Remove acentos de um texto (ex: 'Matemática' -> 'Matematica')."""
+    return "".join(ch for ch in unicodedata.normalize("NFKD", str(text)) if not unicodedata.combining(ch))
+
+def normalize_key(text) -> str:
+    """Normaliza um texto para comparação: sem acentos, minúsculo e com espaços simples."""
+    return " ".join(strip_accents(text).lower().split())
+
+def _iter_csv_chunks(path, chunk_size):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        # Separador detectado pelo cabeçalho (vírgula, ponto e vírgula, tab...)
+        try:
+            dialect = csv.Sniffer().sniff(f.readline(), delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        header = [h.strip() for h in next(reader, [])]
+        chunk = []
+        fim_anterior = reader.line_num
+        for row in reader:
+            # Linha do arquivo onde o registro começa (um campo entre aspas pode ocupar várias)
+            linha, fim_anterior = fim_anterior + 1, reader.line_num
+            if not any(v.strip() for v in row):
+                continue
+            chunk.append((linha, row))
+            if len(chunk) >= chunk_size:
+                yield header, chunk
+                chunk = []
+        if chunk:
+            yield header, chunk
+
+def _iter_xlsx_chunks(path, chunk_size):
+    try:
+        import openpyxl
+    except ImportError:
+        raise Exception("❌ Para importar arquivos .xlsx é necessário instalar o pacote 'openpyxl'.")
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, [])]
+        chunk = []
+        for linha, row in enumerate(rows, start=2):
+            if not any(v not in (None, "") for v in row):
+                continue
+            chunk.append((linha, ["" if v is None else v for v in row]))
+            if len(chunk) >= chunk_size:
+                yield header, chunk
+                chunk = []
+        if chunk:
+            yield header, chunk
+    finally:
+        wb.close()
+
+def iter_import_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Lê o arquivo de resultados em blocos de `chunk_size` linhas: (cabeçalho,
+    [(número da linha no arquivo, valores)]). Linhas em branco são puladas,
+    mas a numeração continua a do arquivo.
+    """
+    if str(path).lower().endswith((".xlsx", ".xlsm")):
+        return _iter_xlsx_chunks(path, chunk_size)
+    return _iter_csv_chunks(path, chunk_size)
+
+def resolve_import_columns(header):
+    """Mapeia as colunas lógicas da importação para as posições no cabeçalho do arquivo."""
+    normalized = [normalize_key(h) for h in header]
+    positions = {}
+    for key, aliases in IMPORT_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                positions[key] = normalized.index(alias)
+                break
+    missing = [k for k in IMPORT_REQUIRED if k not in positions]
+    if missing:
+        raise Exception(f"❌ Colunas obrigatórias ausentes no arquivo: {', '.join(missing)}")
+    return positions
+
+def build_hubspot_index(hubspot_df):
+    """Índice {(nome normalizado, unidade completa): [(Contato ID, nome), ...]} dos contatos do Hubspot."""
+    index = {}
+    if hubspot_df is None or hubspot_df.empty:
+        return index
+    for nome, unidade, contato_id in zip(hubspot_df["Nome do Candidato"], hubspot_df["Unidade"], hubspot_df["Contato ID"]):
+        index.setdefault((normalize_key(nome), unidade), []).append((contato_id, nome))
+    return index
+
+def _to_acertos(value, maximo):
+    try:
+        numero = float(str(value).strip().replace(",", "."))
+    except ValueError:
+        raise ValueError(f"número de acertos inválido: '{value}'")
+    if not math.isfinite(numero) or not numero.is_integer():
+        raise ValueError(f"número de acertos inválido: '{value}'")
+    acertos = int(numero)
+    if not 0 <= acertos <= maximo:
+        raise ValueError(f"acertos fora do intervalo 0-{maximo}: {acertos}")
+    return acertos
+
+def validate_import_row(values, positions, hubspot_index, brasilia_dt, bolsao_padrao):
+    """
+    Valida uma linha do arquivo e devolve o registro pronto para 'Resultados_Bolsao'.
+    Lança ValueError com o motivo quando a linha não pode ser importada.
+    """
+    def col(key):
+        pos = positions.get(key)
+        return str(values[pos]).strip() if pos is not None and pos < len(values) else ""
+
+    nome = col("nome")
+    if not nome:
+        raise ValueError("nome vazio")
+
+    unidade_in = normalize_key(col("unidade"))
+    unidade_limpa = next((u for u, completa in UNIDADES_MAP.items()
+                          if normalize_key(u) == unidade_in or normalize_key(completa) == unidade_in), None)
+    if unidade_limpa is None:
+        raise ValueError(f"unidade desconhecida: '{col('unidade')}'")
+
+    turma_in = normalize_key(col("turma"))
+    turma = next((t for t in TURMA_DE_INTERESSE_MAP if normalize_key(t) == turma_in), None)
+    if turma is None:
+        raise ValueError(f"turma desconhecida: '{col('turma')}'")
+    serie = TURMA_DE_INTERESSE_MAP[turma]
+
+    maximo = max_acertos(serie)
+    ac_mat = _to_acertos(col("acertos_mat"), maximo)
+    ac_port = _to_acertos(col("acertos_port"), maximo)
+
+    contatos = hubspot_index.get((normalize_key(nome), UNIDADES_MAP[unidade_limpa]), [])
+    if not contatos:
+        raise ValueError("candidato não encontrado no Hubspot para esta unidade")
+    if len(contatos) > 1:
+        raise ValueError(f"mais de um contato no Hubspot com este nome ({len(contatos)})")
+
+    pct = calcula_bolsa(ac_mat + ac_port, serie, unidade_limpa)
+    nome_bolsao = col("bolsao") or bolsao_padrao
+    nome_hubspot = contatos[0][1]  # grafia oficial do cadastro
+    return build_resultado_record(nome_hubspot, unidade_limpa, turma, ac_mat, ac_port, pct, serie, brasilia_dt, nome_bolsao)
+
+def import_resultados(path, hubspot_df, chunk_size=IMPORT_CHUNK_SIZE, progress=None, dry_run=False):
+    """
+    Importa resultados de prova de um CSV/XLSX em blocos: valida cada linha,
+    calcula a bolsa, confere o candidato no Hubspot e grava as linhas válidas
+    com um append_rows por bloco (um por shard, se houver shards). Erros de uma linha (ou de um bloco inteiro
+    na gravação) entram no relatório sem interromper o restante.
+    `progress(processadas, importadas, erros)` é chamado após cada bloco.
+    Retorna {'total', 'imported', 'errors': [(linha, nome, motivo)], 'records': [(registro, rownum)]}.
+    """
+    hubspot_index = build_hubspot_index(hubspot_df)
+    brasilia_dt = get_current_brasilia_datetime()
+    bolsao_padrao = get_bolsao_name_for_date(brasilia_dt.date())
+    report = {"total": 0, "imported": 0, "errors": [], "records": []}
+    shards = get_shard_map()
+
+    positions = None
+    for header, chunk in iter_import_chunks(path, chunk_size):
+        if positions is None:
+            positions = resolve_import_columns(header)
+        valid = []
+        for line_no, values in chunk:
+            report["total"] += 1
+            try:
+                valid.append(validate_import_row(values, positions, hubspot_index, brasilia_dt, bolsao_padrao))
+            except ValueError as e:
+                nome_pos = positions["nome"]
+                nome = values[nome_pos] if nome_pos < len(values) else ""
+                report["errors"].append((line_no, nome, str(e)))
+
+        if valid and not dry_run:
+            falhou, erro = set(), None
+            try:
+                rownums = append_resultados(valid)
+            except ShardWriteError as e:
+                rownums, falhou, erro = e.rownums, e.falhou, e
+            except Exception as e:
+                rownums, falhou, erro = [None] * len(valid), set(range(len(valid))), e
+            report["errors"].extend((None, valid[k]["Nome do Aluno"], f"falha ao gravar o bloco: {erro}")
+                                    for k in sorted(falhou))
+            # Registros gravados no shard de outra unidade não entram no snapshot local
+            report["records"].extend((record, rownums[k]) for k, record in enumerate(valid)
+                                     if k not in falhou and record_in_local_shard(record, shards))
+            valid = [r for k, r in enumerate(valid) if k not in falhou]
+        elif dry_run:
+            report["records"].extend((record, None) for record in valid)
+        report["imported"] += len(valid) if not dry_run else 0
+
+        if progress:
+            progress(report["total"], report["imported"], len(report["errors"]))
+    return report
+
+# --------------------------------------------------
+# FILTROS DO FORMULÁRIO (TAMBÉM USADOS NA EXPORTAÇÃO)
+# --------------------------------------------------
+MATRICULA_EM_BRANCO = "Em branco"
+
+PERIODOS_FORMULARIO = {"Todo o período": None, "Hoje": 1, "Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90}
+
+def period_bounds(dias=None, inicio=None, fim=None):
+    """
+    Limites [inicio, fim) de um filtro de período. `dias` = últimos N dias
+    (contando hoje, a partir da meia-noite); `inicio`/`fim` são datas
+    inclusivas de um intervalo escolhido. Retorna (None, None) sem filtro.
+    """
+    if dias:
+        hoje = get_current_brasilia_date()
+        return datetime.combine(hoje - timedelta(days=dias - 1), datetime.min.time()), None
+    inicio_dt = datetime.combine(inicio, datetime.min.time()) if inicio else None
+    fim_dt = datetime.combine(fim + timedelta(days=1), datetime.min.time()) if fim else None
+    return inicio_dt, fim_dt
+
+def filter_snapshot_indices(snapshot, unidade_limpa=None, bolsao=None, bolsa=None, matriculou=None,
+                            inicio=None, fim=None):
+    """
+    Índices do snapshot (array NumPy, na ordem das linhas) que passam pelos
+    filtros do Formulário: unidade, bolsão, % de bolsa (inteiro, ex: 60),
+    'Aluno Matriculou?' ("Sim", "Não" ou MATRICULA_EM_BRANCO) e período de
+    'Data/Hora' ([inicio, fim), ver period_bounds). Com período, as linhas
+    candidatas saem da busca binária no índice temporal e os demais filtros
+    só olham para elas; sem período, cada filtro é uma comparação vetorizada
+    sobre os códigos de categoria da coluna inteira.
+    """
+    if inicio is None and fim is None:
+        indices = None
+    else:
+        indices = snapshot.indices_in_period(inicio, fim)
+
+    def keep(col, value):
+        nonlocal indices
+        codes, lookup = snapshot.category_codes(col)
+        code = lookup.get(value, -2)  # -2 não é código de nenhum valor
+        indices = np.flatnonzero(codes == code) if indices is None else indices[codes[indices] == code]
+
+    if unidade_limpa and unidade_limpa != "Todas":
+        keep("Unidade", UNIDADES_MAP.get(unidade_limpa, unidade_limpa))
+    if bolsao and bolsao != "Todos":
+        keep("Bolsão", bolsao)
+    if matriculou and matriculou != "Todos":
+        keep("Aluno Matriculou?", "" if matriculou == MATRICULA_EM_BRANCO else matriculou)
+    if indices is None:
+        indices = np.arange(len(snapshot))
+    if bolsa is not None:
+        with np.errstate(invalid="ignore"):
+            indices = indices[np.round(snapshot.columns["% Bolsa"][indices] * 100) == bolsa]
+    return indices
+
+# --------------------------------------------------
+# NEGOCIAÇÃO E MATERIAL DIDÁTICO
+# --------------------------------------------------
 def calcula_valor_minimo(unidade, serie_modalidade):
     """Calcula o valor mínimo de parcela negociável para uma unidade e série."""
     try:
@@ -530,71 +2943,45 @@ def calcula_valor_minimo(unidade, serie_modalidade):
     except Exception as e:
         raise Exception(f"❌ Erro ao calcular valor mínimo: {e}")
 
-def gerar_html_material_didatico(unidade: str) -> str:
+def cotacao_reversa(valor_parcela):
     """
-    Gera o código HTML para as tabelas de material didático
-    com base na unidade selecionada.
+    Para uma parcela que a família pode pagar, calcula de uma vez, para toda
+    unidade x série do catálogo, a bolsa necessária (como o simulador da aba
+    Negociação: 1 - parcela / parcela integral), o valor mínimo negociável e a
+    bolsa máxima que ele permite. Retorna None sem valor; senão matrizes
+    (unidades x séries) e os nomes dos eixos.
     """
-    precos_gerais = {
-        "Medicina": ("R$ 4.109,95", "12x de R$ 342,96"),
-        "Pré-Vestibular": ("R$ 4.109,95", "12x de R$ 342,96"),
-    }
-    
-    precos_militares = {
-        "AFA/EN/EFOMM": ("R$ 2.333,73", "12x de R$ 194,48"),
-        "EPCAR": ("R$ 2.501,36", "12x de R$ 208,45"),
-        "ESA": ("R$ 1.111,98", "12x de R$ 92,67"),
-        "EsPCEx": ("R$ 2.668,97", "12x de R$ 222,41"),
-        "IME/ITA": ("R$ 2.333,73", "12x de R$ 194,48"),
-    }
-
-    precos_didatico_padrao = {
-        "1ª ao 5ª ano": ("R$ 2.552,80", "12x de R$ 212,73"),
-        "6ª ao 8ª ano": ("R$ 2.765,77", "12x de R$ 230,48"),
-        "9ª ano Vestibular": ("R$ 2.872,69", "12x de R$ 239,39"),
-        "1ª e 2ª série Vestibular": ("R$ 3.499,67", "12x de R$ 291,64"),
-        "3ª série": ("R$ 4.109,95", "12x de R$ 342,96"),
+    if valor_parcela is None:
+        return None
+    neg = get_catalogo()["negociacao"]
+    parcela, anuidade = neg["parcela"][np.newaxis, :], neg["anuidade"][np.newaxis, :]
+    desconto = neg["desconto_maximo"][:, np.newaxis]
+    valor_minimo = np.where((anuidade > 0) & (desconto > 0), anuidade * (1 - desconto) / 12, 0.0)
+    bolsa = np.broadcast_to(1 - float(valor_parcela) / parcela, valor_minimo.shape)
+    return {
+        "unidades": neg["unidades"],
+        "series": neg["series"],
+        "valor_parcela": float(valor_parcela),
+        "parcela_integral": np.broadcast_to(parcela, valor_minimo.shape),
+        "bolsa_necessaria": np.clip(bolsa, 0.0, 1.0),
+        "valor_minimo": valor_minimo,
+        "bolsa_maxima": np.clip(1 - valor_minimo / parcela, 0.0, 1.0),
+        "acima_do_minimo": float(valor_parcela) >= valor_minimo,
+        "sem_bolsa": bolsa <= 0,
     }
 
-    precos_sao_joao = {
-        "1ª ao 5ª ano": ("R$ 1.933,56", "12x de R$ 161,13"),
-        "6ª ao 8ª ano": ("R$ 2.020,92", "12x de R$ 168,41"),
-        "9ª ano Vestibular": ("R$ 2.019,84", "12x de R$ 168,32"),
-        "1ª e 2ª série Vestibular": ("R$ 2.574,20", "12x de R$ 214,52"),
-        "3ª série": ("R$ 3.032,21", "12x de R$ 252,68"),
-    }
-    
-    precos_retiro = {
-        "1ª ao 5ª ano": ("R$ 2.552,80", "12x de R$ 212,73"),
-    }
-    
-    dados_didatico = {}
-    
-    if unidade == "SÃO JOÃO DE MERITI":
-        titulo_didatico = "Material Didático (exclusivo São João de Meriti)"
-        dados_didatico = precos_sao_joao
-    elif unidade == "RETIRO DOS ARTISTAS":
-        titulo_didatico = "Material Didático"
-        dados_didatico = precos_didatico_padrao.copy()
-        dados_didatico.update(precos_retiro)
-    else:
-        titulo_didatico = "Material Didático"
-        dados_didatico = precos_didatico_padrao
-
-    tabela_didatico_html = f'<table class="pag2"><tr><th colspan="3">{titulo_didatico}</th></tr>'
-    for curso, valores in dados_didatico.items():
-        tabela_didatico_html += f'<tr><td>{curso}</td><td>{valores[0]}</td><td>{valores[1]}</td></tr>'
-    tabela_didatico_html += '</table><br>'
-
-    tabela_geral_html = '<table class="pag2"><tr><th colspan="3">Material Didático (geral)</th></tr>'
-    for curso, valores in precos_gerais.items():
-        tabela_geral_html += f'<tr><td>{curso}</td><td>{valores[0]}</td><td>{valores[1]}</td></tr>'
-    tabela_geral_html += '</table><br>'
-    
-    tabela_militares_html = '<table class="pag2"><tr><th colspan="3">Material Militares</th></tr>'
-    for curso, valores in precos_militares.items():
-        tabela_militares_html += f'<tr><td>{curso}</td><td>{valores[0]}</td><td>{valores[1]}</td></tr>'
-    tabela_militares_html += '</table><br>'
-
-    return tabela_didatico_html + tabela_geral_html + tabela_militares_html
+def gerar_html_material_didatico(unidade: str) -> str:
+    """
+    HTML das tabelas de material didático da unidade, já montado na
+    compilação do catálogo.
+    """
+    return _catalogo["material_html"].get(unidade, _catalogo["material_html_padrao"])
 
+def init_backend():
+    """
+    Carga inicial do módulo: catálogo de preços e shard deste computador.
+    Chamada na abertura do app e no main() de cada script (não na importação),
+    para que `import backend` não leia arquivos de configuração.
+    """
+    init_catalogo()
+    init_shards()
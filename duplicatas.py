@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+duplicatas.py
+-------------------------------------------------
+Detecção de prováveis duplicatas no Hubspot e em Resultados, e dos vínculos
+Resultados -> Hubspot. Nomes são normalizados (sem acento, caixa e partículas
+como "de"/"dos") e telefones reduzidos aos dígitos. Só são comparados os
+pares que caem num mesmo bloco: mesmo final de telefone, ou o nome completo
+sem um dos nomes (para nomes curtos, primeiro nome + início do último e
+vice-versa), o que tolera erro de digitação ou um nome a menos.
+Blocos grandes demais (nomes muito comuns) são divididos por unidade e, se
+ainda grandes, ignorados; assim o número de pares cresce quase linearmente.
+A semelhança dos nomes é o coeficiente de Dice dos bigramas de caracteres,
+com os conjuntos de bigramas montados uma vez por registro.
+"""
+import re
+import time
+
+import backend as be
+
+NAME_PARTICLES = {"de", "da", "do", "das", "dos", "e", "d"}
+DEDUPE_PHONE_SUFFIX = 8
+DEDUPE_NAME_PREFIX = 3
+DEDUPE_MAX_BLOCK = 50
+DEDUPE_MIN_SCORE = 0.85
+
+def phone_digits(raw) -> str:
+    """
+    Dígitos de um telefone (DDD + número, até 11), sem o código do país 55.
+    Só para comparar telefones; a exibição continua com backend.format_phone_mask.
+    """
+    if raw is None:
+        return ""
+    digits = re.sub(r"\D", "", str(raw))
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        digits = digits[2:]
+    return digits[:11]
+
+def normalize_person_name(nome) -> tuple:
+    """Tokens do nome sem acentos, caixa, pontuação e partículas ('Maria da Silva' -> ('maria', 'silva'))."""
+    text = re.sub(r"[^a-z ]", " ", be.strip_accents(str(nome or "")).lower())
+    return tuple(t for t in text.split() if t not in NAME_PARTICLES)
+
+def _name_bigrams(tokens) -> frozenset:
+    joined = " ".join(sorted(tokens))  # ordem dos nomes não importa
+    return frozenset(joined[i:i + 2] for i in range(len(joined) - 1))
+
+def _dice(a, b) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+def score_pair(bigrams_a, bigrams_b, phone_a, phone_b, same_unit):
+    """Pontuação 0..1 de dois registros serem a mesma pessoa, e o motivo."""
+    sim = _dice(bigrams_a, bigrams_b)
+    if phone_a and phone_b:
+        if phone_a[-DEDUPE_PHONE_SUFFIX:] == phone_b[-DEDUPE_PHONE_SUFFIX:]:
+            # Irmãos dividem o telefone: o nome ainda precisa ser parecido
+            return 0.5 + 0.5 * sim, "mesmo telefone, nome parecido"
+        # Telefones diferentes: só nomes praticamente iguais na mesma unidade
+        return (0.9 if same_unit else 0.8) * sim, "nome igual, telefones diferentes"
+    return (0.95 if same_unit else 0.85) * sim, "nome igual, sem telefone para comparar"
+
+class _DedupeEntries:
+    """Registros das duas origens em listas paralelas (origem, id, nome, unidade, telefone)."""
+
+    def __init__(self):
+        self.origem, self.ids, self.nomes, self.unidades, self.telefones = [], [], [], [], []
+        self.tokens, self.bigrams = [], []
+
+    def extend(self, origem, ids, nomes, unidades, telefones):
+        for rid, nome, unidade, tel in zip(ids, nomes, unidades, telefones):
+            tokens = normalize_person_name(nome)
+            if not tokens:
+                continue
+            self.origem.append(origem)
+            self.ids.append(str(rid))
+            self.nomes.append(str(nome))
+            self.unidades.append(unidade)
+            digits = phone_digits(tel)
+            self.telefones.append(digits if len(digits) >= DEDUPE_PHONE_SUFFIX else "")
+            self.tokens.append(tokens)
+            self.bigrams.append(_name_bigrams(tokens))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def describe(self, i) -> dict:
+        return {"origem": self.origem[i], "id": self.ids[i], "nome": self.nomes[i],
+                "unidade": self.unidades[i], "telefone": be.format_phone_mask(self.telefones[i])}
+
+def dedupe_candidate_pairs(entries, max_block=DEDUPE_MAX_BLOCK):
+    """Pares (i, j) que compartilham algum bloco. Retorna (pares, blocos_ignorados)."""
+    blocks = {}
+    p = DEDUPE_NAME_PREFIX
+    for i, tokens in enumerate(entries.tokens):
+        keys = []
+        if entries.telefones[i]:
+            keys.append(("tel", entries.telefones[i][-DEDUPE_PHONE_SUFFIX:]))
+        if len(tokens) >= 3:
+            # Nome completo sem um dos nomes: um nome com erro ou faltando ainda coincide
+            ordered = sorted(tokens)
+            keys.extend(("nome",) + tuple(ordered[:k] + ordered[k + 1:]) for k in range(len(ordered)))
+        elif len(tokens) == 2:
+            keys.append(("nome", tokens[0], tokens[1][:p]))
+            keys.append(("nome", tokens[0][:p], tokens[1]))
+        else:
+            keys.append(("nome", tokens[0]))
+        for key in keys:
+            blocks.setdefault(key, []).append(i)
+
+    pairs, skipped = set(), 0
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        groups = [members]
+        if len(members) > max_block:
+            by_unit = {}
+            for i in members:
+                by_unit.setdefault(entries.unidades[i], []).append(i)
+            groups = list(by_unit.values())
+        for group in groups:
+            if len(group) > max_block:
+                skipped += 1
+                continue
+            for x in range(len(group)):
+                for y in range(x + 1, len(group)):
+                    pairs.add((group[x], group[y]))
+    return pairs, skipped
+
+def find_duplicates(hubspot_df=None, snapshot=None, min_score=DEDUPE_MIN_SCORE) -> dict:
+    """
+    Prováveis duplicatas dentro do Hubspot e dentro de Resultados, e os
+    vínculos Resultados -> Hubspot (o contato mais provável de cada linha).
+    Cada item: {"score", "motivo", "a": {...}, "b": {...}}, do maior score ao menor.
+    """
+    t0 = time.perf_counter()
+    entries = _DedupeEntries()
+    if hubspot_df is not None and not hubspot_df.empty:
+        telefones = hubspot_df["Celular Tratado"] if "Celular Tratado" in hubspot_df.columns else [""] * len(hubspot_df)
+        entries.extend("Hubspot", hubspot_df["Contato ID"], hubspot_df["Nome do Candidato"], hubspot_df["Unidade"], telefones)
+    if snapshot is not None and len(snapshot):
+        cols = snapshot.columns
+        entries.extend("Resultados", cols["REGISTRO_ID"], cols["Nome do Aluno"], cols["Unidade"], cols["Telefone"])
+
+    pairs, skipped = dedupe_candidate_pairs(entries)
+    duplicados = {"Hubspot": [], "Resultados": []}
+    melhor_vinculo = {}
+    for i, j in pairs:
+        score, motivo = score_pair(entries.bigrams[i], entries.bigrams[j], entries.telefones[i], entries.telefones[j],
+                                   entries.unidades[i] == entries.unidades[j])
+        if score < min_score:
+            continue
+        oi, oj = entries.origem[i], entries.origem[j]
+        if oi == oj:
+            duplicados[oi].append((score, motivo, i, j))
+        else:
+            r, h = (i, j) if oi == "Resultados" else (j, i)
+            if score > melhor_vinculo.get(r, (0,))[0]:
+                melhor_vinculo[r] = (score, motivo, r, h)
+
+    def listar(items):
+        return [{"score": round(score, 3), "motivo": motivo, "a": entries.describe(a), "b": entries.describe(b)}
+                for score, motivo, a, b in sorted(items, key=lambda t: -t[0])]
+
+    return {
+        "hubspot": listar(duplicados["Hubspot"]),
+        "resultados": listar(duplicados["Resultados"]),
+        "vinculos": listar(melhor_vinculo.values()),
+        "stats": {"registros": len(entries), "pares_comparados": len(pairs),
+                  "blocos_ignorados": skipped, "segundos": round(time.perf_counter() - t0, 2)},
+    }
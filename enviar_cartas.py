@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+enviar_cartas.py
+-------------------------------------------------
+Envia por e-mail, em lote, as cartas PDF já geradas (Carta_<aluno>_<bolsão>.pdf).
+O destinatário vem da coluna 'E-mail' da aba Hubspot; as mensagens passam
+pela mesma caixa de saída e pelo mesmo pool SMTP do app, então um envio
+interrompido continua na próxima execução e cartas já enviadas não se repetem.
+
+Exemplos:
+    python enviar_cartas.py ~/Downloads --unidade BANGU
+    python enviar_cartas.py --status
+    python enviar_cartas.py --reenviar-falhas
+    python enviar_cartas.py cartas/ --smtp-host localhost --smtp-porta 8025 --sem-tls --de teste@matriz.com
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import backend as be
+import envio_email
+
+def print_report(report):
+    print(f"Enviados: {report['enviados']} | Na fila: {report['pendentes']} | Com falha: {report['falhas']}")
+    for f in report["falhou"]:
+        print(f"  falhou: {f['to']} ({f['subject']}): {f['erro']}")
+
+def enqueue_folder(outbox, pasta, unidade_limpa, sender):
+    """Enfileira as cartas da pasta que têm e-mail no Hubspot. Retorna (enfileiradas, sem_email)."""
+    dados = be.bootstrap_initial_data()
+    email_index = envio_email.build_hubspot_email_index(dados["hubspot_df"])
+    unidades = [unidade_limpa] if unidade_limpa != "Todas" else be.UNIDADES_LIMPAS
+    enfileiradas, sem_email = 0, []
+    for pdf in sorted(Path(pasta).expanduser().glob("Carta_*.pdf")):
+        if outbox.has_file(pdf):
+            continue
+        aluno = envio_email.parse_carta_filename(pdf)
+        unidade, destino = None, None
+        for u in unidades:
+            destino = envio_email.hubspot_email_for(email_index, aluno, u)
+            if destino:
+                unidade = u
+                break
+        if not destino:
+            sem_email.append(pdf.name)
+            continue
+        msg = envio_email.build_carta_email(sender, destino, aluno, pdf.read_bytes(), pdf.name, unidade)
+        outbox.enqueue(msg, arquivo=str(pdf.resolve()), aluno=aluno)
+        enfileiradas += 1
+    return enfileiradas, sem_email
+
+def main():
+    parser = argparse.ArgumentParser(description="Envia as cartas PDF por e-mail pela caixa de saída do Gestor do Bolsão.")
+    parser.add_argument("pasta", nargs="?", help="Pasta com os arquivos Carta_*.pdf.")
+    parser.add_argument("--unidade", default="Todas", help="Unidade (nome curto, ex: BANGU). Padrão: Todas.")
+    parser.add_argument("--status", action="store_true", help="Só mostra a situação da caixa de saída.")
+    parser.add_argument("--reenviar-falhas", action="store_true", help="Devolve à fila as mensagens que falharam.")
+    parser.add_argument("--workers", type=int, default=envio_email.SMTP_WORKERS, help="Envios simultâneos.")
+    parser.add_argument("--caixa", default=envio_email.OUTBOX_DIR, help="Pasta da caixa de saída.")
+    parser.add_argument("--smtp-host", help="Servidor SMTP (sobrepõe o config_local.json).")
+    parser.add_argument("--smtp-porta", type=int, help="Porta SMTP.")
+    parser.add_argument("--sem-tls", action="store_true", help="Não usa STARTTLS (ex: servidor local de testes).")
+    parser.add_argument("--de", help="Remetente.")
+    args = parser.parse_args()
+
+    try:
+        be.init_backend()
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    outbox = envio_email.CaixaSaida(args.caixa)
+    if args.status:
+        print_report(outbox.report())
+        return 0
+    if args.reenviar_falhas:
+        print(f"{outbox.retry_failed()} mensagem(ns) devolvida(s) à fila.")
+
+    try:
+        config = envio_email.get_smtp_config({"host": args.smtp_host, "port": args.smtp_porta, "from": args.de,
+                                     "starttls": False if args.sem_tls else None})
+        if args.pasta:
+            enfileiradas, sem_email = enqueue_folder(outbox, args.pasta, args.unidade, config["from"])
+            print(f"{enfileiradas} carta(s) enfileirada(s).")
+            for nome in sem_email:
+                print(f"  sem e-mail no Hubspot: {nome}")
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    def progresso(report):
+        print(f"\rEnviados: {report['enviados']} | Na fila: {report['pendentes']} | "
+              f"Com falha: {report['falhas']} | {report['ultimo_minuto']}/min", end="", flush=True)
+
+    entregador = envio_email.EntregadorCartas(outbox, config, args.workers)
+    entregador.start()
+    try:
+        entregador.wait_until_done(progress=progresso)
+    except KeyboardInterrupt:
+        print("\nInterrompido; as mensagens restantes continuam na caixa de saída.")
+    finally:
+        entregador.stop()
+    print()
+    print_report(outbox.report())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+envio_email.py
+-------------------------------------------------
+Envio das cartas por e-mail, usado pelo app e pelo enviar_cartas.py. As
+cartas entram numa caixa de saída em disco (um .eml e um .json de estado por
+mensagem) e são enviadas por alguns workers que reaproveitam conexões SMTP
+abertas, sem reconectar a cada mensagem. Falhas temporárias (4xx, queda de
+conexão) voltam para a fila com espera crescente; recusas definitivas (5xx)
+ou o limite de tentativas marcam a mensagem como falha. Como o estado fica em
+disco, o envio continua de onde parou se o app fechar.
+O servidor vem do config_local.json, chave "smtp":
+    {"host": "smtp.exemplo.com", "port": 587, "user": "...", "password": "...",
+     "from": "bolsao@exemplo.com", "starttls": true}
+"""
+import email.utils
+import heapq
+import json
+import os
+import re
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from email.message import EmailMessage
+from pathlib import Path
+
+import backend as be
+
+OUTBOX_DIR = "caixa_saida"
+SMTP_WORKERS = 4                    # envios simultâneos (= conexões abertas no máximo)
+SMTP_MAX_ATTEMPTS = 5
+SMTP_RETRY_BASE = 30                # segundos de espera após a 1ª falha; dobra a cada tentativa
+SMTP_RETRY_MAX = 30 * 60
+SMTP_MESSAGES_PER_CONNECTION = 200  # renova a conexão depois de N mensagens
+SMTP_IDLE_CLOSE = 60                # descarta conexões paradas há mais que isso (segundos)
+SMTP_TIMEOUT = 30
+ENVIO_PENDENTE, ENVIO_ENVIADO, ENVIO_FALHOU = "pendente", "enviado", "falhou"
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+def get_smtp_config(overrides=None) -> dict:
+    """Configuração SMTP do config_local.json (com `overrides` por cima). Levanta Exception se faltar."""
+    config = {"host": None, "port": 587, "user": None, "password": None, "from": None, "starttls": True, "ssl": False}
+    config.update(be.load_local_config().get("smtp") or {})
+    config.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    if not config["host"]:
+        raise Exception("❌ Servidor de e-mail não configurado (chave 'smtp' do config_local.json).")
+    config["from"] = config["from"] or config["user"]
+    if not config["from"]:
+        raise Exception("❌ Remetente dos e-mails não configurado ('from' em 'smtp' no config_local.json).")
+    return config
+
+def build_hubspot_email_index(hubspot_df) -> dict:
+    """(nome normalizado, unidade completa) -> e-mail válido da coluna 'E-mail' do Hubspot."""
+    index = {}
+    if hubspot_df is None or hubspot_df.empty or "E-mail" not in hubspot_df.columns:
+        return index
+    for nome, unidade, mail in zip(hubspot_df["Nome do Candidato"], hubspot_df["Unidade"], hubspot_df["E-mail"]):
+        mail = str(mail or "").strip()
+        if EMAIL_RE.match(mail):
+            index.setdefault((be.normalize_key(nome), unidade), mail)
+    return index
+
+def hubspot_email_for(email_index, nome, unidade_limpa):
+    """E-mail do candidato no índice do Hubspot, ou None."""
+    return email_index.get((be.normalize_key(nome), be.UNIDADES_MAP.get(unidade_limpa, unidade_limpa)))
+
+def parse_carta_filename(path):
+    """Nome do aluno a partir de 'Carta_<aluno>_<bolsão>.pdf' (o padrão do gerar_carta), ou None."""
+    stem = Path(path).stem
+    if not stem.startswith("Carta_"):
+        return None
+    return stem[len("Carta_"):].split("_", 1)[0].strip() or None
+
+def build_carta_email(sender, to, aluno, pdf_bytes, filename, unidade_limpa=""):
+    """Monta a mensagem com a carta em anexo. O Message-ID fixo evita duplicatas em reenvios."""
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = to
+    msg["Subject"] = f"Resultado do Bolsão – {aluno.strip().title()}"
+    msg["Date"] = email.utils.formatdate(localtime=True)
+    msg["Message-ID"] = email.utils.make_msgid(domain=sender.rsplit("@", 1)[-1])
+    unidade = f" – {unidade_limpa}" if unidade_limpa else ""
+    msg.set_content(
+        f"Olá!\n\nSegue em anexo a carta com o resultado de {aluno.strip().title()} no Bolsão "
+        f"do Colégio Matriz{unidade}.\n\nQualquer dúvida, estamos à disposição.\n\nColégio Matriz Educação\n"
+    )
+    msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename=filename)
+    return msg
+
+class CaixaSaida:
+    """
+    Caixa de saída durável. Cada mensagem tem um <id>.eml (o conteúdo) e um
+    <id>.json (destinatário, situação, tentativas, próximo envio, último erro).
+    As pendentes ficam num heap por horário do próximo envio.
+    """
+
+    def __init__(self, path=OUTBOX_DIR):
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.cond = threading.Condition()
+        self.items = {}
+        self.in_flight = set()
+        self._heap = []
+        self._seq = 0
+        for f in sorted(self.dir.glob("*.json")):
+            try:
+                with open(f, encoding="utf-8") as fh:
+                    state = json.load(fh)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Aviso: estado de envio ilegível ignorado ({f.name}): {e}")
+                continue
+            self.items[state["id"]] = state
+            if state["status"] == ENVIO_PENDENTE:
+                self._push(state)
+
+    def _push(self, state):
+        self._seq += 1
+        heapq.heappush(self._heap, (state["next_attempt"], self._seq, state["id"]))
+
+    def _save(self, state):
+        path = self.dir / f"{state['id']}.json"
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def enqueue(self, msg, **meta) -> str:
+        """Grava a mensagem na caixa de saída e a deixa pronta para envio. Retorna o id."""
+        mid = uuid.uuid4().hex
+        # Já com CRLF: o sendmail do smtplib não converte finais de linha de bytes
+        (self.dir / f"{mid}.eml").write_bytes(msg.as_bytes(policy=msg.policy.clone(linesep="\r\n")))
+        state = {
+            "id": mid, "to": msg["To"], "from": msg["From"], "subject": msg["Subject"],
+            "status": ENVIO_PENDENTE, "attempts": 0, "next_attempt": 0, "created_at": time.time(),
+            "sent_at": None, "last_error": None, **meta,
+        }
+        with self.cond:
+            self._save(state)
+            self.items[mid] = state
+            self._push(state)
+            self.cond.notify()
+        return mid
+
+    def has_file(self, path) -> bool:
+        """True se a carta `path` já está na fila ou já foi enviada."""
+        path = str(Path(path).resolve())
+        with self.cond:
+            return any(s.get("arquivo") == path and s["status"] != ENVIO_FALHOU for s in self.items.values())
+
+    def claim(self, timeout=1.0):
+        """Retira a próxima mensagem vencida (cópia do estado), esperando até `timeout`. None se não houver."""
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, mid = heapq.heappop(self._heap)
+                    state = self.items.get(mid)
+                    if state is None or state["status"] != ENVIO_PENDENTE or mid in self.in_flight:
+                        continue
+                    self.in_flight.add(mid)
+                    return dict(state)
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self.cond.wait(wait)
+
+    def raw(self, mid) -> bytes:
+        return (self.dir / f"{mid}.eml").read_bytes()
+
+    def mark_sent(self, mid):
+        with self.cond:
+            state = self.items[mid]
+            state.update(status=ENVIO_ENVIADO, attempts=state["attempts"] + 1, sent_at=time.time(), last_error=None)
+            self._save(state)
+            self.in_flight.discard(mid)
+        try:
+            (self.dir / f"{mid}.eml").unlink()  # o PDF continua na pasta de onde veio
+        except OSError:
+            pass
+
+    def mark_failed(self, mid, error, permanent=False):
+        """Registra uma falha: reagenda com espera crescente ou desiste (permanente/limite)."""
+        with self.cond:
+            state = self.items[mid]
+            attempts = state["attempts"] + 1
+            state.update(attempts=attempts, last_error=str(error))
+            if permanent or attempts >= SMTP_MAX_ATTEMPTS:
+                state["status"] = ENVIO_FALHOU
+            else:
+                state["next_attempt"] = time.time() + min(SMTP_RETRY_BASE * 2 ** (attempts - 1), SMTP_RETRY_MAX)
+                self._push(state)
+            self._save(state)
+            self.in_flight.discard(mid)
+            self.cond.notify()
+
+    def retry_failed(self) -> int:
+        """Devolve à fila as mensagens que falharam. Retorna quantas."""
+        with self.cond:
+            failed = [s for s in self.items.values() if s["status"] == ENVIO_FALHOU]
+            for state in failed:
+                state.update(status=ENVIO_PENDENTE, attempts=0, next_attempt=0)
+                self._save(state)
+                self._push(state)
+            self.cond.notify_all()
+        return len(failed)
+
+    def report(self) -> dict:
+        """Situação da caixa de saída: contagens, envios no último minuto e falhas."""
+        now = time.time()
+        with self.cond:
+            states = list(self.items.values())
+            in_flight = len(self.in_flight)
+        counts = {ENVIO_PENDENTE: 0, ENVIO_ENVIADO: 0, ENVIO_FALHOU: 0}
+        for state in states:
+            counts[state["status"]] += 1
+        return {
+            "pendentes": counts[ENVIO_PENDENTE], "enviados": counts[ENVIO_ENVIADO], "falhas": counts[ENVIO_FALHOU],
+            "enviando": in_flight,
+            "ultimo_minuto": sum(1 for s in states if s["sent_at"] and now - s["sent_at"] <= 60),
+            "falhou": [{"to": s["to"], "subject": s["subject"], "erro": s["last_error"]}
+                       for s in states if s["status"] == ENVIO_FALHOU],
+        }
+
+class _PooledConnection:
+    __slots__ = ("smtp", "sent", "last_used")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+class SmtpPool:
+    """Conexões SMTP autenticadas e reaproveitadas; no máximo `size` em uso ao mesmo tempo."""
+
+    def __init__(self, config, size=SMTP_WORKERS):
+        self.config = config
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self.stats = {"connections_opened": 0}
+
+    def _connect(self):
+        cfg = self.config
+        port = int(cfg["port"])
+        if cfg.get("ssl"):
+            smtp = smtplib.SMTP_SSL(cfg["host"], port, timeout=SMTP_TIMEOUT, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(cfg["host"], port, timeout=SMTP_TIMEOUT)
+            if cfg.get("starttls"):
+                smtp.starttls(context=ssl.create_default_context())
+        if cfg.get("user") and cfg.get("password"):
+            smtp.login(cfg["user"], cfg["password"])
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return _PooledConnection(smtp)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão; ela volta ao pool, ou é descartada se quebrou ou já enviou demais."""
+        with self._slots:
+            conn = None
+            with self._lock:
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if time.monotonic() - candidate.last_used <= SMTP_IDLE_CLOSE:
+                        conn = candidate
+                        break
+                    self._close(candidate)
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # Recusa de uma mensagem: a sessão continua válida
+                self._release(conn)
+                raise
+            except BaseException:
+                conn.smtp.close()
+                raise
+            else:
+                self._release(conn)
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.sent >= SMTP_MESSAGES_PER_CONNECTION:
+            self._close(conn)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+class EntregadorCartas:
+    """Workers que esvaziam a CaixaSaida pelo SmtpPool, com concorrência limitada."""
+
+    def __init__(self, outbox, config, workers=SMTP_WORKERS):
+        self.outbox = outbox
+        self.pool = SmtpPool(config, workers)
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"smtp-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5):
+        """Para os workers; o que não foi enviado continua na caixa de saída."""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.pool.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            state = self.outbox.claim(timeout=1.0)
+            if state is not None:
+                self._deliver(state)
+
+    def _deliver(self, state):
+        mid = state["id"]
+        try:
+            raw = self.outbox.raw(mid)
+            with self.pool.connection() as conn:
+                conn.smtp.sendmail(state["from"], [state["to"]], raw)
+                conn.sent += 1
+        except smtplib.SMTPRecipientsRefused as e:
+            code, resp = next(iter(e.recipients.values()))
+            self.outbox.mark_failed(mid, f"{code} {resp.decode(errors='replace') if isinstance(resp, bytes) else resp}", permanent=code >= 500)
+        except smtplib.SMTPResponseException as e:
+            msg = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else e.smtp_error
+            self.outbox.mark_failed(mid, f"{e.smtp_code} {msg}", permanent=e.smtp_code >= 500)
+        except FileNotFoundError as e:
+            self.outbox.mark_failed(mid, f"mensagem ausente na caixa de saída: {e}", permanent=True)
+        except (smtplib.SMTPException, OSError) as e:
+            self.outbox.mark_failed(mid, e)
+        else:
+            self.outbox.mark_sent(mid)
+
+    def wait_until_done(self, timeout=None, progress=None) -> bool:
+        """Espera não haver pendentes nem envios em andamento (inclui reenvios agendados)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            report = self.outbox.report()
+            if progress:
+                progress(report)
+            if report["pendentes"] == 0 and report["enviando"] == 0:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.5)
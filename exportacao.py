@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+exportacao.py
+-------------------------------------------------
+Exportação em blocos (CSV / XLSX / Parquet) dos Resultados e do Hubspot,
+usada pelo app e pelo exportar.py. Os blocos são gravados um de cada vez,
+então a memória não cresce com o tamanho da planilha. Os filtros de
+Resultados são os mesmos do Formulário (backend.filter_snapshot_indices).
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import backend as be
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = (".csv", ".xlsx", ".parquet")
+
+def iter_snapshot_chunks(snapshot, indices, chunk_size=EXPORT_CHUNK_SIZE):
+    """Gera DataFrames de até `chunk_size` linhas a partir das colunas do snapshot."""
+    for start in range(0, len(indices), chunk_size):
+        sel = indices[start:start + chunk_size]
+        data = {}
+        for c in snapshot.column_names:
+            column = snapshot.columns[c]
+            if isinstance(column, np.ndarray):
+                data[c] = column[sel]
+            else:
+                data[c] = ["" if column[i] is None else str(column[i]) for i in sel]
+        yield pd.DataFrame(data, columns=snapshot.column_names)
+
+def iter_hubspot_chunks(hubspot_df, unidade_limpa=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Gera blocos do Hubspot projetado nas colunas usadas pelo app, filtrado por unidade."""
+    if hubspot_df is None or hubspot_df.empty:
+        return
+    renamed = {"Contato Realizado": "Contato realizado"}  # ver build_hubspot_df
+    cols = [renamed.get(c, c) for c in be.HUBSPOT_COLUMNS if renamed.get(c, c) in hubspot_df.columns]
+    df = hubspot_df
+    if unidade_limpa and unidade_limpa != "Todas":
+        df = df[df["Unidade"] == be.UNIDADES_MAP.get(unidade_limpa, unidade_limpa)]
+    for start in range(0, len(df), chunk_size):
+        # Texto uniforme entre blocos (o Parquet exige o mesmo schema em todos)
+        yield df.iloc[start:start + chunk_size][cols].astype(str)
+
+class _CsvChunkWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", newline="", encoding="utf-8-sig")
+        self.first = True
+
+    def write(self, chunk):
+        chunk.to_csv(self.f, header=self.first, index=False, sep=";", decimal=",", date_format="%d/%m/%Y %H:%M:%S")
+        self.first = False
+
+    def close(self):
+        self.f.close()
+
+class _XlsxChunkWriter:
+    def __init__(self, path):
+        try:
+            import openpyxl
+        except ImportError:
+            raise Exception("❌ Para exportar em .xlsx é necessário instalar o pacote 'openpyxl'.")
+        self.path = path
+        self.wb = openpyxl.Workbook(write_only=True)  # modo streaming: não guarda as linhas em memória
+        self.ws = self.wb.create_sheet("Dados")
+        self.first = True
+
+    def write(self, chunk):
+        if self.first:
+            self.ws.append(list(chunk.columns))
+            self.first = False
+        for row in chunk.itertuples(index=False):
+            self.ws.append([None if pd.isna(v) else (v.to_pydatetime() if isinstance(v, pd.Timestamp) else v) for v in row])
+
+    def close(self):
+        self.wb.save(self.path)
+
+class _ParquetChunkWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("❌ Para exportar em .parquet é necessário instalar o pacote 'pyarrow'.")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def export_chunks(chunks, path, total_rows, progress=None):
+    """
+    Grava os blocos no formato indicado pela extensão de `path`, um bloco por
+    vez, para que a memória usada não cresça com o tamanho da planilha.
+    `progress(linhas_gravadas, total)` é chamado após cada bloco.
+    Retorna o número de linhas exportadas.
+    """
+    ext = Path(path).suffix.lower()
+    writers = {".csv": _CsvChunkWriter, ".xlsx": _XlsxChunkWriter, ".parquet": _ParquetChunkWriter}
+    if ext not in writers:
+        raise Exception(f"❌ Formato de exportação não suportado: '{ext}'. Use {', '.join(EXPORT_FORMATS)}.")
+    writer = writers[ext](path)
+    written = 0
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            written += len(chunk)
+            if progress:
+                progress(written, total_rows)
+    finally:
+        writer.close()
+    return written
+
+def export_resultados(snapshot, path, unidade_limpa=None, bolsao=None, progress=None, chunk_size=EXPORT_CHUNK_SIZE,
+                      bolsa=None, matriculou=None, inicio=None, fim=None):
+    """
+    Exporta o snapshot de Resultados para CSV/XLSX/Parquet com os mesmos
+    filtros do Formulário (ver filter_snapshot_indices).
+    """
+    indices = be.filter_snapshot_indices(snapshot, unidade_limpa, bolsao, bolsa, matriculou, inicio, fim)
+    return export_chunks(iter_snapshot_chunks(snapshot, indices, chunk_size), path, len(indices), progress)
+
+def export_hubspot(hubspot_df, path, unidade_limpa=None, progress=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Exporta o Hubspot projetado (colunas usadas pelo app), filtrado por unidade."""
+    total = 0
+    if hubspot_df is not None and not hubspot_df.empty:
+        total = len(hubspot_df) if not unidade_limpa or unidade_limpa == "Todas" else \
+            int((hubspot_df["Unidade"] == be.UNIDADES_MAP.get(unidade_limpa, unidade_limpa)).sum())
+    return export_chunks(iter_hubspot_chunks(hubspot_df, unidade_limpa, chunk_size), path, total, progress)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+exportar.py
+-------------------------------------------------
+Exporta os dados do Gestor do Bolsão pela linha de comando, sem abrir a
+interface. Usa a mesma carga inicial e a mesma exportação em blocos do app.
+Com shards por unidade no config_local.json, os resultados vêm de todos os
+shards, lidos em paralelo.
+
+Exemplos:
+    python exportar.py resultados saida.csv --unidade BANGU --bolsao "Bolsão 12/10"
+    python exportar.py hubspot hubspot.parquet
+"""
+import argparse
+import sys
+
+import backend as be
+import exportacao
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta Resultados ou Hubspot para CSV, XLSX ou Parquet.")
+    parser.add_argument("dados", choices=["resultados", "hubspot"], help="Qual conjunto de dados exportar.")
+    parser.add_argument("saida", help="Arquivo de saída (.csv, .xlsx ou .parquet).")
+    parser.add_argument("--unidade", default="Todas", help="Unidade (nome curto, ex: BANGU). Padrão: Todas.")
+    parser.add_argument("--bolsao", default="Todos", help="Nome do bolsão (só para resultados). Padrão: Todos.")
+    parser.add_argument("--bloco", type=int, default=exportacao.EXPORT_CHUNK_SIZE, help="Linhas por bloco gravado.")
+    args = parser.parse_args()
+
+    def progresso(gravadas, total):
+        print(f"\r{gravadas}/{total} linha(s)", end="", flush=True)
+
+    try:
+        be.init_backend()
+        if args.dados == "resultados":
+            snapshot = be.load_all_shards_snapshot() if be.get_shard_map() else be.bootstrap_initial_data()["snapshot"]
+            n = exportacao.export_resultados(snapshot, args.saida, args.unidade, args.bolsao,
+                                     progress=progresso, chunk_size=args.bloco)
+        else:
+            dados = be.bootstrap_initial_data()
+            n = exportacao.export_hubspot(dados["hubspot_df"], args.saida, args.unidade,
+                                  progress=progresso, chunk_size=args.bloco)
+    except Exception as e:
+        print(f"\nErro na exportação: {e}", file=sys.stderr)
+        return 1
+    print(f"\n{n} linha(s) exportada(s) para {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
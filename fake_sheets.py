@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+fake_sheets.py
+-------------------------------------------------
+Planilha falsa, em memória, que imita as chamadas da API do Google Sheets
+usadas pelo backend (fetch_sheet_metadata, values_batch_get, values_get,
+values_append, values_batch_update e batch_update com addSheet/deleteDimension). Serve para testar localhost sem cota e
+sem credenciais, por exemplo com o servidor de cache da unidade:
+
+    python servidor_cache.py --fake
+
+ou, dentro de um script:
+
+    import backend as be, fake_sheets
+    be.use_workbook(fake_sheets.sample_spreadsheet())
+
+Opcionalmente imita também a latência da API (LatenciaSheets) e a cota por
+minuto (CotaSheets), com as mesmas novas tentativas em 429 da sessão HTTP do
+backend; é o que o simulador de carga (simular_carga.py) usa.
+"""
+import collections
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import gspread
+from gspread.http_client import HTTPClient
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+import backend as be
+
+_RANGE_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!']+))(?:!(.*))?$")
+
+class _FakeResponse:
+    """Resposta mínima aceita pelo construtor de gspread.exceptions.APIError."""
+
+    def __init__(self, code, message):
+        self.status_code = code
+        self.text = message
+        self._error = {"error": {"code": code, "message": message, "status": "INVALID_ARGUMENT"}}
+
+    def json(self):
+        return self._error
+
+def api_error(code, message):
+    """Cria um APIError como o que a biblioteca levantaria para a resposta da API."""
+    return gspread.exceptions.APIError(_FakeResponse(code, message))
+
+def _trim(rows):
+    """Remove células e linhas vazias do final, como a API faz nas respostas."""
+    out = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] in ("", None):
+            row.pop()
+        out.append(row)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+def _formatted(value):
+    """Aproximação do FORMATTED_VALUE: números inteiros sem casas, o resto como texto."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return "" if value is None else str(value)
+
+def _user_entered(value):
+    """Aproximação do USER_ENTERED: textos numéricos viram número."""
+    if isinstance(value, str):
+        try:
+            return float(value) if "." in value else int(value)
+        except ValueError:
+            return value
+    return value
+
+# --- LATÊNCIA E COTA (OPCIONAIS) ---
+READ_METHODS = {"fetch_sheet_metadata", "values_batch_get", "values_get"}
+
+class LatenciaSheets:
+    """
+    Tempo de resposta de uma chamada: base lognormal (mediana `base_ms`) mais
+    um custo por célula devolvida ou gravada. `escala` divide todos os tempos
+    (simulações aceleradas).
+    """
+
+    def __init__(self, base_ms=180, sigma=0.35, ms_por_mil_celulas=25, escala=1.0, seed=None):
+        self.base_ms = base_ms
+        self.sigma = sigma
+        self.ms_por_mil_celulas = ms_por_mil_celulas
+        self.escala = escala
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def base(self):
+        with self.lock:
+            ms = self.base_ms * self.rnd.lognormvariate(0, self.sigma)
+        return ms / 1000 / self.escala
+
+    def por_celulas(self, celulas):
+        return celulas / 1000 * self.ms_por_mil_celulas / 1000 / self.escala
+
+class CotaSheets:
+    """
+    Cota por minuto da API, em janela deslizante: leituras e escritas por
+    usuário (todos os desktops usam a mesma conta de serviço, então é a cota
+    que vale). Com `escala` > 1 a janela de 60 s encolhe na mesma proporção.
+    """
+
+    def __init__(self, leituras_por_minuto=60, escritas_por_minuto=60, escala=1.0):
+        self.limites = {"read": leituras_por_minuto, "write": escritas_por_minuto}
+        self.janela = 60.0 / escala
+        self.chamadas = {"read": collections.deque(), "write": collections.deque()}
+        self.rejeicoes = {"read": 0, "write": 0}
+        self.lock = threading.Lock()
+
+    def tentar(self, tipo) -> bool:
+        """Registra a chamada se couber na cota; senão conta a rejeição (429) e retorna False."""
+        agora = time.monotonic()
+        with self.lock:
+            fila = self.chamadas[tipo]
+            while fila and agora - fila[0] > self.janela:
+                fila.popleft()
+            if len(fila) >= self.limites[tipo]:
+                self.rejeicoes[tipo] += 1
+                return False
+            fila.append(agora)
+            return True
+
+class FakeSpreadsheet:
+    """
+    Planilha em memória: {título da aba: lista de linhas}. Thread-safe, conta
+    as chamadas por método em `calls` (e por thread em `thread_calls()`) e
+    expõe `client` para os objetos Worksheet do gspread (que chamam
+    client.values_append etc.). Com `latencia` e `cota`, cada chamada espera
+    o tempo de resposta (fora da trava, como chamadas HTTP simultâneas) e
+    pode receber 429, repetido como faria a sessão HTTP do backend.
+    """
+
+    def __init__(self, tabs, title="Planilha falsa", latencia=None, cota=None):
+        self.id = "fake-spreadsheet"
+        self.title = title
+        self.tabs = {name: [list(r) for r in rows] for name, rows in tabs.items()}
+        self.sheet_ids = {name: i for i, name in enumerate(self.tabs)}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.client = FakeSheetsClient(self)
+        self.latencia = latencia
+        self.cota = cota
+        self._local = threading.local()
+
+    # --- utilitários internos ---
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _request(self, method):
+        """Ida à "rede": cota (com as novas tentativas da sessão HTTP) e latência, fora da trava."""
+        self._local.calls = getattr(self._local, "calls", 0) + 1
+        if self.cota is not None:
+            tipo = "read" if method in READ_METHODS else "write"
+            for tentativa in range(be.HTTP_RETRY_TOTAL + 1):
+                if self.cota.tentar(tipo):
+                    be._track_api_response(_FakeResponse(200, ""))
+                    break
+                be._track_api_response(_FakeResponse(429, ""))
+                self._local.rejected = getattr(self._local, "rejected", 0) + 1
+                if tentativa == be.HTTP_RETRY_TOTAL:
+                    raise api_error(429, f"Quota exceeded for quota metric '{tipo}' requests per minute per user.")
+                time.sleep(be.HTTP_RETRY_BACKOFF * (2 ** tentativa) * self.cota.janela / 60)
+        if self.latencia is not None:
+            time.sleep(self.latencia.base())
+
+    def _transfer(self, celulas):
+        """Custo de transferência proporcional ao volume lido ou gravado."""
+        if self.latencia is not None and celulas:
+            time.sleep(self.latencia.por_celulas(celulas))
+
+    def thread_calls(self):
+        """(chamadas, respostas 429) feitas pela thread atual desde o início."""
+        return getattr(self._local, "calls", 0), getattr(self._local, "rejected", 0)
+
+    def _resolve(self, a1):
+        """Converte "'Aba'!A2:C" em (título, linha0, linha1, col0, col1), índices base 0 e fim aberto."""
+        m = _RANGE_RE.match(a1.strip())
+        if not m:
+            raise api_error(400, f"Unable to parse range: {a1}")
+        title = m.group(1).replace("''", "'") if m.group(1) is not None else m.group(2)
+        if title not in self.tabs:
+            raise api_error(400, f"Unable to parse range: {a1}")
+        grid = a1_range_to_grid_range(m.group(3)) if m.group(3) else {}
+        return (title, grid.get("startRowIndex", 0), grid.get("endRowIndex"),
+                grid.get("startColumnIndex", 0), grid.get("endColumnIndex"))
+
+    def _read(self, a1, render, dimension="ROWS"):
+        title, r0, r1, c0, c1 = self._resolve(a1)
+        rows = [row[c0:c1] for row in self.tabs[title][r0:r1]]
+        if render != "UNFORMATTED_VALUE":
+            rows = [[_formatted(v) for v in row] for row in rows]
+        if dimension == "COLUMNS":
+            width = max((len(r) for r in rows), default=0)
+            rows = [[r[j] if j < len(r) else "" for r in rows] for j in range(width)]
+        vr = {"range": a1, "majorDimension": dimension}
+        values = _trim(rows)
+        if values:
+            vr["values"] = values
+        return vr
+
+    def _write(self, a1, values, input_option):
+        title, r0, _, c0, _ = self._resolve(a1)
+        rows = self.tabs[title]
+        for i, row_values in enumerate(values):
+            while len(rows) <= r0 + i:
+                rows.append([])
+            row = rows[r0 + i]
+            for j, v in enumerate(row_values):
+                while len(row) <= c0 + j:
+                    row.append("")
+                row[c0 + j] = _user_entered(v) if input_option == "USER_ENTERED" else v
+
+    # --- chamadas da API usadas pelo backend ---
+    def fetch_sheet_metadata(self, params=None):
+        self._request("fetch_sheet_metadata")
+        with self.lock:
+            self._count("fetch_sheet_metadata")
+            sheets = []
+            for index, (name, rows) in enumerate(self.tabs.items()):
+                cols = max((len(r) for r in rows), default=0)
+                sheets.append({"properties": {
+                    "sheetId": self.sheet_ids[name], "title": name, "index": index, "sheetType": "GRID",
+                    "gridProperties": {"rowCount": max(len(rows), 1000), "columnCount": max(cols, 26)},
+                }})
+            return {"spreadsheetId": self.id, "properties": {"title": self.title}, "sheets": sheets}
+
+    def values_batch_get(self, ranges, params=None):
+        params = params or {}
+        render = params.get("valueRenderOption", "FORMATTED_VALUE")
+        dimension = params.get("majorDimension", "ROWS")
+        self._request("values_batch_get")
+        with self.lock:
+            self._count("values_batch_get")
+            vranges = [self._read(r, render, dimension) for r in ranges]
+        self._transfer(sum(len(row) for vr in vranges for row in vr.get("values", [])))
+        return {"spreadsheetId": self.id, "valueRanges": vranges}
+
+    def values_get(self, range_name, params=None):
+        params = params or {}
+        render = params.get("valueRenderOption", "FORMATTED_VALUE")
+        self._request("values_get")
+        with self.lock:
+            self._count("values_get")
+            vr = self._read(range_name, render, params.get("majorDimension", "ROWS"))
+        self._transfer(sum(len(row) for row in vr.get("values", [])))
+        return vr
+
+    def values_batch_update(self, body=None):
+        body = body or {}
+        self._request("values_batch_update")
+        self._transfer(sum(len(r) for item in body.get("data", []) for r in item.get("values", [])))
+        with self.lock:
+            self._count("values_batch_update")
+            for item in body.get("data", []):
+                self._write(item["range"], item.get("values", []), body.get("valueInputOption"))
+            return {"spreadsheetId": self.id, "totalUpdatedCells": sum(
+                len(r) for item in body.get("data", []) for r in item.get("values", []))}
+
+    def values_append(self, range_name, params=None, body=None):
+        values = (body or {}).get("values", [])
+        self._request("values_append")
+        self._transfer(sum(len(r) for r in values))
+        with self.lock:
+            self._count("values_append")
+            title = self._resolve(range_name)[0]
+            rows = self.tabs[title]
+            first = len(_trim(rows)) + 1
+            del rows[first - 1:]
+            self._write(f"'{title}'!A{first}", values, (params or {}).get("valueInputOption"))
+            last_col = max((len(r) for r in values), default=1)
+            updated = f"'{title}'!A{first}:{rowcol_to_a1(first + len(values) - 1, last_col)}"
+            return {"spreadsheetId": self.id, "tableRange": f"'{title}'!A1",
+                    "updates": {"updatedRange": updated, "updatedRows": len(values)}}
+
+    def batch_update(self, body=None):
+        """Só as requisições usadas no arquivamento de partições: addSheet, deleteSheet e deleteDimension (linhas)."""
+        replies = []
+        self._request("batch_update")
+        with self.lock:
+            self._count("batch_update")
+            for req in (body or {}).get("requests", []):
+                if "addSheet" in req:
+                    props = req["addSheet"].get("properties", {})
+                    title = props["title"]
+                    if title in self.tabs:
+                        raise api_error(400, f"Invalid requests[0].addSheet: A sheet with the name \"{title}\" already exists.")
+                    self.tabs[title] = []
+                    self.sheet_ids[title] = max(self.sheet_ids.values(), default=-1) + 1
+                    replies.append({"addSheet": {"properties": dict(props, sheetId=self.sheet_ids[title])}})
+                elif "deleteSheet" in req:
+                    sheet_id = req["deleteSheet"]["sheetId"]
+                    title = next(t for t, sid in self.sheet_ids.items() if sid == sheet_id)
+                    del self.tabs[title]
+                    del self.sheet_ids[title]
+                    replies.append({})
+                elif "deleteDimension" in req:
+                    rng = req["deleteDimension"]["range"]
+                    title = next(t for t, sid in self.sheet_ids.items() if sid == rng["sheetId"])
+                    if rng.get("dimension") != "ROWS":
+                        raise api_error(400, "Só a remoção de linhas é simulada.")
+                    del self.tabs[title][rng["startIndex"]:rng["endIndex"]]
+                    replies.append({})
+                else:
+                    raise api_error(400, f"Requisição não simulada: {list(req)}")
+            return {"spreadsheetId": self.id, "replies": replies}
+
+class FakeSheetsClient(HTTPClient):
+    """
+    Imita o HTTPClient do gspread nas chamadas que o Worksheet repassa a ele.
+    Herda só para passar na verificação de tipo do Worksheet: nenhuma
+    requisição HTTP é feita.
+    """
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def values_get(self, spreadsheet_id, range_name, params=None):
+        return self.spreadsheet.values_get(range_name, params)
+
+    def values_batch_get(self, spreadsheet_id, ranges, params=None):
+        return self.spreadsheet.values_batch_get(ranges, params)
+
+    def values_append(self, spreadsheet_id, range_name, params, body):
+        return self.spreadsheet.values_append(range_name, params, body)
+
+    def values_update(self, spreadsheet_id, range_name, params=None, body=None):
+        return self.spreadsheet.values_batch_update({
+            "valueInputOption": (params or {}).get("valueInputOption"),
+            "data": [{"range": range_name, "values": (body or {}).get("values", [])}],
+        })
+
+    def values_batch_update(self, spreadsheet_id, body=None):
+        return self.spreadsheet.values_batch_update(body)
+
+# --------------------------------------------------
+# DADOS DE EXEMPLO
+# --------------------------------------------------
+RESULTADOS_HEADER = [
+    "Data/Hora", "Nome do Aluno", "Unidade", "Turma de Interesse", "Acertos Matemática",
+    "Acertos Português", "Total de Acertos", "% Bolsa", "Série / Modalidade",
+    "Valor Anuidade à Vista", "Valor da 1ª Cota", "Valor da Mensalidade com Bolsa",
+    "REGISTRO_ID", "Bolsão", "Escola de Origem", "Valor Negociado", "Responsável Financeiro",
+    "Telefone", "Aluno Matriculou?", "Observações (Form)", be.COL_EXPECTATIVA,
+]
+_NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Heitor", "Isabela", "João",
+          "Larissa", "Miguel", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Thiago", "Valentina", "Yuri"]
+_SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Costa", "Rodrigues", "Almeida",
+               "Nascimento", "Lima", "Araújo", "Fernandes", "Carvalho", "Gomes", "Martins"]
+
+def sample_spreadsheet(n_resultados=2000, n_hubspot=3000, seed=0, latencia=None, cota=None):
+    """
+    Gera uma planilha falsa com as abas 'Resultados_Bolsao', 'Hubspot' e
+    'Bolsão' no formato da planilha real, com dados aleatórios reprodutíveis.
+    """
+    rnd = random.Random(seed)
+    if be.get_catalogo() is None:
+        be.init_catalogo()  # os preços vêm do catálogo; scripts de teste podem não ter chamado init_backend
+    series = list(be.TUITION)
+    hoje = be.get_current_brasilia_date()
+    bolsoes = [(hoje - timedelta(days=7 * k), f"Bolsão {(hoje - timedelta(days=7 * k)).strftime('%d/%m')}")
+               for k in range(12)]
+
+    def nome():
+        return f"{rnd.choice(_NOMES)} {rnd.choice(_SOBRENOMES)} {rnd.choice(_SOBRENOMES)}"
+
+    hubspot = [list(be.HUBSPOT_COLUMNS)]
+    for i in range(n_hubspot):
+        unidade = rnd.choice(be.UNIDADES_COMPLETAS)
+        candidato = nome()
+        celular = f"219{rnd.randint(10000000, 99999999)}"
+        hubspot.append([
+            unidade, candidato, str(100000 + i), rnd.choice(["Novo", "Em contato", "Agendado"]),
+            rnd.choice(["Sim", "Não"]), "", celular, candidato.split()[0],
+            f"{be.normalize_key(candidato).replace(' ', '.')}{i}@exemplo.com",
+            rnd.choice(list(be.TURMA_DE_INTERESSE_MAP) or ["1º ano"]), "Site",
+        ])
+
+    resultados = [list(RESULTADOS_HEADER)]
+    for _ in range(n_resultados):
+        serie = rnd.choice(series)
+        unidade_limpa = rnd.choice(be.UNIDADES_LIMPAS)
+        ac_mat, ac_port = rnd.randint(0, 12), rnd.randint(0, 12)
+        pct = rnd.choice([0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+        data_bolsao, nome_bolsao = rnd.choice(bolsoes)
+        quando = datetime.combine(data_bolsao, datetime.min.time()) + timedelta(minutes=rnd.randint(480, 1080))
+        record = be.build_resultado_record(nome(), unidade_limpa, serie, ac_mat, ac_port, pct, serie,
+                                           quando, nome_bolsao)
+        record["Data/Hora"] = (quando - be.SHEETS_EPOCH).total_seconds() / 86400
+        record["% Bolsa"] = pct
+        for col in ("Valor Anuidade à Vista", "Valor da 1ª Cota", "Valor da Mensalidade com Bolsa"):
+            record[col] = be.parse_brl_to_float(record[col])
+        record["Telefone"] = f"219{rnd.randint(10000000, 99999999)}"
+        record["Aluno Matriculou?"] = rnd.choice(["", "Sim", "Não"])
+        record[be.COL_EXPECTATIVA] = float(rnd.randrange(800, 3000, 50))
+        resultados.append([record.get(col, "") for col in RESULTADOS_HEADER])
+
+    bolsao = [["Data", "Dia", "Nome"]] + [[d.strftime("%d/%m/%Y"), "", n] for d, n in sorted(bolsoes)]
+    return FakeSpreadsheet({"Resultados_Bolsao": resultados, "Hubspot": hubspot, "Bolsão": bolsao},
+                           latencia=latencia, cota=cota)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+perfil.py
+-------------------------------------------------
+Perfil de desempenho sob demanda do Gestor do Bolsão. Ligado pelo argumento
+--profile ou por Ctrl+Shift+P no app. Cada chamada de uma função marcada com
+@perfilado vira um .prof (cProfile; abre no snakeviz ou vira flame graph com
+flameprof) e um resumo em texto com as funções mais caras e a diferença de
+memória (tracemalloc). Tudo vai para uma pasta perfil_AAAAMMDD_HHMMSS,
+compactada num .zip ao encerrar, para o usuário enviar.
+"""
+import cProfile
+import functools
+import io
+import platform
+import pstats
+import threading
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_TOP_N = 30
+PROFILE_MEMORY_TOP_N = 15
+PROFILE_TRACEMALLOC_FRAMES = 10
+
+class PerfilSessao:
+    """Uma sessão de perfil: pasta de saída, contagem de capturas e resumo geral."""
+
+    def __init__(self, base_dir=".", app_version=None):
+        self.started_at = datetime.now()
+        self.dir = Path(base_dir) / f"perfil_{self.started_at.strftime('%Y%m%d_%H%M%S')}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.app_version = app_version
+        self.lock = threading.Lock()
+        self.profile_lock = threading.Lock()  # cProfile não aceita duas capturas ao mesmo tempo
+        self.local = threading.local()         # profundidade de capturas aninhadas, por thread
+        self.count = 0
+        self.entries = []   # (nº, nome, segundos, observação: None, "aninhada", "em paralelo" ou "medido")
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+
+    def capture(self, name, func, *args, **kwargs):
+        """
+        Executa func sob cProfile e tracemalloc e grava os arquivos da captura.
+        Uma captura dentro de outra na mesma thread (ex: gera_pdf_html dentro de
+        gerar_carta) só é cronometrada, pois o perfil externo já a inclui. Se
+        outra thread estiver com o cProfile (ex: o feed de alterações), esta
+        também só é cronometrada, sem esperar, e fica marcada como em paralelo.
+        """
+        with self.lock:
+            self.count += 1
+            n = self.count
+        depth = getattr(self.local, "depth", 0)
+        nota = "aninhada" if depth else None
+        if nota is None and not self.profile_lock.acquire(blocking=False):
+            nota = "em paralelo"
+        self.local.depth = depth + 1
+        try:
+            if nota:
+                t0 = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._record(n, name, time.perf_counter() - t0, nota)
+
+            profile = cProfile.Profile()
+            before = tracemalloc.take_snapshot()
+            t0 = time.perf_counter()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                self.profile_lock.release()
+                try:
+                    self._write_capture(n, name, elapsed, profile, before, tracemalloc.take_snapshot())
+                except Exception as e:
+                    print(f"Aviso: não foi possível gravar o perfil de {name}: {e}")
+        finally:
+            self.local.depth = depth
+
+    def record_timing(self, name, elapsed, nota="medido"):
+        """Registra no resumo um tempo medido fora do cProfile (ex: a primeira chamada à API)."""
+        with self.lock:
+            self.count += 1
+            n = self.count
+        self._record(n, name, elapsed, nota)
+
+    def _record(self, n, name, elapsed, nota=None):
+        with self.lock:
+            self.entries.append((n, name, elapsed, nota))
+
+    def _write_capture(self, n, name, elapsed, profile, before, after):
+        base = self.dir / f"{n:03d}_{name}"
+        profile.dump_stats(str(base) + ".prof")
+
+        out = io.StringIO()
+        out.write(f"{name}: {elapsed:.3f}s\n\n")
+        pstats.Stats(profile, stream=out).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        out.write("\nMemória alocada durante a chamada (por linha):\n")
+        for stat in after.compare_to(before, "lineno")[:PROFILE_MEMORY_TOP_N]:
+            out.write(f"  {stat}\n")
+        current, peak = tracemalloc.get_traced_memory()
+        out.write(f"\nMemória rastreada: atual {current / 1e6:.1f} MB, pico {peak / 1e6:.1f} MB\n")
+        with open(str(base) + ".txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        self._record(n, name, elapsed)
+
+    def close(self, notas=()) -> Path:
+        """
+        Encerra o tracemalloc, grava o resumo geral e compacta a pasta. Retorna o .zip.
+        `notas` são linhas extras para o cabeçalho do resumo (ex: uso da API).
+        """
+        tracemalloc.stop()
+        with self.lock:
+            entries = sorted(self.entries)
+        lines = [
+            f"Gestor do Bolsão {self.app_version or ''}".strip(),
+            f"Início: {self.started_at:%d/%m/%Y %H:%M:%S}  Fim: {datetime.now():%d/%m/%Y %H:%M:%S}",
+            f"Python {platform.python_version()} em {platform.platform()}",
+            *notas,
+            "",
+            "Capturas (segundos):",
+        ]
+        lines += [f"  {n:03d} {name:<24} {elapsed:8.3f}{f'  ({nota})' if nota else ''}"
+                  for n, name, elapsed, nota in entries]
+        by_name = {}
+        for _, name, elapsed, _ in entries:
+            by_name.setdefault(name, []).append(elapsed)
+        lines += ["", "Por função: chamadas, total, média, máximo"]
+        lines += [f"  {name:<24} {len(v):4d} {sum(v):8.3f} {sum(v) / len(v):8.3f} {max(v):8.3f}"
+                  for name, v in sorted(by_name.items(), key=lambda kv: -sum(kv[1]))]
+        with open(self.dir / "resumo.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        zip_path = self.dir.with_suffix(".zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for file in sorted(self.dir.iterdir()):
+                zf.write(file, arcname=f"{self.dir.name}/{file.name}")
+        return zip_path
+
+_perfil_sessao = None
+
+def iniciar_perfil(base_dir=".", app_version=None) -> Path:
+    """Liga o modo de perfil. Retorna a pasta onde as capturas serão gravadas."""
+    global _perfil_sessao
+    if _perfil_sessao is None:
+        _perfil_sessao = PerfilSessao(base_dir, app_version)
+    return _perfil_sessao.dir
+
+def encerrar_perfil(notas=()):
+    """Desliga o modo de perfil e retorna o caminho do .zip (ou None se não estava ligado)."""
+    global _perfil_sessao
+    sessao, _perfil_sessao = _perfil_sessao, None
+    return sessao.close(notas) if sessao else None
+
+def perfil_ativo() -> bool:
+    return _perfil_sessao is not None
+
+def registrar_tempo_perfil(name, seconds, nota="medido"):
+    """Anota um tempo medido à parte no resumo do perfil, se o modo de perfil estiver ligado."""
+    sessao = _perfil_sessao
+    if sessao is not None and seconds is not None:
+        sessao.record_timing(name, seconds, nota)
+
+def perfilado(name):
+    """Marca uma função para ser capturada quando o modo de perfil estiver ligado."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            sessao = _perfil_sessao
+            if sessao is None:
+                return func(*args, **kwargs)
+            return sessao.capture(name, func, *args, **kwargs)
+        return wrapper
+    return decorator
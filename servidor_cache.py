@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+servidor_cache.py
+-------------------------------------------------
+Servidor de cache opcional para a rede local de uma unidade. Mantém uma
+única cópia das leituras da carga inicial (metadados, cabeçalhos, Hubspot,
+calendário de bolsões e colunas de Resultados) e a revalida no Google a cada
+intervalo, ou assim que um desktop avisa que gravou algo. Os desktops leem
+dele com If-None-Match e, se ele cair, voltam a ler direto do Google.
+
+Por padrão o servidor só escuta em 127.0.0.1. Para servir a rede da unidade,
+passe --host com o IP da interface; fora do loopback é obrigatório um token
+compartilhado ("cache_server_token" no config_local.json ou GESTOR_CACHE_TOKEN),
+e toda requisição sem ele recebe 401. Os dados trafegam em HTTP simples:
+use só na rede interna da unidade.
+
+Para apontar um desktop para o servidor, crie um config_local.json ao lado do
+executável com {"cache_server_url": "http://<ip-do-servidor>:8765",
+"cache_server_token": "<o mesmo token do servidor>"} ou defina as variáveis
+de ambiente GESTOR_CACHE_URL e GESTOR_CACHE_TOKEN.
+
+Exemplos:
+    python servidor_cache.py                          # lê da planilha real, só neste computador
+    python servidor_cache.py --host 192.168.0.10      # rede da unidade (exige o token)
+    python servidor_cache.py --fake --porta 8765      # planilha falsa (fake_sheets.py)
+"""
+import argparse
+import gzip
+import hashlib
+import hmac
+import ipaddress
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import backend as be
+
+REVALIDATE_INTERVAL = 60   # segundos entre revalidações agendadas
+MIN_REVALIDATE_GAP = 5     # segundos mínimos entre duas leituras no Google
+
+class SheetsCache:
+    """
+    Cópia única do payload da carga inicial, revalidada em segundo plano.
+    `fetch` é a função que lê o payload (na planilha real ou na falsa).
+    """
+
+    def __init__(self, fetch, interval=REVALIDATE_INTERVAL):
+        self.fetch = fetch
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.body = None
+        self.gzip_body = None
+        self.etag = None
+        self.fetched_at = 0.0
+        self.last_error = None
+        self.stats = {"revalidations": 0, "changes": 0, "errors": 0, "served": 0, "not_modified": 0}
+
+    def revalidate(self):
+        """Relê a planilha e troca a cópia se o conteúdo mudou. Retorna True se mudou."""
+        payload = self.fetch()
+        body = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        # O ETag ignora o horário da leitura: só muda quando os dados mudam
+        content = dict(payload, fetched_at=None)
+        etag = '"' + hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest() + '"'
+        with self.lock:
+            changed = etag != self.etag
+            self.body, self.gzip_body, self.etag = body, gzip.compress(body), etag
+            self.fetched_at = time.time()
+            self.last_error = None
+            self.stats["revalidations"] += 1
+            self.stats["changes"] += int(changed)
+        return changed
+
+    def request_revalidation(self):
+        """Antecipa a próxima revalidação (chamado quando um desktop grava na planilha)."""
+        self.wakeup.set()
+
+    def run_forever(self):
+        """Laço de revalidação: espera o intervalo (ou um aviso) e relê a planilha."""
+        last = time.monotonic()
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            gap = MIN_REVALIDATE_GAP - (time.monotonic() - last)
+            if gap > 0:
+                time.sleep(gap)
+            last = time.monotonic()
+            try:
+                if self.revalidate():
+                    print(f"Cópia atualizada ({self.etag}).")
+            except Exception as e:
+                with self.lock:
+                    self.last_error = str(e)
+                    self.stats["errors"] += 1
+                print(f"Aviso: falha ao revalidar no Google, mantendo a cópia anterior: {e}")
+
+    def start(self):
+        threading.Thread(target=self.run_forever, daemon=True).start()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "etag": self.etag,
+                "age_seconds": round(time.time() - self.fetched_at, 1) if self.etag else None,
+                "interval_seconds": self.interval,
+                "last_error": self.last_error,
+                **self.stats,
+            }
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """GET /bootstrap, GET /status e POST /revalidate (com token, se configurado)."""
+
+    cache = None  # SheetsCache, definido em make_server
+    token = None  # token compartilhado; None só é aceito no loopback
+
+    def _authorized(self):
+        if not self.token:
+            return True
+        enviado = self.headers.get("Authorization", "")
+        return hmac.compare_digest(enviado.encode("utf-8"), f"Bearer {self.token}".encode("utf-8"))
+
+    def _send(self, code, body=b"", headers=None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, code, data):
+        self._send(code, json.dumps(data).encode("utf-8"), {"Content-Type": "application/json"})
+
+    def do_GET(self):
+        if not self._authorized():
+            return self._send_json(401, {"erro": "token ausente ou inválido"})
+        if self.path == "/status":
+            return self._send_json(200, self.cache.status())
+        if self.path != "/bootstrap":
+            return self._send_json(404, {"erro": "caminho desconhecido"})
+
+        with self.cache.lock:
+            body, gzip_body, etag = self.cache.body, self.cache.gzip_body, self.cache.etag
+            not_modified = etag is not None and self.headers.get("If-None-Match") == etag
+            if etag is not None:
+                self.cache.stats["not_modified" if not_modified else "served"] += 1
+        if etag is None:
+            return self._send_json(503, {"erro": "cópia ainda não carregada"})
+        if not_modified:
+            return self._send(304, headers={"ETag": etag})
+
+        headers = {"Content-Type": "application/json; charset=utf-8", "ETag": etag}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip_body
+            headers["Content-Encoding"] = "gzip"
+        self._send(200, body, headers)
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._send_json(401, {"erro": "token ausente ou inválido"})
+        if self.path != "/revalidate":
+            return self._send_json(404, {"erro": "caminho desconhecido"})
+        self.cache.request_revalidation()
+        self._send_json(202, {"ok": True})
+
+    def log_message(self, format, *args):
+        pass  # o servidor só registra revalidações e erros
+
+def is_loopback(host) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def make_server(cache, host="127.0.0.1", port=8765, token=None):
+    """
+    Cria o servidor HTTP (ainda sem iniciar) servindo a cópia de `cache`.
+    Fora do loopback, `token` é obrigatório.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"para escutar em {host} é preciso um token (cache_server_token no config_local.json)")
+    handler = type("Handler", (CacheRequestHandler,), {"cache": cache, "token": token})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de cache da planilha para a rede local da unidade.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interface de rede. Padrão: só este computador; outro endereço exige o token.")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta HTTP. Padrão: 8765.")
+    parser.add_argument("--intervalo", type=int, default=REVALIDATE_INTERVAL,
+                        help="Segundos entre revalidações no Google.")
+    parser.add_argument("--fake", action="store_true", help="Usa a planilha falsa de fake_sheets.py (testes).")
+    args = parser.parse_args()
+
+    try:
+        be.init_backend()
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    token = be.get_cache_server_config()["token"]
+    if not token and not is_loopback(args.host):
+        print(f"Erro: para escutar em {args.host} defina 'cache_server_token' no config_local.json "
+              f"(ou {be.CACHE_SERVER_TOKEN_ENV}).", file=sys.stderr)
+        return 1
+
+    if args.fake:
+        import fake_sheets
+        be.use_workbook(fake_sheets.sample_spreadsheet())
+
+    cache = SheetsCache(lambda: be.fetch_bootstrap_payload(be.get_cached_workbook()), args.intervalo)
+    try:
+        cache.revalidate()
+    except Exception as e:
+        print(f"Erro na primeira leitura da planilha: {e}", file=sys.stderr)
+        return 1
+    cache.start()
+
+    server = make_server(cache, args.host, args.porta, token)
+    print(f"Servidor de cache em http://{args.host}:{args.porta} (revalidação a cada {args.intervalo}s).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+simular_carga.py
+-------------------------------------------------
+Simula N operadores usando a mesma planilha ao mesmo tempo, para saber a
+partir de quantos a cota e a latência do Google Sheets começam a atrapalhar.
+Cada operador é uma thread que chama as funções reais do backend (registro
+de resultado, gravação do Formulário, sincronização da fila offline e o feed
+de alterações) contra a planilha falsa de fake_sheets.py, com latência e cota
+por minuto imitando a API. Todos os desktops usam a mesma conta de serviço,
+então a cota é uma só para todos.
+
+Como as threads dividem um só processo, os caches de módulo do backend
+(metadados das abas, header_map e o cliente) seriam compartilhados e a
+verificação periódica dos cabeçalhos sairia uma vez só, em vez de uma por
+desktop. Por isso a verificação automática do backend fica desligada durante
+a simulação e cada operador faz a sua própria ("verificar_metadados", a cada
+METADATA_CHECK_INTERVAL). A carga inicial e a autenticação de cada desktop
+acontecem uma vez só, antes de a cota valer, e não entram nas métricas.
+
+Com --acelerar K, tempos de espera, latência e a janela da cota são divididos
+por K; os resultados são relatados em tempo simulado. O tempo de CPU local
+(ex: comparar o snapshot no feed) também é multiplicado por K, então para
+percentis de latência mais fiéis use um K baixo.
+
+Exemplos:
+    python simular_carga.py                                   # 1, 5, 10 e 20 operadores
+    python simular_carga.py --operadores 1,10,30 --duracao 600 --acelerar 20
+    python simular_carga.py --cota-leitura 300 --cota-escrita 300 --sem-feed
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+import backend as be
+import fake_sheets
+
+# Peso de cada ação no roteiro de um operador
+ROTEIRO = {"registrar": 0.4, "salvar_formulario": 0.4, "sincronizar_fila": 0.2}
+PENSAR_SEGUNDOS = 20    # intervalo médio entre duas ações de um mesmo operador
+FILA_OFFLINE_MAX = 5    # registros por sincronização da fila offline
+METADATA_CHECK_INTERVAL = be.METADATA_CHECK_INTERVAL
+ACOES = list(ROTEIRO) + ["verificar_alteracoes", "verificar_metadados"]
+
+class Metricas:
+    """Amostras por ação: (latência em segundos simulados, chamadas à API, respostas 429, erro)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.amostras = {acao: [] for acao in ACOES}
+        self.conflitos = 0
+
+    def registrar(self, acao, segundos, chamadas, rejeicoes, erro=None):
+        with self.lock:
+            self.amostras[acao].append((segundos, chamadas, rejeicoes, erro))
+
+    def resumo(self, duracao):
+        """Totais e percentis por ação; `duracao` em segundos simulados."""
+        linhas = {}
+        for acao, amostras in self.amostras.items():
+            if not amostras:
+                continue
+            lat = np.array([a[0] for a in amostras]) * 1000
+            ok = [a for a in amostras if a[3] is None]
+            linhas[acao] = {
+                "n": len(amostras),
+                "erros": len(amostras) - len(ok),
+                "erros_cota": sum(1 for a in amostras if a[3] == "cota"),
+                "p50": np.percentile(lat, 50), "p95": np.percentile(lat, 95), "p99": np.percentile(lat, 99),
+                "chamadas": sum(a[1] for a in amostras) / len(amostras),
+                "rejeicoes": sum(a[2] for a in amostras),
+            }
+        acoes_ok = sum(v["n"] - v["erros"] for k, v in linhas.items() if k in ROTEIRO)
+        return {"acoes": linhas, "acoes_por_minuto": acoes_ok / duracao * 60, "conflitos": self.conflitos}
+
+class Operador(threading.Thread):
+    """Um desktop: segue o roteiro de ações e, entre elas, roda o feed de alterações como o app."""
+
+    def __init__(self, n, wb, payload, metricas, fim, escala, feed=True, seed=0):
+        super().__init__(daemon=True)
+        self.n = n
+        self.wb = wb
+        self.metricas = metricas
+        self.fim = fim
+        self.escala = escala
+        self.rnd = random.Random(seed * 1000 + n)
+        self.snapshot = be.build_resultados_snapshot(payload["resultados_columns"], payload["resultados"])
+        self.feed = be.ResultadosChangeFeed(self.snapshot) if feed else None
+        self.contador = 0
+
+    def esperar(self, segundos_simulados):
+        return self.fim.wait(segundos_simulados / self.escala)
+
+    def medir(self, acao, func):
+        chamadas0, rejeicoes0 = self.wb.thread_calls()
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            func()
+        except Exception as e:
+            erro = "cota" if "429" in str(e) or "Quota" in str(e) else type(e).__name__
+        segundos = (time.perf_counter() - inicio) * self.escala
+        chamadas, rejeicoes = self.wb.thread_calls()
+        self.metricas.registrar(acao, segundos, chamadas - chamadas0, rejeicoes - rejeicoes0, erro)
+        return erro is None
+
+    # --- ações do roteiro (as mesmas chamadas que o app faz) ---
+    def novo_registro(self):
+        self.contador += 1
+        serie = self.rnd.choice(list(be.TUITION))
+        ac_mat, ac_port = self.rnd.randint(0, 12), self.rnd.randint(0, 12)
+        return be.build_resultado_record(f"Operador {self.n} Aluno {self.contador}", self.rnd.choice(be.UNIDADES_LIMPAS),
+                                         serie, ac_mat, ac_port, self.rnd.choice([0.3, 0.5, 0.7]), serie,
+                                         be.get_current_brasilia_datetime(), "Bolsão Simulado")
+
+    def registrar(self):
+        record = self.novo_registro()
+        rownum = be.append_records(be.RESULTADOS_TAB, [record])
+        self.snapshot.append_record(record, rownum)
+
+    def salvar_formulario(self):
+        snap = self.snapshot
+        reg_id = str(snap.columns["REGISTRO_ID"][self.rnd.randrange(snap.sheet_row_count)])
+        cols = be.form_edit_columns(be.header_map(be.RESULTADOS_TAB))
+        base = be.form_row_values(snap.row_for_id(reg_id), cols)
+        mine = dict(base, **{"Observações (Form)": f"Simulação {self.n}.{self.contador}"})
+        resultado = be.save_form_edits(snap, reg_id, base, mine)
+        if resultado["status"] == "saved":
+            snap.update_record(reg_id, resultado["write"])
+        elif resultado["status"] == "conflict":
+            with self.metricas.lock:
+                self.metricas.conflitos += 1
+
+    def sincronizar_fila(self):
+        records = [self.novo_registro() for _ in range(self.rnd.randint(1, FILA_OFFLINE_MAX))]
+        be.append_records(be.RESULTADOS_TAB, records)
+        self.snapshot.append_records(records)
+
+    def verificar_alteracoes(self):
+        result = be.poll_resultados_changes(self.snapshot)
+        novos = [(record, rownum) for record, rownum in result["new"]
+                 if str(record.get("REGISTRO_ID")) not in self.snapshot.id_to_index]
+        self.snapshot.append_records([r for r, _ in novos], [n for _, n in novos])
+        for reg_id, rownum in result["rownums"].items():
+            self.snapshot.set_rownum(reg_id, rownum)
+        self.feed.interval = self.feed.next_interval(bool(result["new"] or result["updated"]))
+
+    def verificar_metadados(self):
+        # Mesma leitura de check_sheet_metadata, mas por desktop: o cache de
+        # metadados do backend é um só para todas as threads.
+        titles = list(be.get_sheet_metadata()["tabs"])
+        self.wb.values_batch_get([be.prefixed_range(t, "1:1") for t in titles],
+                                 params={"valueRenderOption": "FORMATTED_VALUE"})
+
+    def run(self):
+        acoes, pesos = list(ROTEIRO), list(ROTEIRO.values())
+        agora = 0.0
+        proxima_acao = self.rnd.expovariate(1 / PENSAR_SEGUNDOS)
+        proximo_feed = self.rnd.uniform(0, be.CHANGE_FEED_MIN_INTERVAL) if self.feed else float("inf")
+        proximos_metadados = self.rnd.uniform(0, METADATA_CHECK_INTERVAL)
+        inicio = time.monotonic()
+        while not self.fim.is_set():
+            agora = (time.monotonic() - inicio) * self.escala
+            proximo = min(proxima_acao, proximo_feed, proximos_metadados)
+            if proximo > agora:
+                if self.esperar(proximo - agora):
+                    return
+                continue
+            if proximos_metadados <= min(proxima_acao, proximo_feed):
+                self.medir("verificar_metadados", self.verificar_metadados)
+                agora = (time.monotonic() - inicio) * self.escala
+                proximos_metadados = agora + METADATA_CHECK_INTERVAL
+            elif proximo_feed <= proxima_acao:
+                self.medir("verificar_alteracoes", self.verificar_alteracoes)
+                agora = (time.monotonic() - inicio) * self.escala
+                proximo_feed = agora + self.feed.interval
+            else:
+                acao = self.rnd.choices(acoes, pesos)[0]
+                if self.medir(acao, getattr(self, acao)) and self.feed and acao != "salvar_formulario":
+                    self.feed.interval = be.CHANGE_FEED_MIN_INTERVAL  # notify_activity do app
+                agora = (time.monotonic() - inicio) * self.escala
+                proxima_acao = agora + self.rnd.expovariate(1 / PENSAR_SEGUNDOS)
+
+def simular(n_operadores, duracao, escala, args, seed=0):
+    """Roda um nível de carga e devolve o resumo das métricas."""
+    wb = fake_sheets.sample_spreadsheet(n_resultados=args.linhas, seed=seed)
+    be.use_workbook(wb)
+    payload = be.fetch_bootstrap_payload(wb)
+    be.build_bootstrap_data(payload)
+    # A cota e a latência só valem depois da carga inicial
+    wb.latencia = fake_sheets.LatenciaSheets(base_ms=args.latencia, escala=escala, seed=seed)
+    wb.cota = fake_sheets.CotaSheets(args.cota_leitura, args.cota_escrita, escala=escala)
+
+    metricas = Metricas()
+    fim = threading.Event()
+    operadores = [Operador(n, wb, payload, metricas, fim, escala, feed=not args.sem_feed, seed=seed)
+                  for n in range(n_operadores)]
+    # Cada operador verifica os cabeçalhos por conta própria (verificar_metadados)
+    be.METADATA_CHECK_INTERVAL = float("inf")
+    try:
+        for op in operadores:
+            op.start()
+        time.sleep(duracao / escala)
+        fim.set()
+        for op in operadores:
+            op.join()
+    finally:
+        be.METADATA_CHECK_INTERVAL = METADATA_CHECK_INTERVAL
+    resumo = metricas.resumo(duracao)
+    resumo["rejeicoes_cota"] = dict(wb.cota.rejeicoes)
+    return resumo
+
+def imprimir(n, resumo):
+    print(f"\n=== {n} operador(es): {resumo['acoes_por_minuto']:.1f} ação(ões)/min, "
+          f"{resumo['conflitos']} conflito(s), 429: {resumo['rejeicoes_cota']['read']} leitura(s) / "
+          f"{resumo['rejeicoes_cota']['write']} escrita(s)")
+    print(f"{'Ação':<22}{'N':>6}{'Erros':>7}{'Cota':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Chamadas':>10}{'429':>6}")
+    for acao, v in resumo["acoes"].items():
+        print(f"{acao:<22}{v['n']:>6}{v['erros']:>7}{v['erros_cota']:>6}{v['p50']:>9.0f}{v['p95']:>9.0f}"
+              f"{v['p99']:>9.0f}{v['chamadas']:>10.2f}{v['rejeicoes']:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula vários operadores na mesma planilha (cota e latência da API).")
+    parser.add_argument("--operadores", default="1,5,10,20", help="Níveis de carga, separados por vírgula.")
+    parser.add_argument("--duracao", type=float, default=300, help="Segundos simulados por nível.")
+    parser.add_argument("--acelerar", type=float, default=10, help="Fator de aceleração do tempo.")
+    parser.add_argument("--linhas", type=int, default=2000, help="Linhas iniciais em Resultados_Bolsao.")
+    parser.add_argument("--latencia", type=float, default=180, help="Mediana da latência por chamada (ms).")
+    parser.add_argument("--cota-leitura", type=int, default=60, help="Leituras por minuto.")
+    parser.add_argument("--cota-escrita", type=int, default=60, help="Escritas por minuto.")
+    parser.add_argument("--sem-feed", action="store_true", help="Não simula o feed de alterações dos desktops.")
+    args = parser.parse_args()
+
+    try:
+        niveis = [int(n) for n in args.operadores.split(",") if n.strip()]
+    except ValueError:
+        print("Erro: --operadores deve ser uma lista de números (ex: 1,5,10).", file=sys.stderr)
+        return 1
+    try:
+        be.init_backend()
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    print(f"{args.duracao:.0f}s simulados por nível, tempo acelerado {args.acelerar:g}x; "
+          f"cota {args.cota_leitura} leituras e {args.cota_escrita} escritas por minuto.")
+    print("Obs.: os operadores são threads de um só processo e dividem os caches do backend; a verificação "
+          "de cabeçalhos é\nfeita por operador, mas a carga inicial e a autenticação de cada desktop não "
+          "entram na cota nem nas métricas.")
+    for n in niveis:
+        imprimir(n, simular(n, args.duracao, args.acelerar, args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())